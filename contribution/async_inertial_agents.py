@@ -0,0 +1,35 @@
+import asyncio
+from threading import Thread
+
+from gemini.simulator.esmini import run_scenario
+from gemini.actors import AgentConnector, Agent, AsyncSimulationLink, ExecutorActor, SimulationRecorder, UdpSenderXYH
+from gemini.action_logic import InertialMovementLogic
+from gemini.common import TimedVehicleState, VehicleState, Point2d
+from gemini.connector.async_osi_connector import AsyncUdpSender
+
+
+async def live(recorder: SimulationRecorder) -> None:
+    udp_senders = [await AsyncUdpSender.create(port=53901), await AsyncUdpSender.create(port=53902)]
+    real_agent = Agent(
+        action_logic=InertialMovementLogic(
+            TimedVehicleState(0, VehicleState(Point2d(0, 0), Point2d(10, 0), Point2d(0, 3)))),
+        agent_connector=AgentConnector(agent_id=1, osi_channel=UdpSenderXYH(udp_senders[0])))
+    obstacle_agent = Agent(
+        action_logic=InertialMovementLogic(
+            TimedVehicleState(0, VehicleState(Point2d(0, 0), Point2d(2, 2), Point2d(3, 3)))),
+        agent_connector=AgentConnector(agent_id=0, osi_channel=UdpSenderXYH(udp_senders[1])))
+    # the recorder is slow (it plots at the end only, but it could write on disk): it acts in an executor
+    simulation_link = AsyncSimulationLink(actors=(real_agent, obstacle_agent, ExecutorActor(recorder)))
+    try:
+        await simulation_link.live(max_time=10)
+    finally:
+        for udp_sender in udp_senders:
+            udp_sender.close()
+
+
+new_thread = Thread(target=run_scenario, args=('inertial.xosc',))
+new_thread.start()
+
+recorder = SimulationRecorder()
+asyncio.run(live(recorder))
+recorder.get_simulation_trajectory().plot_dynamics()
@@ -1,14 +1,12 @@
 import multiprocessing
 import pickle
 
-import pandas as pd
-
 from external import VariationalGenerator
 from gemini.action_logic import VariationalGeneratorLogic
-from gemini.actors import SimulationLink, SimulationRecorder
+from gemini.actors import SimulationLink, SimulationRecorder, BatchedUdpSenderXYH
 from gemini.dataset import TrajectoryDatabase
-from gemini.resources import get_path_data_file, get_scenario_path
-from gemini.scenario import ScenarioModelGenerator
+from gemini.resources import get_path_data_file
+from gemini.scenario import ScenarioCache, ScenarioModelGenerator
 from gemini.simulator.esmini import run_scenario
 
 # HOW TO INJECT IRL MODEL INTO SIMULATION
@@ -22,17 +20,16 @@ output_size = 5  # 5 (actions in the form of mu_x, mu_y, sigma_x, sigma_y, and 
 generator = VariationalGenerator(input_size, hidden_layers, output_size)
 
 # 2) LOAD THE ORIGINAL DATASET
-tracks = pd.read_csv(get_path_data_file('corrected_tracks.csv'))
-db = TrajectoryDatabase(tracks)
+db = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv'))  # cached (see from_csv)
 target, obstacles = db.get_scenario_objects(trajectory_id=5)
 
 # 3) WRITE THE OPEN SCENARIO FILE BASED ON THE TARGET AND OBSTACLES TRAJECTORIES
 scenario_model_generator = ScenarioModelGenerator(target, obstacles)
-scenario = scenario_model_generator.build_scenario()  # build the parking_lot open scenario
-scenario.write_xml(get_scenario_path('try.xosc'))
+# the file is written only the first time (see ScenarioCache)
+scenario_name = ScenarioCache().get_scenario_name(scenario_model_generator)
 
 # 4) START THE SIMULATION OF THE OPEN SCENARIO FILE CREATED AT STEP 3
-proc = multiprocessing.Process(target=run_scenario, args=('try.xosc',))
+proc = multiprocessing.Process(target=run_scenario, args=(scenario_name,))
 proc.start()
 
 # 5) DEFINE THE ACTORS THAT WILL INTERACT WITH THE SIMULATION
@@ -43,11 +40,12 @@ recorder = SimulationRecorder()
 # - all the vehicle obstacles extracted by the original dataset
 data = dict()
 logic = VariationalGeneratorLogic(generator, 0.05, data)
-agents = scenario_model_generator.get_agent_with_model(model_logic=logic)
+agents = scenario_model_generator.get_agent_with_model(model_logic=logic, batched_udp_sender=BatchedUdpSenderXYH())
 
 # 6) START THE COMMUNICATION WITH THE SIMULATOR TROUGH OSIReceiver and UdpSender.
-simulation = SimulationLink(actors=agents + [recorder])
+simulation = SimulationLink(actors=agents + [recorder], max_workers=8)
 simulation.live(time_step=0.05, max_time=scenario_model_generator.get_time())
+print(*simulation.timings, sep='\n')  # time spent by each actor
 
 # 7) TERMINATE SIMULATION
 proc.terminate()
@@ -68,8 +66,7 @@ with open(get_path_data_file("irl_trajectory.pickle"), "wb") as file:
     trajectory.store_dict(file)
 
 # used in performance_analysis.py
-with open(get_path_data_file("irl_trajectory_object.pickle"), "wb") as file:
-    pickle.dump(trajectory, file)
+trajectory.store_archive(get_path_data_file("irl_trajectory.archive"))
 
 # storage of data (visitor)
 # used in analysis.ipynb
@@ -1,12 +1,9 @@
 import multiprocessing
-import pickle
 
-import pandas as pd
-
-from gemini.actors import SimulationLink, SimulationRecorder
+from gemini.actors import SimulationLink, SimulationRecorder, BatchedUdpSenderXYH
 from gemini.dataset import TrajectoryDatabase
-from gemini.resources import get_path_data_file, get_scenario_path
-from gemini.scenario import ScenarioModelGenerator
+from gemini.resources import get_path_data_file
+from gemini.scenario import ScenarioCache, ScenarioModelGenerator
 from gemini.simulator.esmini import run_scenario
 
 # HOW TO INJECT DATASET TRAJECTORIES INTO SIMULATION
@@ -14,28 +11,28 @@ from gemini.simulator.esmini import run_scenario
 # The gemini.resources functions use these env variables.
 
 # 1) LOAD THE ORIGINAL DATASET
-tracks = pd.read_csv(get_path_data_file('corrected_tracks.csv'))
-db = TrajectoryDatabase(tracks)
+db = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv'))  # cached (see from_csv)
 target, interactions = db.get_scenario_objects(trajectory_id=5)
 
 # 2) WRITE THE OPEN SCENARIO FILE BASED ON THE TARGET AND OBSTACLES TRAJECTORIES
 scenario_model_generator = ScenarioModelGenerator(target, interactions)
-scenario = scenario_model_generator.build_scenario()
-scenario.write_xml(get_scenario_path('try.xosc'))
+# the file is written only the first time (see ScenarioCache)
+scenario_name = ScenarioCache().get_scenario_name(scenario_model_generator)
 
 # 3) START THE SIMULATION OF THE OPEN SCENARIO FILE CREATED AT STEP 3
-proc = multiprocessing.Process(target=run_scenario, args=('try.xosc',))
+proc = multiprocessing.Process(target=run_scenario, args=(scenario_name,))
 proc.start()
 
 # 4) DEFINE THE ACTORS THAT WILL INTERACT WITH THE SIMULATION
 # SimulationRecorder is an actor that save the vehicle states during the simulation
 recorder = SimulationRecorder()
 # The following actors are mimic the original dataset
-actors = scenario_model_generator.get_agents()
+actors = scenario_model_generator.get_agents(batched_udp_sender=BatchedUdpSenderXYH())
 
 # 5) START THE COMMUNICATION WITH THE SIMULATOR TROUGH OSIReceiver and UdpSender.
-simulation = SimulationLink(actors=actors + [recorder])
+simulation = SimulationLink(actors=actors + [recorder], max_workers=8)
 simulation.live(time_step=0.05, max_time=scenario_model_generator.get_time())
+print(*simulation.timings, sep='\n')  # time spent by each actor
 
 # 6) TERMINATE SIMULATION
 proc.terminate()
@@ -48,6 +45,5 @@ with open(get_path_data_file("dataset_trajectory.pickle"), "wb") as file:
     trajectory.store_dict(file)
 
 # used in performance_analysis.py
-with open(get_path_data_file("dataset_trajectory_object.pickle"), "wb") as file:
-    pickle.dump(trajectory, file)
+trajectory.store_archive(get_path_data_file("dataset_trajectory.archive"))
 
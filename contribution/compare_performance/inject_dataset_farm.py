@@ -0,0 +1,22 @@
+from gemini.dataset import TrajectoryDatabase
+from gemini.resources import get_path_data_file
+from gemini.scenario_farm import ScenarioFarm
+
+# HOW TO INJECT MANY DATASET TRAJECTORIES INTO SIMULATION, ONE SIMULATOR FOR EACH CPU
+# TBN: please configure the env variables in the .env file as reported in the README.md file.
+# The gemini.resources functions use these env variables.
+
+if __name__ == '__main__':
+    # 1) LOAD THE ORIGINAL DATASET
+    db = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv'))  # cached (see from_csv)
+    trajectory_ids = db.get_trajectory_ids()
+
+    # 2) SIMULATE ALL THE TRAJECTORIES: each process of the farm writes its own open scenario file, runs esmini in
+    # lockstep with the actors (which mimic the original dataset) and records the vehicle states
+    farm = ScenarioFarm(db)
+    trajectories = farm.run(trajectory_ids)
+
+    # 3) STORE THE TRAJECTORIES
+    # used in performance_analysis.py
+    for trajectory_id, trajectory in trajectories.items():
+        trajectory.store_archive(get_path_data_file(f"dataset_trajectory_{trajectory_id}.archive"))
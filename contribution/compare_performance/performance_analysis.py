@@ -1,17 +1,15 @@
-import pickle
-
 import numpy as np
 
 from gemini.performance_analysis import PerformanceAnalysis
 from gemini.resources import get_path_data_file
+from gemini.trajectory_storage import TrajectoryArchive
 
 # 1) LOAD THE MODELED TRAJECTORIES
-with open(get_path_data_file("irl_trajectory_object.pickle"), "rb") as file:
-    irl_trajectory = pickle.load(file)
+# the archive is memory mapped: only the trajectories used in the analysis are read from disk
+irl_trajectory = TrajectoryArchive(get_path_data_file("irl_trajectory.archive"))
 
 # 2) LOAD THE ORIGINAL TRAJECTORIES
-with open(get_path_data_file("dataset_trajectory_object.pickle"), "rb") as file:
-    dataset_trajectory = pickle.load(file)
+dataset_trajectory = TrajectoryArchive(get_path_data_file("dataset_trajectory.archive"))
 
 # 3) INSTANTIATE THE PerformanceAnalysis OBJECT WHICH IS IN CHARGE OF EVALUATE / SHOW DIFFERENCES BETWEEN MODELED
 # AND REAL TRAJECTORIES
@@ -1,7 +1,5 @@
 import multiprocessing
 
-import pandas as pd
-
 from external import VariationalGenerator
 from gemini.action_logic import VariationalGeneratorLogic
 from gemini.actors import SimulationLink, SimulationRecorder
@@ -15,8 +13,7 @@ hidden_layers = [18, 18, 16, 16, 14, 14, 12, 12, 12]
 output_size = 5  # 5 (actions in the form of mu_x, mu_y, sigma_x, sigma_y, and ρ (correlation factor)
 generator = VariationalGenerator(input_size, hidden_layers, output_size)
 
-tracks = pd.read_csv(get_path_data_file('corrected_tracks.csv'))
-db = TrajectoryDatabase(tracks)
+db = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv'))  # cached (see from_csv)
 target, interactions = db.get_scenario_objects(trajectory_id=6)
 
 scenario_model_generator = ScenarioModelGenerator(target, interactions)
@@ -1,7 +1,5 @@
 import multiprocessing
 
-import pandas as pd
-
 from external import VariationalGeneratorEncoded
 from gemini.action_logic import VariationalGeneratorLogic
 from gemini.actors import SimulationLink, SimulationRecorder
@@ -17,8 +15,7 @@ generator = VariationalGeneratorEncoded(input_size, hidden_layers, output_size,
                                         get_path_data_file("variational_generator/variational_generator"),
                                         get_path_data_file("end_generator2.pt"))
 
-tracks = pd.read_csv(get_path_data_file('corrected_tracks.csv'))
-db = TrajectoryDatabase(tracks)
+db = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv'))  # cached (see from_csv)
 target, interactions = db.get_scenario_objects(trajectory_id=6)
 
 scenario_model_generator = ScenarioModelGenerator(target, interactions)
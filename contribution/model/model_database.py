@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 import torch
 
 from external import VariationalGenerator
@@ -8,15 +7,16 @@ from gemini.resources import get_path_data_file
 
 if __name__ == '__main__':
     target_id = 5
-    tracks = pd.read_csv(get_path_data_file('corrected_tracks.csv'))
-    db = TrajectoryDatabase(tracks)
-    trajectory_states = db.get_generator(target_id, 2)
+    db = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv'))  # cached (see from_csv)
+    trajectory_states = db.get_state_matrix(target_id, 2)
     input_size = 18
     hidden_layers = [18, 18, 16, 16, 14, 14, 12, 12, 12]
     output_size = 5
     G = VariationalGenerator(input_size, hidden_layers, output_size)
-    sampling_state = [to_sampling_time_state(state, 0.05) for state in trajectory_states]
+    sampling_state = to_sampling_time_state(trajectory_states, 0.05)
     rollout = roll_out(G, sampling_state)
+    # many targets can be rolled out with a single forward pass:
+    # roll_out_batch(G, [to_sampling_time_state(db.get_state_matrix(i, 2), 0.05) for i in target_ids])
     predicted_trajectory = np.array(rollout)
 
     target, obstacles = db.get_trajectories(target_id)
@@ -5,7 +5,7 @@ import pandas as pd
 import torch
 
 from external.IRL.Auxiliary_functions import VariationalGenerator
-from gemini.dataset import PlotFiskhamnsmotet
+from gemini.dataset import PlotFiskhamnsmotet, TrajectoryDatabase
 from gemini.resources import get_path_data_file
 
 
@@ -207,7 +207,8 @@ def flatten(states, nagents):
     return flatobs.reshape(-1, 6 * nagents)
 
 
-tracks = pd.read_csv(get_path_data_file('corrected_tracks.csv'))
+# same rows of corrected_tracks.csv, loaded from the cache of TrajectoryDatabase.from_csv
+tracks = TrajectoryDatabase.from_csv(get_path_data_file('corrected_tracks.csv')).get_source_tracks()
 with open(get_path_data_file('uc2.pickle'), 'rb') as handle:
     uc2 = pickle.load(handle)
 
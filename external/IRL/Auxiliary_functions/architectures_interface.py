@@ -1,6 +1,11 @@
+import queue
+import struct
 import subprocess
+import threading
+import time
 from typing import List, Tuple
 
+import numpy as np
 import torch
 from torch import Tensor
 from torch.distributions.multivariate_normal import MultivariateNormal
@@ -23,8 +28,117 @@ class VariationalGeneratorEncoded(VariationalGenerator):
         self.weight_path = weight_path
 
     def forward(self, x: torch.Tensor) -> Tuple[Tensor, MultivariateNormal]:
-        data = x.tolist()[0]
-        executable_format = ",".join([str(x) for x in data])
-        output = subprocess.run([self.executable_path, self.weight_path, executable_format], capture_output=True)
-        result = [float(v) for v in output.stdout.decode().strip().split(",")]
-        return torch.Tensor([result]), None
+        # the executable evaluates a single state: it is run for each row of the batch
+        results = []
+        for data in x.tolist():
+            executable_format = ",".join([str(value) for value in data])
+            output = subprocess.run([self.executable_path, self.weight_path, executable_format], capture_output=True)
+            results.append([float(v) for v in output.stdout.decode().strip().split(",")])
+        return torch.Tensor(results), None
+
+
+class EncodedModelWorker:
+    """
+    Long-lived process running the encoded model, so that the weights are loaded only once.
+    The process is started as [executable_path, weight_path, *server_arguments] and it exchanges binary frames
+    through its stdin/stdout:
+    - request: header (number of states, state size) followed by the states as little endian float64 (row major)
+    - response: header (number of actions, action size) followed by the actions as little endian float64
+    The header is two little endian unsigned int (see HEADER). If the process dies, or it does not answer within
+    timeout seconds, it is restarted.
+    """
+    HEADER = struct.Struct('<II')
+
+    def __init__(self, executable_path, weight_path, server_arguments=('--serve',), max_restarts: int = 3,
+                 timeout: float = 10.0):
+        self.command = [executable_path, weight_path, *server_arguments]
+        self.max_restarts = max_restarts
+        self.timeout = timeout
+        self.process = None
+        self.starts = 0
+        self.chunks = None
+        self.pending = bytearray()
+
+    def start(self):
+        # buffered pipes: write sends the whole request, and read1 returns the output as soon as it is available
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        # select does not work on pipes on Windows: a thread reads the output, so that __read can wait with a timeout
+        self.chunks = queue.Queue()
+        self.pending = bytearray()
+        threading.Thread(target=self.__read_output, args=(self.process.stdout, self.chunks), daemon=True).start()
+        self.starts += 1
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def evaluate(self, states: np.ndarray) -> np.ndarray:
+        states = np.ascontiguousarray(states, dtype='<f8').reshape(len(states), -1)
+        request = self.HEADER.pack(*states.shape) + states.tobytes()
+        for _ in range(self.max_restarts + 1):
+            if not self.is_alive():
+                self.close()
+                self.start()
+            try:
+                self.process.stdin.write(request)
+                self.process.stdin.flush()
+                deadline = time.monotonic() + self.timeout
+                number_of_actions, action_size = self.HEADER.unpack(self.__read(self.HEADER.size, deadline))
+                payload = self.__read(number_of_actions * action_size * 8, deadline)
+                return np.frombuffer(payload, dtype='<f8').reshape(number_of_actions, action_size).copy()
+            except (BrokenPipeError, EOFError, TimeoutError):
+                self.close()
+        raise RuntimeError(f"{self.command[0]} stopped working {self.max_restarts + 1} times")
+
+    @staticmethod
+    def __read_output(stdout, chunks: queue.Queue):
+        """
+        Put the output of the process in chunks, followed by an empty chunk when the output is closed.
+        """
+        try:
+            chunk = stdout.read1()
+            while chunk:
+                chunks.put(chunk)
+                chunk = stdout.read1()
+        except (OSError, ValueError):  # output closed by close
+            pass
+        chunks.put(b'')
+
+    def __read(self, size: int, deadline: float) -> bytes:
+        while len(self.pending) < size:
+            try:
+                chunk = self.chunks.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"the worker process did not answer within {self.timeout} seconds")
+            if not chunk:
+                raise EOFError("the worker process closed its output")
+            self.pending += chunk
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        return data
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process.stdin.close()
+            self.process.stdout.close()
+            self.process = None
+
+
+class PersistentVariationalGeneratorEncoded(VariationalGeneratorEncoded):
+    """
+    VariationalGeneratorEncoded which keeps the executable running (see EncodedModelWorker) and evaluates all the
+    states of the batch with a single request. The executable must support the EncodedModelWorker protocol.
+    """
+
+    def __init__(self, input_size: int, hidden_layers: List[int], output_size: int, executable_path, weight_path,
+                 server_arguments=('--serve',), timeout: float = 10.0):
+        super().__init__(input_size, hidden_layers, output_size, executable_path, weight_path)
+        self.worker = EncodedModelWorker(executable_path, weight_path, server_arguments, timeout=timeout)
+
+    def forward(self, x: torch.Tensor) -> Tuple[Tensor, MultivariateNormal]:
+        result = self.worker.evaluate(x.detach().numpy())
+        return torch.Tensor(result), None
+
+    def close(self):
+        self.worker.close()
@@ -2,19 +2,25 @@
 from .IRL.Auxiliary_functions.architectures_interface import (
     VariationalGenerator,
     VariationalGeneratorEncoded,
+    PersistentVariationalGeneratorEncoded,
 )
 
 
 from .udp_driver.udp_osi_common import (
     OSIReceiver,
     UdpSender,
+    FragmentAssembler,
+    decode_ground_truth,
     input_modes,
 )
 
 __all__ = [
     "VariationalGeneratorEncoded",
     "VariationalGenerator",
+    "PersistentVariationalGeneratorEncoded",
     "OSIReceiver",
     "UdpSender",
+    "FragmentAssembler",
+    "decode_ground_truth",
     "input_modes",
 ]
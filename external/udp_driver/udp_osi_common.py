@@ -1,5 +1,7 @@
 # The original file is located here: https://github.com/esmini/esmini/blob/v2.23.4/scripts/udp_driver/udp_osi_common.py
 # I modified line 89 where a new GroundTruth object is created.
+# OSIReceiver can also decode the messages lazily (see decoding_modes and LazyGroundTruth) and reassembles the
+# messages in a reusable buffer (see FragmentAssembler).
 
 import struct
 from socket import *
@@ -14,6 +16,157 @@ input_modes = {
 
 base_port = 53995
 
+# full: parse every message as soon as it is received
+# lazy: parse only the timestamp, the rest of the message is parsed at the first access to another field
+# moving_objects: as lazy, but only the timestamp and the moving objects are parsed
+decoding_modes = ('full', 'lazy', 'moving_objects')
+
+GROUND_TRUTH_FIELDS = osi3.osi_groundtruth_pb2.GroundTruth.DESCRIPTOR.fields_by_name
+
+
+def read_varint(buffer, position):
+    """
+    :return: the decoded unsigned varint and the position of the following byte
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def iterate_fields(buffer):
+    """
+    Walk the top level fields of a protobuf message without decoding them
+    :return: a generator of (field number, wire type, start, value start, end) where buffer[start:end] is the
+    encoded field and buffer[value_start:end] its payload (for a length delimited field, without the length)
+    """
+    position = 0
+    while position < len(buffer):
+        start = position
+        key, position = read_varint(buffer, position)
+        field_number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:  # varint
+            value_start = position
+            _, position = read_varint(buffer, position)
+        elif wire_type == 1:  # 64 bit
+            value_start = position
+            position += 8
+        elif wire_type == 2:  # length delimited
+            length, value_start = read_varint(buffer, position)
+            position = value_start + length
+        elif wire_type == 5:  # 32 bit
+            value_start = position
+            position += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        if position > len(buffer):
+            raise ValueError("Truncated protobuf message")
+        yield field_number, wire_type, start, value_start, position
+
+
+class Timestamp:
+    def __init__(self, seconds=0, nanos=0):
+        self.seconds = seconds
+        self.nanos = nanos
+
+
+def decode_timestamp(buffer):
+    """
+    Read osi3.GroundTruth.timestamp directly from the encoded message.
+    Protobuf serializers write the fields ordered by number, so only the first few bytes are scanned
+    """
+    timestamp = Timestamp()
+    timestamp_number = GROUND_TRUTH_FIELDS['timestamp'].number
+    for field_number, wire_type, _, value_start, end in iterate_fields(buffer):
+        if field_number == timestamp_number and wire_type == 2:
+            timestamp_buffer = buffer[value_start:end]
+            # osi3.Timestamp: seconds (int64) = 1, nanos (uint32) = 2
+            for timestamp_field, timestamp_wire_type, _, timestamp_value_start, _ in iterate_fields(timestamp_buffer):
+                if timestamp_wire_type == 0:
+                    value, _ = read_varint(timestamp_buffer, timestamp_value_start)
+                    if timestamp_field == 1:
+                        timestamp.seconds = value - (1 << 64) if value >= 1 << 63 else value
+                    elif timestamp_field == 2:
+                        timestamp.nanos = value
+            break
+        if field_number > timestamp_number:
+            break
+    return timestamp
+
+
+def filter_fields(buffer, field_numbers):
+    """
+    :return: the encoded message containing only the top level fields in field_numbers. As in decode_timestamp,
+    the scan stops after the greatest requested field number
+    """
+    view = memoryview(buffer)
+    last_field_number = max(field_numbers)
+    fields = []
+    for field_number, _, start, _, end in iterate_fields(buffer):
+        if field_number > last_field_number:
+            break
+        if field_number in field_numbers:
+            fields.append(view[start:end])
+    return b''.join(fields)
+
+
+class LazyGroundTruth():
+    """
+    osi3.GroundTruth which is parsed at the first access to a field other than the timestamp.
+    If fields is given, only those fields (by name) are parsed
+    """
+
+    def __init__(self, message, fields=None):
+        self.message = message
+        self.fields = fields
+        self.ground_truth = None
+        self.__timestamp = None
+
+    @property
+    def timestamp(self):
+        if self.ground_truth is not None:
+            return self.ground_truth.timestamp
+        if self.__timestamp is None:
+            self.__timestamp = decode_timestamp(self.message)
+        return self.__timestamp
+
+    def parse(self):
+        if self.ground_truth is None:
+            message = self.message
+            if self.fields is not None:
+                message = filter_fields(message, {GROUND_TRUTH_FIELDS[name].number for name in self.fields})
+            ground_truth = osi3.osi_groundtruth_pb2.GroundTruth()
+            ground_truth.ParseFromString(message)
+            # assigned only once parsed: other threads never see a partially parsed message
+            self.ground_truth = ground_truth
+        return self.ground_truth
+
+    def __getattr__(self, name):
+        # called only for the attributes which are not defined by LazyGroundTruth
+        if name.startswith('_') or name in ('message', 'fields', 'ground_truth'):
+            raise AttributeError(name)
+        return getattr(self.parse(), name)
+
+
+def decode_ground_truth(message, decoding='full'):
+    """
+    :param message: a complete osi3.GroundTruth message (e.g. returned by FragmentAssembler.add)
+    :param decoding: one of decoding_modes
+    """
+    # a lazy message needs its own copy, since the buffer of FragmentAssembler is reused for the next one
+    if decoding == 'lazy':
+        return LazyGroundTruth(bytes(message))
+    if decoding == 'moving_objects':
+        return LazyGroundTruth(bytes(message), ('timestamp', 'moving_object'))
+    ground_truth = osi3.osi_groundtruth_pb2.GroundTruth()
+    ground_truth.ParseFromString(message)
+    return ground_truth
+
 
 class UdpSender():
     def __init__(self, ip='127.0.0.1', port=base_port):
@@ -43,52 +196,139 @@ class UdpReceiver():
         message = bytesAddressPair[0]
         return message
 
+    def receive_into(self, buffer, block=True):
+        """
+        :param block: if False, return None when there is no datagram to receive
+        :return: the number of bytes written in buffer
+        """
+        if block:
+            return self.sock.recv_into(buffer, self.buffersize)
+        # MSG_DONTWAIT is not available on Windows: make the socket non-blocking and restore its timeout
+        previous_timeout = self.sock.gettimeout()
+        self.sock.settimeout(0)
+        try:
+            return self.sock.recv_into(buffer, self.buffersize)
+        except BlockingIOError:
+            return None
+        finally:
+            self.sock.settimeout(previous_timeout)
+
     def close(self):
         self.sock.close()
 
 
+class FragmentAssembler():
+    """
+    Reassemble the messages which esmini splits in multiple datagrams. Each datagram starts with a header
+    (see FRAGMENT_HEADER): a counter, which is the sequence number 1, 2, 3... of the part (negative for the last
+    part), and the size of the part.
+    The parts are copied in a buffer which is reused for all the messages.
+    """
+    FRAGMENT_HEADER = struct.Struct('iI')
+
+    def __init__(self, capacity=65536):
+        self.buffer = bytearray(capacity)
+        self.size = 0
+        self.next_index = 1
+        self.out_of_sync_resets = 0
+        self.dropped_fragments = 0
+
+    def add(self, datagram):
+        """
+        :param datagram: a bytes-like object containing a single datagram
+        :return: a memoryview of the complete message, which is valid until the next call of add, or None if the
+        message is not complete yet
+        """
+        header_size = self.FRAGMENT_HEADER.size
+        if len(datagram) < header_size:
+            print('Error: Unexpected invalid lengths')
+            self.__reset(1)
+            return None
+        counter, size = self.FRAGMENT_HEADER.unpack_from(datagram)
+        if size != len(datagram) - header_size:
+            print('Error: Unexpected invalid lengths')
+            self.__reset(1)
+            return None
+
+        if counter == 1 and self.next_index != 1:  # new message before the end of the previous one
+            self.__reset(0)
+
+        # Compose complete message
+        if counter == 1 or abs(counter) == self.next_index:
+            self.__append(memoryview(datagram)[header_size:])
+            self.next_index += 1
+            if counter < 0:  # negative counter number indicates end of message
+                message_size = self.size
+                self.size = 0
+                self.next_index = 1
+                return memoryview(self.buffer)[:message_size]
+        else:
+            self.__reset(1)  # out of sync, reset
+        return None
+
+    def __append(self, fragment):
+        end = self.size + len(fragment)
+        if end > len(self.buffer):
+            # a new buffer, since a view of the previous message could be still in use
+            buffer = bytearray(max(end, 2 * len(self.buffer)))
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size:end] = fragment
+        self.size = end
+
+    def __reset(self, number_of_invalid_fragments):
+        # the parts already received and the invalid ones are dropped
+        self.dropped_fragments += self.next_index - 1 + number_of_invalid_fragments
+        self.out_of_sync_resets += 1
+        self.size = 0
+        self.next_index = 1
+
+
 class OSIReceiver():
-    def __init__(self):
+    def __init__(self, decoding='full'):
+        if decoding not in decoding_modes:
+            raise ValueError(f"Unknown decoding mode {decoding}, expected one of {decoding_modes}")
+        self.decoding = decoding
         self.udp_receiver = UdpReceiver(port=48198)
+        self.fragment_assembler = FragmentAssembler()
+        self.datagram = bytearray(self.udp_receiver.buffersize)
+        self.datagram_view = memoryview(self.datagram)
+
+    @property
+    def out_of_sync_resets(self):
+        return self.fragment_assembler.out_of_sync_resets
+
+    @property
+    def dropped_fragments(self):
+        return self.fragment_assembler.dropped_fragments
 
     def receive(self):
-        done = False
-        next_index = 1
-        complete_msg = b''
-
-        # Large nessages might be split in multiple parts
-        # esmini will add a counter to indicate sequence number 0, 1, 2...
-        # negative counter means last part and message is now complete
-        while not done:
-            # receive header
-            msg = self.udp_receiver.receive()
-
-            # extract message parts
-            header_size = 4 + 4  # counter(int) + size(unsigned int)
-            counter, size, frame = struct.unpack('iI{}s'.format(len(msg) - header_size), msg)
-            # print('counter {} size {}'.format(counter, size))
-
-            if not (len(frame) == size == len(msg) - 8):
-                print('Error: Unexpected invalid lengths')
-                return
-
-            if counter == 1:  # new message
-                complete_msg = b''
-                next_index = 1
-
-            # Compose complete message
-            if counter == 1 or abs(counter) == next_index:
-                complete_msg += frame
-                next_index += 1
-                if counter < 0:  # negative counter number indicates end of message
-                    done = True
-            else:
-                next_index = 1  # out of sync, reset
+        complete_msg = None
+        while complete_msg is None:
+            size = self.udp_receiver.receive_into(self.datagram)
+            complete_msg = self.fragment_assembler.add(self.datagram_view[:size])
 
         # Parse and return message
-        ground_truth = osi3.osi_groundtruth_pb2.GroundTruth()
-        ground_truth.ParseFromString(complete_msg)
-        return ground_truth
+        return decode_ground_truth(complete_msg, self.decoding)
+
+    def receive_latest(self):
+        """
+        Wait for a complete message, then receive, without blocking, the datagrams which are already available.
+        Only the newest complete message is parsed.
+        :return: the newest message and the number of complete messages which have been skipped
+        """
+        latest_msg = None
+        skipped_messages = 0
+        while True:
+            size = self.udp_receiver.receive_into(self.datagram, block=latest_msg is None)
+            if size is None:
+                break
+            complete_msg = self.fragment_assembler.add(self.datagram_view[:size])
+            if complete_msg is not None:
+                if latest_msg is not None:
+                    skipped_messages += 1
+                latest_msg = bytes(complete_msg)  # the buffer of the assembler is reused for the next message
+        return decode_ground_truth(latest_msg, self.decoding), skipped_messages
 
     def close(self):
         self.udp_receiver.close()
@@ -1,4 +1,5 @@
 import math
+import threading
 from typing import List
 
 import torch
@@ -76,28 +77,29 @@ class VariationalGeneratorLogic(ActionLogic):
             current_time = ground_truth_info.get_simulation_time()
             self.current_sampling_time = current_time - self.last_time
             self.last_time = current_time
-        agent_vehicle = ground_truth_info.get_vehicle_state(agent_id)
-        # evaluate the two nearest vehicles within 200mt
-        near_vehicles = NearVehicles(ground_truth_info).get_vehicles_near_to(agent_vehicle, 2)
-        near_vehicles = [near_vehicle for near_vehicle in near_vehicles if
-                         agent_vehicle.position_distance(near_vehicle) < 200]
-        # generate the state which is then injected into the IRL model.
-        state = self.generate_agent_state(agent_vehicle, near_vehicles)
-        self.visitor.setdefault('state', []).append(self.__to_state(state))
+        state = self.perceive(ground_truth_info, agent_id)
+        self.visitor.setdefault('state', []).append(self.to_state(state))
         # IRL evaluation
         with torch.no_grad():
-            torch_state = self.__to_torch_state(state)
+            torch_state = torch.Tensor(self.to_model_state(state, self.sampling_time)).reshape(1, -1)
             action, _ = self.variational_generator(torch_state)
         delta_position = action.tolist()[0]
         self.visitor.setdefault('action', []).append(delta_position)
         self.visitor.setdefault('torch_state', []).append(torch_state.numpy()[0])
         self.visitor.setdefault('time', []).append(ground_truth_info.get_simulation_time())
         self.visitor.setdefault('id', []).append([state[0].vehicle_id, state[1].vehicle_id, ])
-        delta_position = Point2d(delta_position[0], delta_position[1])
-        new_velocity = 1 / self.sampling_time * delta_position
-        new_acceleration = Point2d(0, 0)  # we are saying to the simulator that this agent moves at constant speed.
-        return VehicleState(agent_vehicle.position, new_velocity, new_acceleration,
-                            math.atan2(delta_position.y, delta_position.x))
+        return self.to_vehicle_state(state[-1], delta_position, self.sampling_time)
+
+    @staticmethod
+    def perceive(ground_truth_info: GroundTruthInfo, agent_id: int) -> List[VehicleState]:
+        """
+        :return: the states of the two nearest vehicles (within 200mt) and of the agent (see generate_agent_state)
+        """
+        agent_vehicle = ground_truth_info.get_vehicle_state(agent_id)
+        # evaluate the two nearest vehicles within 200mt
+        near_vehicles = NearVehicles(ground_truth_info).get_vehicles_near_to(agent_vehicle, 2, max_distance=200)
+        # generate the state which is then injected into the IRL model.
+        return VariationalGeneratorLogic.generate_agent_state(agent_vehicle, near_vehicles)
 
     @staticmethod
     def generate_agent_state(agent_vehicle, near_vehicles):
@@ -109,24 +111,34 @@ class VariationalGeneratorLogic(ActionLogic):
             state = [near_vehicles[0], near_vehicles[1], agent_vehicle]
         return state
 
-    def __to_torch_state(self, vehicles: List[VehicleState]) -> torch.Tensor:
+    @staticmethod
+    def to_model_state(vehicles: List[VehicleState], sampling_time: float) -> List[float]:
         state = []
         for vehicle in vehicles:
             state.append(vehicle.position.x)
             state.append(vehicle.position.y)
-            state.append(vehicle.velocity.x * self.sampling_time)
-            state.append(vehicle.velocity.y * self.sampling_time)
+            state.append(vehicle.velocity.x * sampling_time)
+            state.append(vehicle.velocity.y * sampling_time)
             # [REF2] if we give to the irl model the real vehicle acceleration we will see the ziz-zag movement
-            state.append(vehicle.acceleration.x * self.sampling_time)  # is it right?
-            state.append(vehicle.acceleration.y * self.sampling_time)  # is it right?
+            state.append(vehicle.acceleration.x * sampling_time)  # is it right?
+            state.append(vehicle.acceleration.y * sampling_time)  # is it right?
             # [REF2] if we "say" to the irl model that all the agents have zero acceleration there is no zig-zag
             # movement. These two options are mutually exclusive
             # state.append(0)
             # state.append(0)
-        return torch.Tensor(state).reshape(1, -1)
+        return state
 
     @staticmethod
-    def __to_state(vehicles: List[VehicleState]):
+    def to_vehicle_state(agent_vehicle: VehicleState, delta_position: List[float],
+                         sampling_time: float) -> VehicleState:
+        delta_position = Point2d(delta_position[0], delta_position[1])
+        new_velocity = 1 / sampling_time * delta_position
+        new_acceleration = Point2d(0, 0)  # we are saying to the simulator that this agent moves at constant speed.
+        return VehicleState(agent_vehicle.position, new_velocity, new_acceleration,
+                            math.atan2(delta_position.y, delta_position.x))
+
+    @staticmethod
+    def to_state(vehicles: List[VehicleState]):
         state = []
         for vehicle in vehicles:
             state.append(vehicle.position.x)
@@ -138,6 +150,73 @@ class VariationalGeneratorLogic(ActionLogic):
         return state
 
 
+class VariationalGeneratorCoordinator:
+    """
+    Evaluate the variational generator for many agents with a single forward pass for each GroundTruthInfo.
+    Each agent uses the logic returned by get_logic: the first agent acting on a new GroundTruthInfo triggers the
+    evaluation of the actions of all the registered agents, the others get the action already evaluated.
+    Agents can act from different threads (see SimulationLink max_workers): they wait for the evaluation in progress,
+    and an agent late on an older GroundTruthInfo does not replace the actions of the current one.
+    """
+
+    def __init__(self, variational_generator: VariationalGenerator, sampling_time: float,
+                 visitor: dict = None) -> None:
+        self.variational_generator = variational_generator
+        self.variational_generator.eval()
+        self.sampling_time = sampling_time
+        self.visitor = visitor if visitor is not None else dict()
+        self.agent_ids = []
+        self.frame = (None, dict())  # current GroundTruthInfo and its actions, always replaced together
+        self.lock = threading.Lock()
+
+    def get_logic(self, agent_id: int) -> ActionLogic:
+        self.agent_ids.append(agent_id)
+        return SharedVariationalGeneratorLogic(self)
+
+    def get_action(self, ground_truth_info: GroundTruthInfo, agent_id: int) -> VehicleState:
+        with self.lock:
+            current_ground_truth_info, actions = self.frame
+            if ground_truth_info is not current_ground_truth_info:
+                actions = self.__evaluate(ground_truth_info)
+                if current_ground_truth_info is None or \
+                        ground_truth_info.get_simulation_time() >= current_ground_truth_info.get_simulation_time():
+                    self.frame = (ground_truth_info, actions)
+        return actions.get(agent_id)
+
+    def __evaluate(self, ground_truth_info: GroundTruthInfo) -> dict:
+        states = [VariationalGeneratorLogic.perceive(ground_truth_info, agent_id) for agent_id in self.agent_ids]
+        if not states:
+            return dict()
+        with torch.no_grad():
+            torch_states = torch.Tensor(
+                [VariationalGeneratorLogic.to_model_state(state, self.sampling_time) for state in states])
+            actions, _ = self.variational_generator(torch_states)
+        delta_positions = actions.tolist()
+        if len(delta_positions) != len(states):
+            raise ValueError(f"the generator returned {len(delta_positions)} actions for {len(states)} agents: it "
+                             f"must evaluate all the states of a batch")
+        # one entry for each frame, with the values of all the agents (see VariationalGeneratorLogic.act)
+        self.visitor.setdefault('state', []).append([VariationalGeneratorLogic.to_state(state) for state in states])
+        self.visitor.setdefault('time', []).append(ground_truth_info.get_simulation_time())
+        self.visitor.setdefault('torch_state', []).append(torch_states.numpy())
+        self.visitor.setdefault('action', []).append(delta_positions)
+        self.visitor.setdefault('id', []).append([[state[0].vehicle_id, state[1].vehicle_id] for state in states])
+        return {agent_id: VariationalGeneratorLogic.to_vehicle_state(state[-1], delta_position, self.sampling_time)
+                for agent_id, state, delta_position in zip(self.agent_ids, states, delta_positions)}
+
+
+class SharedVariationalGeneratorLogic(ActionLogic):
+    """
+    Logic of an agent driven by a VariationalGeneratorCoordinator (see VariationalGeneratorCoordinator.get_logic)
+    """
+
+    def __init__(self, coordinator: VariationalGeneratorCoordinator) -> None:
+        self.coordinator = coordinator
+
+    def act(self, ground_truth_info: GroundTruthInfo, agent_id: int) -> VehicleState:
+        return self.coordinator.get_action(ground_truth_info, agent_id)
+
+
 class InertialMovementLogic(ActionLogic):
 
     def __init__(self, initial_state: TimedVehicleState) -> None:
@@ -1,11 +1,32 @@
+import asyncio
+import concurrent.futures
+import inspect
 import struct
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import Enum
+from time import perf_counter
 from typing import Tuple
 
 from external import OSIReceiver, UdpSender, input_modes
 from gemini.action_logic import ActionLogic
 from gemini.common import VehicleState
 from gemini.connector.osi_connector import TimedOSIReceiver, GroundTruthInfo
+from gemini.connector.udp_sender import MultiUdpSender
 from gemini.simulation import SimulationTrajectory
+from gemini.trajectory_storage import TrajectoryStreamWriter, read_trajectory_stream
+
+
+# version, input mode, object ID, frame nr, x, y, h, speed, steering angle, dead reckoning
+XYH_MESSAGE = struct.Struct('iiiidddddB')
+
+
+def get_xyh_values(vehicle_id: int, vehicle_state: VehicleState) -> tuple:
+    """
+    :return: the values of the stateXYH message (see XYH_MESSAGE) for vehicle_state
+    """
+    return (1, input_modes['stateXYH'], vehicle_id, 0, vehicle_state.position.x, vehicle_state.position.y,
+            vehicle_state.heading, vehicle_state.speed(), 0.0, 1)
 
 
 class UdpSenderXYH:
@@ -14,21 +35,7 @@ class UdpSenderXYH:
         self.udp_sender = udp_sender
 
     def send_position_state(self, vehicle_id: int, vehicle_state: VehicleState) -> None:
-        self.udp_sender.send(
-            struct.pack(
-                'iiiidddddB',
-                1,  # version
-                input_modes['stateXYH'],
-                vehicle_id,  # object ID
-                0,  # frame nr
-                vehicle_state.position.x,  # x
-                vehicle_state.position.y,  # y
-                vehicle_state.heading,  # h
-                vehicle_state.speed(),  # speed
-                0.0,  # steering angle
-                1,  # dead reckoning
-            )
-        )
+        self.udp_sender.send(XYH_MESSAGE.pack(*get_xyh_values(vehicle_id, vehicle_state)))
 
 
 class AgentConnector:
@@ -46,13 +53,44 @@ class AgentConnector:
 
 class Actor:
     def act(self, ground_truth_info: GroundTruthInfo) -> None:
+        """
+        It can also be a coroutine (see AsyncSimulationLink)
+        """
+        pass
+
+    def reuse_last_action(self, ground_truth_info: GroundTruthInfo) -> None:
+        """
+        Called instead of act when the actor has missed its deadline (see DeadlinePolicy.REUSE)
+        """
+        pass
+
+    def end_frame(self) -> None:
+        """
+        Called after all the actors have acted on a frame
+        """
+        pass
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Called when the simulation link stops, after the last frame
+        """
         pass
 
 
+class DeadlinePolicy(Enum):
+    """
+    What AsyncSimulationLink does with an actor which has not acted on a frame within the deadline
+    """
+    DROP = 'drop'  # go on without the actor, which skips the frames received while it is still acting
+    REUSE = 'reuse'  # as DROP, but the actor repeats its last action (see Actor.reuse_last_action)
+    BLOCK = 'block'  # wait for the actor
+
+
 class Agent(Actor):
     def __init__(self, action_logic: ActionLogic, agent_connector: AgentConnector) -> None:
         self.action_logic = action_logic
         self.agent_connector = agent_connector
+        self.last_vehicle_state = None
 
     def act(self, ground_truth_info: GroundTruthInfo) -> None:
         new_vehicle_state = self.action_logic.act(ground_truth_info, self.agent_connector.get_agent_id())
@@ -60,6 +98,81 @@ class Agent(Actor):
         print("SEND STATE:", new_vehicle_state)
         if new_vehicle_state:
             self.agent_connector.send_position_state(new_vehicle_state)
+            self.last_vehicle_state = new_vehicle_state
+
+    def reuse_last_action(self, ground_truth_info: GroundTruthInfo) -> None:
+        if self.last_vehicle_state:
+            self.agent_connector.send_position_state(self.last_vehicle_state)
+
+
+class ExecutorActor(Actor):
+    """
+    Wrapper which runs a blocking actor (e.g. a model inference or a recorder writing on disk) in an executor, so
+    that it does not stop the event loop of AsyncSimulationLink
+    """
+
+    def __init__(self, actor: Actor, executor: Executor = None) -> None:
+        """
+        :param executor: if None, the default executor of the event loop is used
+        """
+        self.actor = actor
+        self.executor = executor
+
+    async def act(self, ground_truth_info: GroundTruthInfo) -> None:
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.actor.act, ground_truth_info)
+
+    def reuse_last_action(self, ground_truth_info: GroundTruthInfo) -> None:
+        self.actor.reuse_last_action(ground_truth_info)
+
+    def end_frame(self) -> None:
+        self.actor.end_frame()
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+        self.actor.shutdown(wait)
+
+
+class BatchedUdpSenderXYH(Actor):
+    """
+    Actor which collects the stateXYH messages of all the agents (see get_channel) and sends them together, over a
+    single socket, at the end of each frame (see MultiUdpSender).
+    """
+
+    def __init__(self, ip: str = '127.0.0.1', capacity: int = 64) -> None:
+        self.multi_udp_sender = MultiUdpSender(XYH_MESSAGE, ip, capacity)
+        self.lock = threading.Lock()  # agents can act in parallel (see SimulationLink)
+
+    def get_channel(self, port: int):
+        """
+        :return: a channel with the interface of UdpSenderXYH which sends to port through this sender
+        """
+        return BatchedUdpChannel(self, port)
+
+    def add_position_state(self, port: int, vehicle_id: int, vehicle_state: VehicleState) -> None:
+        values = get_xyh_values(vehicle_id, vehicle_state)
+        with self.lock:
+            self.multi_udp_sender.add(port, *values)
+
+    def end_frame(self) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self.multi_udp_sender.send()
+
+    def close(self) -> None:
+        self.multi_udp_sender.close()
+
+
+class BatchedUdpChannel:
+
+    def __init__(self, batched_udp_sender: BatchedUdpSenderXYH, port: int) -> None:
+        self.batched_udp_sender = batched_udp_sender
+        self.port = port
+
+    def send_position_state(self, vehicle_id: int, vehicle_state: VehicleState) -> None:
+        self.batched_udp_sender.add_position_state(self.port, vehicle_id, vehicle_state)
 
 
 class SimulationRecorder(Actor):
@@ -78,24 +191,265 @@ class SimulationRecorder(Actor):
         return self.simulation_trajectory
 
 
+class StreamingSimulationRecorder(Actor):
+    """
+    It is an Actor which record the simulation trajectory of each agent directly on file (see TrajectoryStreamWriter):
+    the memory used does not depend on the simulation length and a killed simulation can still be read back.
+    """
+
+    def __init__(self, file_path: str, buffer_size: int = 4096, flush_interval: float = 1.0) -> None:
+        """
+        :param flush_interval: see TrajectoryStreamWriter
+        """
+        self.file_path = file_path
+        self.writer = TrajectoryStreamWriter(file_path, buffer_size, flush_interval)
+
+    def act(self, ground_truth_info: GroundTruthInfo) -> None:
+        self.writer.add_state(ground_truth_info.get_simulation_state())
+
+    def shutdown(self, wait: bool = True) -> None:
+        if not self.writer.file.closed:
+            self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def get_simulation_trajectory(self) -> SimulationTrajectory:
+        self.writer.flush()
+        return read_trajectory_stream(self.file_path)
+
+
+class ActorTiming:
+    """
+    Wall-clock time spent by an actor acting on the frames of a SimulationLink
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.missed_deadlines = 0
+        self.skipped_frames = 0
+
+    def __repr__(self) -> str:
+        return f"{self.name}: calls = {self.calls}, mean = {self.mean_time():.6f}s, max = {self.max_time:.6f}s, " \
+               f"missed deadlines = {self.missed_deadlines}, skipped frames = {self.skipped_frames}"
+
+    def add(self, duration: float) -> None:
+        self.calls += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+
 class SimulationLink:
     """
     Create an object which is in charge of manage communication with ESMINI simulator
     """
 
-    def __init__(self, actors: Tuple[Actor, ...]) -> None:
+    def __init__(self, actors: Tuple[Actor, ...], decoding: str = 'moving_objects', max_workers: int = None,
+                 deadline_policy: DeadlinePolicy = DeadlinePolicy.BLOCK, latest_only: bool = False,
+                 timed_osi_receiver=None) -> None:
+        """
+        :param decoding: decoding mode of the OSIReceiver (see external.udp_driver.udp_osi_common.decoding_modes).
+        By default only the timestamp is decoded for the frames skipped by the time step and only the moving objects
+        are decoded for the other ones.
+        :param max_workers: if given, the actors act in parallel on a pool of max_workers threads, with a deadline of
+        time_step (see live) for each frame. Otherwise they act one after the other
+        :param deadline_policy: what to do with the actors which miss the deadline (see DeadlinePolicy)
+        :param latest_only: act only on the newest frame received (see TimedOSIReceiver)
+        :param timed_osi_receiver: source of the frames used in place of a TimedOSIReceiver, e.g.
+        gemini.simulator.esmini.LockstepOSIReceiver (decoding and latest_only are then ignored)
+        """
         self.actors = actors
-        self.timed_osi_receiver = TimedOSIReceiver(OSIReceiver())
+        if timed_osi_receiver is None:
+            timed_osi_receiver = TimedOSIReceiver(OSIReceiver(decoding), latest_only)
+        self.timed_osi_receiver = timed_osi_receiver
+        self.max_workers = max_workers
+        self.deadline_policy = deadline_policy
+        self.timings = [ActorTiming(f"{index}: {type(actor).__name__}") for index, actor in enumerate(actors)]
+        self.acting = dict()  # actor index -> future of the actor still acting on a previous frame
 
     def live(self, time_step: float = None, max_time: float = float('Inf')) -> None:
         """
         :param time_step: time_step used to get information from the OSIReceiver
         :param max_time: maximum time allowed for simulation
-        :return: None
+        :return: None, once all the actors have finished acting and have been shut down
         """
+        try:
+            if self.max_workers:
+                with ThreadPoolExecutor(self.max_workers) as executor:
+                    try:
+                        self.__live(time_step, max_time, executor)
+                    finally:
+                        self.__finish_acting()
+            else:
+                self.__live(time_step, max_time, None)
+        finally:
+            for actor in self.actors:
+                actor.shutdown(wait=True)
+
+    def __finish_acting(self) -> None:
+        """
+        Wait for the actors still acting on a previous frame (see DeadlinePolicy) and end their frame
+        """
+        acting, self.acting = self.acting, dict()
+        concurrent.futures.wait(acting.values())
+        for index, future in sorted(acting.items()):
+            future.result()
+            self.actors[index].end_frame()
+
+    def __live(self, time_step: float, max_time: float, executor) -> None:
         time = - float('Inf')
         while self.timed_osi_receiver.is_open() and time < max_time:
             ground_truth_info = self.timed_osi_receiver.receive(time_step)
             time = ground_truth_info.get_simulation_time()
+            if executor:
+                self.__act_in_parallel(ground_truth_info, executor, time_step)
+            else:
+                for actor, timing in zip(self.actors, self.timings):
+                    self.__timed_act(actor, timing, ground_truth_info)
+                for actor in self.actors:
+                    actor.end_frame()
+
+    def __act_in_parallel(self, ground_truth_info: GroundTruthInfo, executor: Executor, deadline: float) -> None:
+        futures = dict()
+        for index, (actor, timing) in enumerate(zip(self.actors, self.timings)):
+            future = self.acting.pop(index, None)
+            if future is not None and not future.done():
+                if self.deadline_policy is not DeadlinePolicy.BLOCK:
+                    self.acting[index] = future
+                    timing.skipped_frames += 1
+                    if self.deadline_policy is DeadlinePolicy.REUSE:
+                        actor.reuse_last_action(ground_truth_info)
+                    continue
+            if future is not None:
+                future.result()  # wait for the previous frame and raise its exception, if any
+                actor.end_frame()  # the late action has been taken after the end of its frame
+            futures[index] = executor.submit(self.__timed_act, actor, timing, ground_truth_info)
+        _, late_futures = concurrent.futures.wait(futures.values(), timeout=deadline)
+        acted = []
+        for index, (actor, timing) in enumerate(zip(self.actors, self.timings)):
+            future = futures.get(index)
+            if future in late_futures:
+                timing.missed_deadlines += 1
+                if self.deadline_policy is not DeadlinePolicy.BLOCK:
+                    self.acting[index] = future
+                    if self.deadline_policy is DeadlinePolicy.REUSE:
+                        actor.reuse_last_action(ground_truth_info)
+                    continue
+            if index not in self.acting:
+                if future is not None:
+                    future.result()
+                acted.append(actor)
+        # after all the actors have acted (e.g. BatchedUdpSenderXYH sends the states of the agents)
+        for actor in acted:
+            actor.end_frame()
+
+    @staticmethod
+    def __timed_act(actor: Actor, timing: ActorTiming, ground_truth_info: GroundTruthInfo) -> None:
+        start = perf_counter()
+        try:
+            actor.act(ground_truth_info)
+        finally:
+            timing.add(perf_counter() - start)
+
+
+class AsyncSimulationLink:
+    """
+    asyncio version of SimulationLink: the actors whose act is a coroutine (e.g. ExecutorActor) act concurrently.
+    The frames are given to each actor in order of simulation time, and an actor never acts on a frame before it
+    has finished with the previous one. An actor which misses the deadline is handled by the deadline policy.
+    A blocking actor stops the event loop, so it should be wrapped in ExecutorActor.
+    """
+
+    def __init__(self, actors: Tuple[Actor, ...], deadline: float = None,
+                 deadline_policy: DeadlinePolicy = DeadlinePolicy.BLOCK, decoding: str = 'moving_objects',
+                 osi_receiver=None) -> None:
+        """
+        :param deadline: time (seconds) given to the actors to act on a frame, None means no deadline
+        :param decoding: decoding mode of the OSI receiver (see SimulationLink)
+        :param osi_receiver: an AsyncOSIReceiver, if None it is created by live
+        """
+        self.actors = actors
+        self.deadline = deadline
+        self.deadline_policy = deadline_policy
+        self.decoding = decoding
+        self.osi_receiver = osi_receiver
+        self.acting = dict()  # actor index -> task of the actor still acting on a previous frame
+
+    async def live(self, time_step: float = None, max_time: float = float('Inf')) -> None:
+        """
+        :param time_step: time_step used to get information from the OSI receiver
+        :param max_time: maximum time allowed for simulation
+        :return: None, once all the actors have finished acting and have been shut down
+        """
+        try:
+            if self.osi_receiver is None:
+                from gemini.connector.async_osi_connector import AsyncOSIReceiver
+                self.osi_receiver = await AsyncOSIReceiver.create(decoding=self.decoding)
+            try:
+                await self.__live(time_step, max_time)
+            finally:
+                self.osi_receiver.close()
+                await self.__finish_acting()
+        finally:
             for actor in self.actors:
-                actor.act(ground_truth_info)
+                actor.shutdown(wait=True)
+
+    async def __finish_acting(self) -> None:
+        """
+        Wait for the actors still acting on a previous frame (see DeadlinePolicy) and end their frame
+        """
+        acting, self.acting = self.acting, dict()
+        if acting:
+            await asyncio.wait(acting.values())
+        for index, task in sorted(acting.items()):
+            task.result()
+            self.actors[index].end_frame()
+
+    async def __live(self, time_step: float, max_time: float) -> None:
+        time = - float('Inf')
+        while self.osi_receiver.is_open() and time < max_time:
+            ground_truth_info = await self.osi_receiver.receive(time_step)
+            if ground_truth_info is None:
+                break
+            time = ground_truth_info.get_simulation_time()
+            await self.__act(ground_truth_info)
+
+    async def __act(self, ground_truth_info: GroundTruthInfo) -> None:
+        tasks = dict()
+        for index, actor in enumerate(self.actors):
+            task = self.acting.pop(index, None)
+            if task is not None and not task.done():
+                if self.deadline_policy is not DeadlinePolicy.BLOCK:
+                    self.acting[index] = task
+                    if self.deadline_policy is DeadlinePolicy.REUSE:
+                        actor.reuse_last_action(ground_truth_info)
+                    continue
+                await task
+            if task is not None:
+                task.result()  # raise the exception of the previous frame, if any
+                actor.end_frame()  # the late action has been taken after the end of its frame
+            action = actor.act(ground_truth_info)
+            if inspect.isawaitable(action):
+                tasks[index] = asyncio.ensure_future(action)
+        if tasks:
+            deadline = None if self.deadline_policy is DeadlinePolicy.BLOCK else self.deadline
+            await asyncio.wait(tasks.values(), timeout=deadline)
+        acted = []
+        for index, actor in enumerate(self.actors):
+            task = tasks.get(index)
+            if task is not None and not task.done():
+                self.acting[index] = task
+                if self.deadline_policy is DeadlinePolicy.REUSE:
+                    actor.reuse_last_action(ground_truth_info)
+            elif index not in self.acting:
+                if task is not None:
+                    task.result()
+                acted.append(actor)
+        for actor in acted:
+            actor.end_frame()
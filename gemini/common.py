@@ -1,6 +1,10 @@
 import math
+from bisect import bisect_left
+from collections.abc import Sequence
 from queue import Queue
-from typing import List
+from typing import List, NamedTuple
+
+import numpy as np
 
 
 class Point2d:
@@ -188,11 +192,67 @@ class TimedVehicleState:
         return self.state
 
 
+class TrajectorySample(NamedTuple):
+    """
+    Vehicle states evaluated at N times: position, velocity and acceleration are (N, 2) arrays, heading is (N,)
+    """
+    position: np.ndarray
+    velocity: np.ndarray
+    acceleration: np.ndarray
+    heading: np.ndarray
+
+
+class VehicleStateColumns(Sequence):
+    """
+    Read-only list of VehicleState backed by column arrays: a VehicleState is created only when an item is accessed
+    """
+
+    def __init__(self, position: np.ndarray, velocity: np.ndarray, acceleration: np.ndarray, heading: np.ndarray,
+                 vehicle_id: int = -1) -> None:
+        self.position = position
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.heading = heading
+        self.vehicle_id = vehicle_id
+
+    def __len__(self) -> int:
+        return len(self.heading)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return VehicleStateColumns(self.position[index], self.velocity[index], self.acceleration[index],
+                                       self.heading[index], self.vehicle_id)
+        position = self.position[index]
+        velocity = self.velocity[index]
+        acceleration = self.acceleration[index]
+        return VehicleState(Point2d(float(position[0]), float(position[1])),
+                            Point2d(float(velocity[0]), float(velocity[1])),
+                            Point2d(float(acceleration[0]), float(acceleration[1])),
+                            float(self.heading[index]), self.vehicle_id)
+
+
 class VehicleTrajectory:
 
     def __init__(self, times: List[float], vehicle_states: List[VehicleState]) -> None:
         self.vehicle_states = vehicle_states
         self.times = times
+        # index of the last segment found: consecutive queries are usually monotonically increasing
+        self.__last_index = 1
+        self.__columns = None
+
+    @classmethod
+    def from_arrays(cls, times: np.ndarray, position: np.ndarray, velocity: np.ndarray, acceleration: np.ndarray,
+                    heading: np.ndarray, vehicle_id: int = -1):
+        """
+        Create a trajectory without building a VehicleState for each time (see VehicleStateColumns).
+        position, velocity and acceleration are (N, 2) arrays, times and heading are (N,) arrays
+        """
+        times = np.asarray(times, dtype=float)
+        columns = (np.asarray(position, dtype=float), np.asarray(velocity, dtype=float),
+                   np.asarray(acceleration, dtype=float), np.asarray(heading, dtype=float))
+        trajectory = cls(times, VehicleStateColumns(*columns, vehicle_id=vehicle_id))
+        trajectory.__columns = (times,) + columns
+        return trajectory
 
     def __call__(self, time: float):
         return self.__find_state(time)
@@ -200,8 +260,39 @@ class VehicleTrajectory:
     def get_time_interval(self):
         return self.times[0], self.times[-1]
 
+    def sample(self, times: np.ndarray) -> TrajectorySample:
+        """
+        Vectorized version of __call__: evaluate the trajectory at each of the given times
+        """
+        times = np.asarray(times, dtype=float)
+        trajectory_times, position, velocity, acceleration, heading = self.__get_columns()
+        # index of the lower bound state (see __find_state)
+        lower_bound = np.clip(np.searchsorted(trajectory_times, times, side='left') - 1, 0, len(trajectory_times) - 1)
+        before_start = times <= trajectory_times[0]
+        after_end = times >= trajectory_times[-1]
+        moving = ~(before_start | after_end)
+        sample_velocity = np.where(moving[:, np.newaxis], velocity[lower_bound], 0.0)
+        sample_acceleration = np.where(moving[:, np.newaxis], acceleration[lower_bound], 0.0)
+        elapsed_time = times - trajectory_times[lower_bound]
+        sample_position = position[lower_bound] + elapsed_time[:, np.newaxis] * sample_velocity
+        sample_position[before_start] = position[0]
+        sample_position[after_end] = position[-1]
+        sample_heading = np.where(moving, np.arctan2(sample_velocity[:, 1], sample_velocity[:, 0]), 0.0)
+        sample_heading[after_end] = heading[-1]
+        return TrajectorySample(sample_position, sample_velocity, sample_acceleration, sample_heading)
+
+    def __get_columns(self):
+        if self.__columns is None:
+            times = np.asarray(self.times, dtype=float)
+            position = np.array([[state.position.x, state.position.y] for state in self.vehicle_states], dtype=float)
+            velocity = np.array([[state.velocity.x, state.velocity.y] for state in self.vehicle_states], dtype=float)
+            acceleration = np.array([[state.acceleration.x, state.acceleration.y] for state in self.vehicle_states],
+                                    dtype=float)
+            heading = np.array([state.heading for state in self.vehicle_states], dtype=float)
+            self.__columns = times, position, velocity, acceleration, heading
+        return self.__columns
+
     def __find_state(self, time) -> VehicleState:
-        i = 0
         if time <= self.times[0]:  # vehicle is not moving
             vehicle_state = self.vehicle_states[0]
             return VehicleState(vehicle_state.position, vehicle_id=vehicle_state.vehicle_id)
@@ -210,8 +301,7 @@ class VehicleTrajectory:
             return VehicleState(vehicle_state.position, heading=vehicle_state.heading,
                                 vehicle_id=vehicle_state.vehicle_id)
         else:
-            while time > self.times[i]:
-                i = i + 1
+            i = self.__find_segment(time)
             # between two time steps I consider constant velocity.
             lower_bound_time = self.times[i - 1]
             lower_bound_state = self.vehicle_states[i - 1]
@@ -221,3 +311,17 @@ class VehicleTrajectory:
             state = VehicleState(position, velocity, acceleration, math.atan2(velocity.y, velocity.x),
                                  lower_bound_state.vehicle_id)
             return state
+
+    def __find_segment(self, time) -> int:
+        """
+        :return: the first index i such that times[i - 1] < time <= times[i] (times[0] < time < times[-1] is assumed)
+        """
+        i = self.__last_index
+        if i < len(self.times) and self.times[i - 1] < time <= self.times[i]:
+            return i
+        if i + 1 < len(self.times) and self.times[i] < time <= self.times[i + 1]:
+            i = i + 1
+        else:
+            i = bisect_left(self.times, time)
+        self.__last_index = i
+        return i
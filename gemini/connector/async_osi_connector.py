@@ -0,0 +1,129 @@
+import asyncio
+from typing import Optional
+
+from external import FragmentAssembler, decode_ground_truth
+from external.udp_driver.udp_osi_common import base_port
+from gemini.connector.osi_connector import GroundTruthInfo
+
+OSI_IP = '127.0.0.1'
+OSI_PORT = 48198
+
+
+class OSIDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    asyncio protocol which reassembles the OSI messages sent by esmini (see FragmentAssembler) and puts them, in
+    order of arrival, in a queue (see ground_truths). None is put in the queue when the transport is closed.
+    """
+
+    def __init__(self, decoding: str = 'moving_objects', max_frames: int = 64) -> None:
+        """
+        :param max_frames: size of the queue: when it is full, the oldest frame is dropped (see skipped_frames).
+        With 1, only the newest frame is kept
+        """
+        self.decoding = decoding
+        self.fragment_assembler = FragmentAssembler()
+        self.ground_truths = asyncio.Queue(max_frames)
+        self.skipped_frames = 0
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data, addr) -> None:
+        message = self.fragment_assembler.add(data)
+        if message is not None:
+            self.__put(GroundTruthInfo(decode_ground_truth(message, self.decoding)))
+
+    def error_received(self, exc) -> None:
+        print('Error: OSI receiver', exc)
+
+    def connection_lost(self, exc) -> None:
+        self.__put(None)
+
+    def __put(self, ground_truth_info: Optional[GroundTruthInfo]) -> None:
+        if self.ground_truths.full():
+            self.ground_truths.get_nowait()
+            self.skipped_frames += 1
+        self.ground_truths.put_nowait(ground_truth_info)
+
+
+class AsyncOSIReceiver:
+    """
+    asyncio version of TimedOSIReceiver
+    """
+
+    def __init__(self, protocol: OSIDatagramProtocol) -> None:
+        self.protocol = protocol
+        self.current_ground_truth_info = None
+        self.open = True
+
+    @classmethod
+    async def create(cls, ip: str = OSI_IP, port: int = OSI_PORT, decoding: str = 'moving_objects',
+                     max_frames: int = 64):
+        """
+        :param max_frames: maximum number of frames waiting to be received (see OSIDatagramProtocol)
+        """
+        _, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: OSIDatagramProtocol(decoding, max_frames), local_addr=(ip, port))
+        return cls(protocol)
+
+    async def receive(self, time_step: float = None) -> Optional[GroundTruthInfo]:
+        """
+        :return: as TimedOSIReceiver.receive, or None if the receiver has been closed
+        """
+        if not time_step:
+            return await self.__receive_now()
+        if self.current_ground_truth_info is None:
+            self.current_ground_truth_info = await self.__receive_now()
+        while self.current_ground_truth_info is not None:
+            ground_truth_info = await self.__receive_now()
+            if ground_truth_info is None or ground_truth_info.get_simulation_time() - \
+                    self.current_ground_truth_info.get_simulation_time() >= time_step:
+                self.current_ground_truth_info = ground_truth_info
+                break
+        return self.current_ground_truth_info
+
+    async def __receive_now(self) -> Optional[GroundTruthInfo]:
+        ground_truth_info = await self.protocol.ground_truths.get()
+        if ground_truth_info is None:
+            self.open = False
+        return ground_truth_info
+
+    def close(self) -> None:
+        if self.protocol.transport is not None:
+            self.protocol.transport.close()
+        self.current_ground_truth_info = None
+        self.open = False
+
+    def is_open(self) -> bool:
+        return self.open
+
+
+class AsyncUdpSender:
+    """
+    Same interface of external.UdpSender over an asyncio datagram transport. send can be called also from the
+    threads of an executor (e.g. by an actor wrapped in ExecutorActor)
+    """
+
+    def __init__(self, transport, loop: asyncio.AbstractEventLoop) -> None:
+        self.transport = transport
+        self.loop = loop
+
+    @classmethod
+    async def create(cls, ip: str = '127.0.0.1', port: int = base_port):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(ip, port))
+        return cls(transport, loop)
+
+    def send(self, msg) -> None:
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            self.transport.sendto(msg)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.sendto, bytes(msg))
+
+    def close(self) -> None:
+        self.transport.close()
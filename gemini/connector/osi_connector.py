@@ -1,6 +1,7 @@
 from typing import List, Tuple
 
 import numpy as np
+from scipy.spatial import cKDTree
 
 from external import OSIReceiver
 from gemini.common import VehicleState, Point2d
@@ -11,32 +12,100 @@ def osi_time_calculator(seconds, nanos):
 
 
 class GroundTruthInfo:
+    """
+    Wrapper of osi3 GroundTruth. The moving objects are decoded only once, at the first request, into a table
+    (see get_vehicle_table) which is used by all the accessors. It can also be created directly from a table
+    (see from_table).
+    """
+    TABLE_COLUMNS = ('x', 'y', 'vx', 'vy', 'ax', 'ay', 'yaw')
 
     def __init__(self, ground_truth) -> None:
         self.ground_truth = ground_truth
+        self.__simulation_time = None
+        self.__ids = None
+        self.__table = None
+        self.__rows = None
+        self.__spatial_index = None
+
+    @classmethod
+    def from_table(cls, simulation_time: float, ids: np.ndarray, table: np.ndarray):
+        """
+        :param ids: the id of each vehicle
+        :param table: a (N, 7) array with a row for each vehicle (see TABLE_COLUMNS)
+        """
+        ground_truth_info = cls(None)
+        ground_truth_info.__simulation_time = simulation_time
+        ground_truth_info.__set_table(ids, table)
+        return ground_truth_info
 
     def get_simulation_time(self) -> float:
+        if self.__simulation_time is not None:
+            return self.__simulation_time
         return osi_time_calculator(self.ground_truth.timestamp.seconds, self.ground_truth.timestamp.nanos)
 
+    def __decode(self) -> None:
+        moving_objects = self.ground_truth.moving_object
+        ids = np.empty(len(moving_objects), dtype=np.int64)
+        table = np.empty((len(moving_objects), len(self.TABLE_COLUMNS)), dtype=np.float64)
+        for row, moving_object in enumerate(moving_objects):
+            base = moving_object.base
+            position, velocity, acceleration = base.position, base.velocity, base.acceleration
+            ids[row] = moving_object.id.value
+            table[row] = (position.x, position.y, velocity.x, velocity.y, acceleration.x, acceleration.y,
+                          base.orientation.yaw)
+        self.__set_table(ids, table)
+
+    def __set_table(self, ids: np.ndarray, table: np.ndarray) -> None:
+        rows = dict()
+        for row, vehicle_id in enumerate(ids.tolist()):
+            rows.setdefault(vehicle_id, row)
+        self.__ids = ids
+        self.__rows = rows
+        self.__table = table  # set as last one: actors acting in parallel check it to know if decoding is done
+
+    def get_vehicle_ids(self) -> np.ndarray:
+        if self.__table is None:
+            self.__decode()
+        return self.__ids
+
+    def get_vehicle_table(self) -> np.ndarray:
+        """
+        :return: a (N, 7) array with a row for each vehicle (see TABLE_COLUMNS), in the order of get_vehicle_ids
+        """
+        if self.__table is None:
+            self.__decode()
+        return self.__table
+
+    def get_vehicle_row(self, agent_id: int) -> int:
+        if self.__table is None:
+            self.__decode()
+        if agent_id not in self.__rows:
+            raise ValueError(f"There is no vehicle with id {agent_id}")
+        return self.__rows[agent_id]
+
+    def get_spatial_index(self):
+        """
+        :return: the VehicleSpatialIndex of the vehicles of this frame, built at the first request and then shared by
+        all the agents which perceive this frame
+        """
+        if self.__spatial_index is None:
+            self.__spatial_index = VehicleSpatialIndex(self.get_vehicle_ids(), self.get_vehicle_table()[:, :2])
+        return self.__spatial_index
+
     def get_vehicle_state(self, agent_id: int) -> VehicleState:
-        agent_info = next(
-            filter(lambda moving_object: moving_object.id.value == agent_id, self.ground_truth.moving_object))
-        return self.__get_vehicle_state(agent_info)
+        return self.get_vehicle_state_at(self.get_vehicle_row(agent_id))
 
-    @staticmethod
-    def __get_vehicle_state(agent_info) -> VehicleState:
-        position = Point2d(agent_info.base.position.x, agent_info.base.position.y)
-        velocity = Point2d(agent_info.base.velocity.x, agent_info.base.velocity.y)
-        acceleration = Point2d(agent_info.base.acceleration.x, agent_info.base.acceleration.y)
-        heading = agent_info.base.orientation.yaw
-        return VehicleState(position, velocity, acceleration, heading, agent_info.id.value)
+    def get_vehicle_state_at(self, row: int) -> VehicleState:
+        x, y, vx, vy, ax, ay, yaw = self.get_vehicle_table()[row].tolist()
+        return VehicleState(Point2d(x, y), Point2d(vx, vy), Point2d(ax, ay), yaw, int(self.__ids[row]))
 
     def get_vehicle_states(self) -> List[VehicleState]:
-        return [self.__get_vehicle_state(agent) for agent in self.ground_truth.moving_object]
+        return [VehicleState(Point2d(x, y), Point2d(vx, vy), Point2d(ax, ay), yaw, vehicle_id) for
+                vehicle_id, (x, y, vx, vy, ax, ay, yaw) in
+                zip(self.get_vehicle_ids().tolist(), self.get_vehicle_table().tolist())]
 
     def get_simulation_state(self) -> Tuple[float, List[VehicleState]]:
-        return self.get_simulation_time(), [self.__get_vehicle_state(agent) for agent in
-                                            self.ground_truth.moving_object]
+        return self.get_simulation_time(), self.get_vehicle_states()
 
 
 class TimedOSIReceiver:
@@ -45,8 +114,15 @@ class TimedOSIReceiver:
     (see receive(self, time_step=None))
     """
 
-    def __init__(self, osi_receiver: OSIReceiver) -> None:
+    def __init__(self, osi_receiver: OSIReceiver, latest_only: bool = False) -> None:
+        """
+        :param latest_only: if True, the frames waiting to be received are skipped and only the newest one is
+        parsed (see OSIReceiver.receive_latest and skipped_frames): the actors which are slower than the simulator
+        act on the current state instead of falling behind
+        """
         self.osi_receiver = osi_receiver
+        self.latest_only = latest_only
+        self.skipped_frames = 0
         self.current_timed_ground_truth = None
         self.open = True
 
@@ -77,7 +153,11 @@ class TimedOSIReceiver:
         return next_timed_ground_truth
 
     def __receive_now(self) -> GroundTruthInfo:
-        ground_truth = self.osi_receiver.receive()
+        if self.latest_only:
+            ground_truth, skipped_frames = self.osi_receiver.receive_latest()
+            self.skipped_frames += skipped_frames
+        else:
+            ground_truth = self.osi_receiver.receive()
         return GroundTruthInfo(ground_truth)
 
     def close(self) -> None:
@@ -89,26 +169,72 @@ class TimedOSIReceiver:
         return self.open
 
 
+class VehicleSpatialIndex:
+    """
+    KD-tree over the positions of the vehicles of a frame. Queries return rows of GroundTruthInfo.get_vehicle_table,
+    sorted by distance (and by row for vehicles at the same distance)
+    """
+
+    def __init__(self, ids: np.ndarray, positions: np.ndarray) -> None:
+        self.ids = ids
+        self.tree = cKDTree(positions)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def query_nearest(self, position, number_of_vehicles: int, excluded_id: int = None,
+                      max_distance: float = np.inf) -> np.ndarray:
+        """
+        :param excluded_id: id of a vehicle which is never returned (e.g. the vehicle which is querying)
+        :param max_distance: only vehicles closer than max_distance are returned
+        """
+        # ask for one more vehicle, in case the excluded one is among the nearest
+        number_of_neighbours = min(number_of_vehicles + 1, len(self))
+        if number_of_vehicles <= 0 or number_of_neighbours == 0:
+            return np.empty(0, dtype=np.intp)
+        distances, rows = self.tree.query(position, k=list(range(1, number_of_neighbours + 1)),
+                                          distance_upper_bound=max_distance)
+        found = rows < len(self)  # missing neighbours are returned with index len(self)
+        rows = rows[found][np.lexsort((rows[found], distances[found]))]  # vehicles at the same distance by row
+        if excluded_id is not None:
+            rows = rows[self.ids[rows] != excluded_id]
+        return rows[:number_of_vehicles]
+
+    def query_radius(self, position, radius: float, excluded_id: int = None) -> np.ndarray:
+        rows = np.asarray(self.tree.query_ball_point(position, radius), dtype=np.intp)
+        if excluded_id is not None:
+            rows = rows[self.ids[rows] != excluded_id]
+        distances = np.linalg.norm(self.tree.data[rows] - np.asarray(position), axis=1)
+        return rows[np.lexsort((rows, distances))]
+
+
 class NearVehicles:
+    """
+    Nearest neighbour queries on the vehicles of a GroundTruthInfo (see GroundTruthInfo.get_spatial_index).
+    The target vehicle is excluded from the results by id.
+    """
+
     def __init__(self, ground_truth_info: GroundTruthInfo) -> None:
         self.ground_truth_info = ground_truth_info
 
-    def get_vehicles_near_to(self, target_vehicle: VehicleState, number_of_vehicles: int = 1) -> List:
-        if self.ground_truth_info.get_vehicle_states():
-            return self.__get_vehicle_near_to(target_vehicle, number_of_vehicles)
-        else:
+    def get_vehicles_near_to(self, target_vehicle: VehicleState, number_of_vehicles: int = 1,
+                             max_distance: float = np.inf) -> List[VehicleState]:
+        spatial_index = self.__get_spatial_index()
+        rows = spatial_index.query_nearest(self.__get_position(target_vehicle), number_of_vehicles,
+                                           target_vehicle.get_id(), max_distance)
+        return [self.ground_truth_info.get_vehicle_state_at(row) for row in rows.tolist()]
+
+    def get_vehicles_within(self, target_vehicle: VehicleState, radius: float) -> List[VehicleState]:
+        spatial_index = self.__get_spatial_index()
+        rows = spatial_index.query_radius(self.__get_position(target_vehicle), radius, target_vehicle.get_id())
+        return [self.ground_truth_info.get_vehicle_state_at(row) for row in rows.tolist()]
+
+    def __get_spatial_index(self) -> VehicleSpatialIndex:
+        spatial_index = self.ground_truth_info.get_spatial_index()
+        if not len(spatial_index):
             raise ValueError("There are no other vehicles")
+        return spatial_index
 
-    def __get_vehicle_near_to(self, target_vehicle: VehicleState, number_of_requested_vehicles: int) -> List:
-        other_vehicle_states = self.__get_other_vehicles(target_vehicle)
-        vehicle_distances = [target_vehicle.position_distance(vehicle) for vehicle in other_vehicle_states]
-        ordered_indexes = np.argsort(vehicle_distances)
-        number_other_vehicles = len(other_vehicle_states)
-        return [other_vehicle_states[index] for index in
-                ordered_indexes[:min(number_other_vehicles, number_of_requested_vehicles)]]
-
-    def __get_other_vehicles(self, target_vehicle):
-        vehicle_states = self.ground_truth_info.get_vehicle_states()
-        if target_vehicle in vehicle_states:
-            vehicle_states.remove(target_vehicle)
-        return vehicle_states
+    @staticmethod
+    def __get_position(vehicle: VehicleState) -> Tuple[float, float]:
+        return vehicle.position.x, vehicle.position.y
@@ -0,0 +1,122 @@
+import ctypes
+import os
+import socket
+import struct
+import sys
+
+
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16), ('sin_addr', ctypes.c_uint32),
+                ('sin_zero', ctypes.c_char * 8)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32), ('msg_iov', ctypes.POINTER(IOVec)),
+                ('msg_iovlen', ctypes.c_size_t), ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def load_sendmmsg():
+    """
+    :return: the sendmmsg function of the C library (Linux only) or None if it is not available
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        sendmmsg = ctypes.CDLL(None, use_errno=True).sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+class MultiUdpSender:
+    """
+    Send many messages with the same layout (message_struct), each one to its own port, over a single socket.
+    The messages are packed in a preallocated buffer (see add) and then sent back-to-back by send, with a single
+    sendmmsg system call where it is available (otherwise with a sendto for each message).
+    """
+
+    def __init__(self, message_struct: struct.Struct, ip: str = '127.0.0.1', capacity: int = 64,
+                 use_sendmmsg: bool = True) -> None:
+        self.message_struct = message_struct
+        self.ip = ip
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sendmmsg = load_sendmmsg() if use_sendmmsg else None
+        self.ports = []
+        self.__allocate(capacity)
+
+    def __len__(self) -> int:
+        return len(self.ports)
+
+    def __allocate(self, capacity: int) -> None:
+        message_size = self.message_struct.size
+        buffer = (ctypes.c_char * (capacity * message_size))()
+        if self.ports:
+            ctypes.memmove(buffer, self.buffer, len(self.ports) * message_size)
+        self.buffer = buffer
+        self.capacity = capacity
+        if self.sendmmsg is None:
+            return
+        # one header for each message, pointing to its slot of the buffer and to its address
+        self.iovecs = (IOVec * capacity)()
+        self.addresses = (SockAddrIn * capacity)()
+        self.headers = (MMsgHdr * capacity)()
+        buffer_address = ctypes.addressof(self.buffer)
+        ip_address = int.from_bytes(socket.inet_aton(self.ip), sys.byteorder)
+        for index in range(capacity):
+            self.iovecs[index].iov_base = buffer_address + index * message_size
+            self.iovecs[index].iov_len = message_size
+            self.addresses[index].sin_family = socket.AF_INET
+            self.addresses[index].sin_addr = ip_address
+            header = self.headers[index].msg_hdr
+            header.msg_name = ctypes.addressof(self.addresses[index])
+            header.msg_namelen = ctypes.sizeof(SockAddrIn)
+            header.msg_iov = ctypes.pointer(self.iovecs[index])
+            header.msg_iovlen = 1
+        for index, port in enumerate(self.ports):
+            self.addresses[index].sin_port = socket.htons(port)
+
+    def add(self, port: int, *values) -> None:
+        """
+        Pack values (see message_struct) in the buffer, the message is sent to port by the next call of send
+        """
+        index = len(self.ports)
+        if index == self.capacity:
+            self.__allocate(2 * self.capacity)
+        self.message_struct.pack_into(self.buffer, index * self.message_struct.size, *values)
+        if self.sendmmsg is not None:
+            self.addresses[index].sin_port = socket.htons(port)
+        self.ports.append(port)
+
+    def send(self) -> None:
+        if self.sendmmsg is not None:
+            self.__send_multiple_messages()
+        else:
+            message_size = self.message_struct.size
+            view = memoryview(self.buffer).cast('B')
+            for index, port in enumerate(self.ports):
+                self.sock.sendto(view[index * message_size:(index + 1) * message_size], (self.ip, port))
+        self.ports.clear()
+
+    def __send_multiple_messages(self) -> None:
+        sent = 0
+        while sent < len(self.ports):
+            headers = ctypes.cast(ctypes.byref(self.headers, sent * ctypes.sizeof(MMsgHdr)), ctypes.POINTER(MMsgHdr))
+            result = self.sendmmsg(self.sock.fileno(), headers, len(self.ports) - sent, 0)
+            if result < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error))
+            sent += result
+
+    def close(self) -> None:
+        self.sock.close()
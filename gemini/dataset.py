@@ -1,43 +1,165 @@
-import math
+import hashlib
+import os
+import zipfile
 from typing import List, Tuple
 
 import matplotlib.transforms as mtransforms
 import numpy as np
+import pandas as pd
 import torch
 from PIL import Image
 from matplotlib import pyplot as plt
 
-from gemini.common import VehicleState, Point2d, VehicleTrajectory
+from gemini.common import VehicleTrajectory
 from gemini.resources import get_path_data_file
 from gemini.scenario import ScenarioModelObject
 
 
+DATASET_CACHE_VERSION = 1
+
+
 class TrajectoryDatabase:
+    DYNAMICS_COLUMNS = ('dX', 'ddX', 'dY', 'ddY')
 
     def __init__(self, trajectories) -> None:
-        self.trajectories = trajectories
+        # rows are sorted by (member, timestamp) so that each member is a contiguous block of rows
+        row_order = np.lexsort((trajectories['Timestamps_UNIX'].to_numpy(), trajectories['member'].to_numpy()))
+        self.trajectories = trajectories.iloc[row_order].reset_index(drop=True)
+        self.__row_order = row_order  # position of each row in the original data frame
+        self.__build_index()
+        self.__add_dynamics()
+
+    @classmethod
+    def from_csv(cls, csv_path: str, cache_path: str = None):
+        """
+        Load the tracks of a CSV file (e.g. corrected_tracks.csv). The first time, the sorted tracks with their
+        dynamics columns are stored in a NPZ file, which is then loaded in place of the CSV until the CSV changes
+        (different size, or different modification time and content hash).
+        :param cache_path: by default csv_path with the .npz extension
+        """
+        cache_path = cache_path or os.path.splitext(csv_path)[0] + '.npz'
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache:
+                if is_valid_dataset_cache(cache, csv_path):
+                    return cls.__from_cache(cache)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):  # missing, corrupt or old cache
+            pass
+        database = cls(pd.read_csv(csv_path))
+        try:
+            database.__store_cache(cache_path, csv_path)
+        except OSError as error:  # e.g. read-only or full disk: the cache is only an optimization
+            print('Warning: the dataset cache can not be written', error)
+        return database
+
+    @classmethod
+    def __from_cache(cls, cache):
+        columns = {}
+        for name in cache['columns'].tolist():
+            if 'codes_' + name in cache:
+                categorical = pd.Categorical.from_codes(cache['codes_' + name], cache['categories_' + name])
+                columns[name] = pd.Series(categorical).astype(str(cache['dtype_' + name]))
+            else:
+                columns[name] = cache['column_' + name]
+        database = cls.__new__(cls)
+        database.trajectories = pd.DataFrame(columns)
+        database.__row_order = cache['row_order']
+        database.__build_index()
+        return database
+
+    def __store_cache(self, cache_path: str, csv_path: str) -> None:
+        """
+        Store the sorted tracks: members and text columns as category codes, the other columns as they are
+        """
+        stat = os.stat(csv_path)
+        arrays = {'version': np.array(DATASET_CACHE_VERSION), 'source_size': np.array(stat.st_size),
+                  'source_mtime_ns': np.array(stat.st_mtime_ns), 'source_sha256': np.array(file_sha256(csv_path)),
+                  'columns': np.array(self.trajectories.columns.tolist(), dtype=str), 'row_order': self.__row_order}
+        for name, column in self.trajectories.items():
+            if name == 'member' or not pd.api.types.is_numeric_dtype(column):
+                codes, categories = pd.factorize(column)
+                arrays['codes_' + name] = codes.astype(np.int32)
+                numeric = pd.api.types.is_numeric_dtype(column)
+                arrays['categories_' + name] = np.asarray(categories) if numeric else np.asarray(categories, dtype=str)
+                arrays['dtype_' + name] = np.array(str(column.dtype))
+            else:
+                arrays['column_' + name] = column.to_numpy()
+        # the file is renamed once complete, so a cache is never read while it is written
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, 'wb') as file:
+                np.savez(file, **arrays)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def get_trajectory_ids(self) -> List[int]:
+        return self.__member_ids.tolist()
+
+    def get_source_tracks(self):
+        """
+        :return: the tracks as given to the constructor: rows in the original order, without the dynamics columns
+        """
+        source_columns = [name for name in self.trajectories.columns if name not in self.DYNAMICS_COLUMNS]
+        return self.trajectories.iloc[np.argsort(self.__row_order)][source_columns].reset_index(drop=True)
+
+    def __build_index(self) -> None:
+        members = self.trajectories['member'].to_numpy()
+        times = self.trajectories['Timestamps_UNIX'].to_numpy()
+        # member index: rows of self.__member_ids[i] are self.__member_starts[i]:self.__member_ends[i]
+        self.__member_ids, self.__member_starts = np.unique(members, return_index=True)
+        self.__member_ends = np.append(self.__member_starts[1:], len(members))
+        self.__member_start_times = times[self.__member_starts]
+        self.__member_end_times = times[self.__member_ends - 1]
+        # time interval index: members sorted by their first timestamp
+        self.__members_by_start_time = np.argsort(self.__member_start_times, kind='stable')
+        self.__sorted_start_times = self.__member_start_times[self.__members_by_start_time]
+
+    def __get_member_index(self, trajectory_id: int) -> int:
+        member_index = np.searchsorted(self.__member_ids, trajectory_id)
+        if member_index == len(self.__member_ids) or self.__member_ids[member_index] != trajectory_id:
+            raise ValueError(f"trajectory {trajectory_id} is not in the database")
+        return member_index
+
+    def __get_overlapping_rows(self, trajectory_id: int, time_interval: Tuple[float, float]) -> List[Tuple[int, int]]:
+        """
+        :return: the rows (start, end) of each member (except trajectory_id) within time_interval, ordered by
+        appearance in the original data frame
+        """
+        started_members = self.__members_by_start_time[
+                          :np.searchsorted(self.__sorted_start_times, time_interval[1], side='right')]
+        overlapping_members = started_members[(self.__member_end_times[started_members] >= time_interval[0]) &
+                                              (self.__member_ids[started_members] != trajectory_id)]
+        times = self.trajectories['Timestamps_UNIX'].to_numpy()
+        rows = []
+        for member_index in overlapping_members:
+            start, end = self.__member_starts[member_index], self.__member_ends[member_index]
+            window_start = start + np.searchsorted(times[start:end], time_interval[0], side='left')
+            window_end = start + np.searchsorted(times[start:end], time_interval[1], side='right')
+            if window_start < window_end:
+                rows.append((self.__row_order[window_start:window_end].min(), window_start, window_end))
+        return [(start, end) for _, start, end in sorted(rows)]
 
     def __get_interactions(self, trajectory_id: int):
-        target_trajectory = self.trajectories[self.trajectories['member'] == trajectory_id]
-        target_time_interval = target_trajectory.iloc[0]['Timestamps_UNIX'], target_trajectory.iloc[-1][
-            'Timestamps_UNIX']
-        interacting_trajectories = self.trajectories[
-            (self.trajectories['Timestamps_UNIX'] >= target_time_interval[0]) &
-            (self.trajectories['Timestamps_UNIX'] <= target_time_interval[1]) &
-            (self.trajectories['member'] != trajectory_id)
-            ]
-        interacting_trajectories.loc[:, 'Timestamps_UNIX'] = interacting_trajectories['Timestamps_UNIX'].apply(
-            lambda x: round(x - target_time_interval[0], 2))
-        target_trajectory.loc[:, 'Timestamps_UNIX'] = target_trajectory['Timestamps_UNIX'].apply(
-            lambda x: round(x - target_time_interval[0], 2))
-        interacting_trajectories = [interacting_trajectories[interacting_trajectories['member'] == i] for i in
-                                    interacting_trajectories['member'].unique()]
-        self.__add_dynamics(target_trajectory)
-        interacting_trajectories = [trajectory for trajectory in interacting_trajectories if (len(trajectory)) > 2]
-        for interacting_trajectory in interacting_trajectories:
-            self.__add_dynamics(interacting_trajectory)
+        member_index = self.__get_member_index(trajectory_id)
+        start, end = self.__member_starts[member_index], self.__member_ends[member_index]
+        times = self.trajectories['Timestamps_UNIX'].to_numpy()
+        target_time_interval = times[start], times[end - 1]
+        target_trajectory = self.__get_rows(start, end, target_time_interval[0])
+        # the dynamics of the last two rows of each trajectory are not well-defined (see __add_dynamics)
+        interacting_trajectories = [self.__get_rows(start, end, target_time_interval[0]) for start, end in
+                                    self.__get_overlapping_rows(trajectory_id, target_time_interval) if
+                                    end - start > 2]
         return target_trajectory, interacting_trajectories
 
+    def __get_rows(self, start: int, end: int, initial_time: float):
+        """
+        :return: the rows start:end (except the last two) with timestamps relative to initial_time
+        """
+        rows = self.trajectories.iloc[start:max(start, end - 2)]
+        return rows.assign(Timestamps_UNIX=np.round(rows['Timestamps_UNIX'].to_numpy() - initial_time, 2))
+
     def get_trajectories(self, trajectory_id):
         return self.__get_interactions(trajectory_id)
 
@@ -46,72 +168,103 @@ class TrajectoryDatabase:
         return self.__to_vehicle_trajectory(target), [self.__to_vehicle_trajectory(interaction) for interaction in
                                                       interactions]
 
-    def get_scenario_objects(self, trajectory_id: int) -> Tuple[ScenarioModelObject, List[ScenarioModelObject]]:
+    def get_scenario_objects(self, trajectory_id: int, base_port: int = 53901) -> Tuple[
+            ScenarioModelObject, List[ScenarioModelObject]]:
+        """
+        :param base_port: UDP port of the target, the obstacles use the following ones
+        """
         target_trajectory, obstacles_trajectories = self.get_vehicle_trajectory(trajectory_id)
-        target_object = ScenarioModelObject(0, "ego", target_trajectory, 53901)
+        target_object = ScenarioModelObject(0, "ego", target_trajectory, base_port)
         obstacles_objects = [
-            ScenarioModelObject(agent_id + 1, f"obstacle{agent_id}", obstacle_trajectory, agent_id + 53902) for
-            obstacle_trajectory, agent_id in
+            ScenarioModelObject(agent_id + 1, f"obstacle{agent_id}", obstacle_trajectory, agent_id + base_port + 1)
+            for obstacle_trajectory, agent_id in
             zip(obstacles_trajectories, range(len(obstacles_trajectories)))]
         return target_object, obstacles_objects
 
     @staticmethod
     def __to_vehicle_trajectory(df):
-        times = list(df['Timestamps_UNIX'])
-        trajectory = list(df.apply(lambda row: VehicleState(Point2d(row['X'], row['Y']), Point2d(row['dX'], row['dY']),
-                                                            Point2d(row['ddX'], row['ddY']),
-                                                            heading=math.atan2(row['dY'], row['dX'])), axis=1))
-        return VehicleTrajectory(times, trajectory)
+        velocity = df[['dX', 'dY']].to_numpy(dtype=float)
+        return VehicleTrajectory.from_arrays(df['Timestamps_UNIX'].to_numpy(dtype=float),
+                                             df[['X', 'Y']].to_numpy(dtype=float), velocity,
+                                             df[['ddX', 'ddY']].to_numpy(dtype=float),
+                                             np.arctan2(velocity[:, 1], velocity[:, 0]))
 
     def get_generator(self, trajectory_id: int, number_near_vehicles: int):
-        target_trajectory, interacting_trajectories = self.__get_interactions(trajectory_id)
-        for i in range(len(target_trajectory)):
-            time = target_trajectory.iloc[i]['Timestamps_UNIX']
-            target_state = self.__get__state(target_trajectory, time)
-            interactions_state = [self.__get__state(interaction, time) for interaction in interacting_trajectories]
-            obstacles_states = self.__get__obstacles_states(number_near_vehicles, target_state, interactions_state)
-            yield self.__flatten(obstacles_states) + target_state
+        for state in self.get_state_matrix(trajectory_id, number_near_vehicles):
+            yield state.tolist()
 
-    @staticmethod
-    def __flatten(array):
-        return [item for sublist in array for item in sublist]
-
-    @staticmethod
-    def __get__state(df, time):
-        if time in df['Timestamps_UNIX'].values:
-            state = df[df['Timestamps_UNIX'] == time]
-            return [state['X'].values[0], state['Y'].values[0], state['dX'].values[0], state['dY'].values[0],
-                    state['ddX'].values[0], state['ddY'].values[0]]
+    def get_state_matrix(self, trajectory_id: int, number_near_vehicles: int) -> np.ndarray:
+        """
+        Evaluate the state of trajectory_id at each of its timestamps: the states (X, Y, dX, dY, ddX, ddY) of the
+        number_near_vehicles nearest interacting vehicles followed by the state of the target vehicle.
+        An interacting vehicle which has no state at a timestamp has a zero state.
+        :return: a (T, 6 * (min(number_near_vehicles, number of interacting vehicles) + 1)) array
+        """
+        state_columns = ['X', 'Y', 'dX', 'dY', 'ddX', 'ddY']
+        target_trajectory, interacting_trajectories = self.__get_interactions(trajectory_id)
+        times = target_trajectory['Timestamps_UNIX'].to_numpy()
+        target_states = target_trajectory[state_columns].to_numpy(dtype=float)
+        # states of the interacting vehicles aligned to the target timestamps: (T, M, 6)
+        interactions_states = np.zeros((len(times), len(interacting_trajectories), len(state_columns)))
+        for j, interaction in enumerate(interacting_trajectories):
+            interaction_times = interaction['Timestamps_UNIX'].to_numpy()
+            indexes = np.minimum(np.searchsorted(interaction_times, times), len(interaction_times) - 1)
+            found = interaction_times[indexes] == times
+            interactions_states[found, j] = interaction[state_columns].to_numpy(dtype=float)[indexes[found]]
+        number_near_vehicles = min(number_near_vehicles, len(interacting_trajectories))
+        distances = ((interactions_states[:, :, :2] - target_states[:, np.newaxis, :2]) ** 2).sum(axis=2)
+        if number_near_vehicles < len(interacting_trajectories):
+            nearest = np.argpartition(distances, number_near_vehicles, axis=1)[:, :number_near_vehicles]
         else:
-            return [0, 0, 0, 0, 0, 0]
+            nearest = np.tile(np.arange(len(interacting_trajectories)), (len(times), 1))
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1, kind='stable')
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        obstacles_states = np.take_along_axis(interactions_states, nearest[:, :, np.newaxis], axis=1)
+        return np.hstack([obstacles_states.reshape(len(times), -1), target_states])
 
-    @staticmethod
-    def __distance(x, y):
-        return (x[0] - y[0]) ** 2 + (x[1] - y[1]) ** 2
+    def __add_dynamics(self) -> None:
+        """
+        Add the columns dX, ddX, dY, ddY evaluated for all the members at once with forward differences:
+        dX[i] = (X[i + 1] - X[i]) / dt[i] and ddX[i] = ((X[i + 2] - X[i + 1]) - (X[i + 1] - X[i])) / dt[i].
+        The differences are zero where they would involve rows of another member.
+        """
+        times = self.trajectories['Timestamps_UNIX'].to_numpy()
+        last_rows = np.zeros(len(times), dtype=bool)
+        last_rows[self.__member_ends - 1] = True
+        # time steps are evaluated on timestamps relative to the start of each member and rounded as in __get_rows:
+        # differences of absolute UNIX timestamps are affected by float rounding errors
+        first_times = np.repeat(self.__member_start_times, self.__member_ends - self.__member_starts)
+        dt = np.append(np.diff(np.round(times - first_times, 2)), 1.0)
+        dt[last_rows] = 1.0  # the differences are zero on the last row of each member
+        for name in ['X', 'Y']:
+            column = self.trajectories[name].to_numpy()
+            d_name = np.append(np.diff(column), 0)
+            d_name[last_rows] = 0
+            dd_name = np.append(np.diff(d_name), 0)
+            dd_name[last_rows] = 0
+            self.trajectories['d' + name] = d_name / dt
+            self.trajectories['dd' + name] = dd_name / dt
 
-    @staticmethod
-    def __get__obstacles_states(number_near_vehicles, target_state, interactions_state):
-        distances = [TrajectoryDatabase.__distance(target_state, interaction_state) for interaction_state in
-                     interactions_state]
-        distances_sorted_indexes = np.argsort(distances)
-        ordered_interactions_state = [interactions_state[i] for i in distances_sorted_indexes]
-        return ordered_interactions_state[:number_near_vehicles]
 
-    @staticmethod
-    def __add_column(df, name):
-        dt = df["Timestamps_UNIX"].to_numpy()[1:] - df["Timestamps_UNIX"].to_numpy()[:-1]
-        dt = np.append(dt, dt[-1])
-        column = df[name].to_numpy()
-        d_name = np.append(column[1:] - column[:-1], 0)
-        dd_name = np.append(d_name[1:] - d_name[:-1], 0)
-        df.loc[:, 'd' + name] = d_name / dt
-        df.loc[:, 'dd' + name] = dd_name / dt
+def is_valid_dataset_cache(cache, csv_path: str) -> bool:
+    """
+    :param cache: the arrays stored by TrajectoryDatabase.from_csv
+    """
+    stat = os.stat(csv_path)
+    if int(cache['version']) != DATASET_CACHE_VERSION or int(cache['source_size']) != stat.st_size:
+        return False
+    if int(cache['source_mtime_ns']) == stat.st_mtime_ns:
+        return True
+    # same size but modified (or copied): the content is compared
+    return str(cache['source_sha256']) == file_sha256(csv_path)
 
-    @staticmethod
-    def __add_dynamics(df):
-        TrajectoryDatabase.__add_column(df, 'X')
-        TrajectoryDatabase.__add_column(df, 'Y')
-        df.drop(df.tail(2).index, inplace=True)
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 def evaluate_dynamics(x, dx, dt):
@@ -119,29 +272,56 @@ def evaluate_dynamics(x, dx, dt):
 
 
 def to_sampling_time_state(state, sampling_time):
-    sampling_time_state = []
-    states = np.array_split(state, len(state) / 6)
-    for state in states:
-        sampling_time_state.append(state[0])
-        sampling_time_state.append(state[1])
-        sampling_time_state.append(state[2] * sampling_time)
-        sampling_time_state.append(state[3] * sampling_time)
-        sampling_time_state.append(state[4] * sampling_time)
-        sampling_time_state.append(state[5] * sampling_time)
-    return sampling_time_state
+    """
+    Scale velocities and accelerations of each vehicle state (X, Y, dX, dY, ddX, ddY) by sampling_time.
+    :param state: a state of 6 * n values or a (..., 6 * n) array of states
+    """
+    state = np.asarray(state, dtype=float)
+    scale = np.array([1, 1, sampling_time, sampling_time, sampling_time, sampling_time])
+    return (state.reshape(state.shape[:-1] + (-1, 6)) * scale).reshape(state.shape)
+
+
+def evaluate_actions(network, states: torch.Tensor) -> torch.Tensor:
+    """
+    :param states: (N, state size) states
+    :return: (N, action size) actions, evaluated with a single forward pass, or with one forward pass for each state
+    if the network evaluates only the first row of a batch (e.g. VariationalGeneratorEncoded of older versions)
+    """
+    actions, _ = network(states)
+    if len(actions) == len(states):
+        return actions
+    if len(actions) != 1:
+        raise ValueError(f"the network returned {len(actions)} actions for {len(states)} states")
+    return torch.cat([network(state.reshape(1, -1))[0] for state in states])
 
 
 def roll_out(network, trajectories):
+    return roll_out_batch(network, [trajectories])[0].tolist()
+
+
+def roll_out_batch(network, trajectories: List[np.ndarray]) -> List[torch.Tensor]:
+    """
+    Roll out many trajectories with a single forward pass of the network: the states do not depend on the
+    actions, so all the actions are evaluated at once and then accumulated from the initial position of the target.
+    :param trajectories: list of (T, 6 * (k + 1)) states (see TrajectoryDatabase.get_state_matrix and
+    to_sampling_time_state)
+    :return: list of (T + 1, 2) tensors of positions
+    """
     network.eval()
-    current_state = trajectories[0][-6:-4]
-    rollout = [current_state]
-    for state in trajectories:
-        with torch.no_grad():
-            action, _ = network(torch.Tensor(state).reshape(1, -1))
-            delta_position = action.tolist()[0]
-            current_state = rollout[-1]
-            rollout.append([current_state[0] + delta_position[0], current_state[1] + delta_position[1]])
-    return rollout
+    lengths = [len(trajectory) for trajectory in trajectories]
+    states = torch.as_tensor(np.concatenate([np.asarray(trajectory, dtype=np.float32) for trajectory in trajectories]))
+    with torch.no_grad():
+        actions = evaluate_actions(network, states)
+    # each rollout is the cumulative sum of the initial position followed by the delta positions
+    rollouts = torch.empty((len(states) + len(trajectories), 2), dtype=torch.float64)
+    rollout_starts = np.cumsum([0] + [length + 1 for length in lengths])
+    action_starts = np.cumsum([0] + lengths)
+    for i, trajectory in enumerate(trajectories):
+        rollout = rollouts[rollout_starts[i]:rollout_starts[i + 1]]
+        rollout[0] = torch.as_tensor(np.asarray(trajectory[0], dtype=float)[-6:-4])
+        rollout[1:] = actions[action_starts[i]:action_starts[i + 1], :2]
+        rollout.cumsum_(dim=0)
+    return [rollouts[rollout_starts[i]:rollout_starts[i + 1]] for i in range(len(trajectories))]
 
 
 def rotation(x, y):
@@ -1,14 +1,16 @@
-from typing import Callable
+from typing import Callable, Union
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 from gemini.simulation import SimulationTrajectory
+from gemini.trajectory_storage import TrajectoryArchive
 
 
 class PerformanceAnalysis:
 
-    def __init__(self, real_trajectory: SimulationTrajectory, model_trajectory: SimulationTrajectory, n_point: int = 100) -> None:
+    def __init__(self, real_trajectory: Union[SimulationTrajectory, TrajectoryArchive],
+                 model_trajectory: Union[SimulationTrajectory, TrajectoryArchive], n_point: int = 100) -> None:
         self.real_trajectory = real_trajectory
         self.model_trajectory = model_trajectory
         self.n_point = n_point
@@ -31,9 +33,11 @@ class PerformanceAnalysis:
         time_interval = real_trajectory.get_time_interval()
         model_trajectory = self.model_trajectory.get_trajectory(agent_id)
         times = np.linspace(time_interval[0], time_interval[1], self.n_point)
-        real_values = [real_trajectory(t) for t in times]
-        model_values = [model_trajectory(t) for t in times]
-        distances = np.array([real.distance(model) for real, model in zip(real_values, model_values)])
+        real_values = real_trajectory.sample(times)
+        model_values = model_trajectory.sample(times)
+        distances = np.column_stack([np.linalg.norm(real_values.position - model_values.position, axis=1),
+                                     np.linalg.norm(real_values.velocity - model_values.velocity, axis=1),
+                                     np.linalg.norm(real_values.acceleration - model_values.acceleration, axis=1)])
         return distances, times
 
     def plot_time_distance(self, agent_id: int):
@@ -50,8 +54,8 @@ class PerformanceAnalysis:
         time_interval = real_trajectory.get_time_interval()
         model_trajectory = self.model_trajectory.get_trajectory(agent_id)
         times = np.linspace(time_interval[0], time_interval[1], 100)
-        real_values = [real_trajectory(t).speed() for t in times]
-        model_values = [model_trajectory(t).speed() for t in times]
+        real_values = np.linalg.norm(real_trajectory.sample(times).velocity, axis=1)
+        model_values = np.linalg.norm(model_trajectory.sample(times).velocity, axis=1)
         plt.plot(real_values, real_values, "r")
         plt.scatter(real_values[2:], model_values[2:])
         plt.xlabel("real speed")
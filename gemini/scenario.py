@@ -1,12 +1,15 @@
+import hashlib
+import json
+import os
 from typing import Tuple, List
 
 from scenariogeneration import xosc, Scenario
 
 from external import UdpSender
-from gemini.actors import Agent, AgentConnector, UdpSenderXYH
-from gemini.action_logic import FollowTrajectoryLogic
+from gemini.actors import Agent, AgentConnector, UdpSenderXYH, BatchedUdpSenderXYH
+from gemini.action_logic import FollowTrajectoryLogic, VariationalGeneratorCoordinator
 from gemini.common import VehicleTrajectory
-from gemini.resources import get_resources
+from gemini.resources import get_resources, get_scenario_path
 
 
 def generate_udp_controller(port_number):
@@ -62,7 +65,7 @@ class ScenarioModelGenerator:
 
         entities = xosc.Entities()
         entities.add_scenario_object(self.target.get_name(), xosc.CatalogReference('VehicleCatalog', 'car_white'),
-                                     generate_udp_controller("53901"))
+                                     generate_udp_controller(str(self.target.get_port_number())))
         init = xosc.Init()
         for obstacle in self.obstacles:
             obstacle_name = obstacle.get_name()
@@ -81,36 +84,137 @@ class ScenarioModelGenerator:
 
         return sce
 
-    def get_agent_with_model(self, model_logic):
+    def get_scenario_key(self) -> str:
+        """
+        :return: a digest of everything build_scenario depends on: the resources folder and the id, name, initial
+        state and port of the target and of each obstacle
+        """
+        content = [get_resources()] + [self.__get_object_key(scenario_object) for scenario_object in
+                                       [self.target] + self.obstacles]
+        return hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def __get_object_key(scenario_object: ScenarioModelObject) -> list:
+        x, y = scenario_object.get_initial_state()
+        return [int(scenario_object.get_agent_id()), scenario_object.get_name(), float(x), float(y),
+                int(scenario_object.get_port_number())]
+
+    def get_agent_with_model(self, model_logic, batched_udp_sender: BatchedUdpSenderXYH = None):
+        """
+        :param batched_udp_sender: if given, the agents send their states through it, and it is added to the actors
+        """
         actors = list()
-        sender = UdpSender(port=self.target.get_port_number())
         actors.append(Agent(action_logic=model_logic,
                             agent_connector=AgentConnector(agent_id=self.target.get_agent_id(),
-                                                           osi_channel=UdpSenderXYH(sender))))
+                                                           osi_channel=self.__get_osi_channel(
+                                                               self.target.get_port_number(), batched_udp_sender))))
         for obstacle in self.obstacles:
-            udp_sender = UdpSender(port=obstacle.get_port_number())
             actors.append(Agent(action_logic=FollowTrajectoryLogic(obstacle.get_trajectory()),
                                 agent_connector=AgentConnector(agent_id=obstacle.get_agent_id(),
-                                                               osi_channel=UdpSenderXYH(udp_sender))))
-        return actors
-
-    def get_agents(self):
+                                                               osi_channel=self.__get_osi_channel(
+                                                                   obstacle.get_port_number(), batched_udp_sender))))
+        return self.__with_sender(actors, batched_udp_sender)
+
+    def get_agents_with_shared_model(self, coordinator: VariationalGeneratorCoordinator, model_agent_ids: List[int],
+                                     batched_udp_sender: BatchedUdpSenderXYH = None):
+        """
+        Agents in model_agent_ids are driven by coordinator (a single forward pass for all of them), the others
+        follow their trajectory
+        """
+        actors = list()
+        for scenario_object in [self.target] + self.obstacles:
+            agent_id = scenario_object.get_agent_id()
+            if agent_id in model_agent_ids:
+                action_logic = coordinator.get_logic(agent_id)
+            else:
+                action_logic = FollowTrajectoryLogic(scenario_object.get_trajectory())
+            actors.append(Agent(action_logic=action_logic,
+                                agent_connector=AgentConnector(agent_id=agent_id, osi_channel=self.__get_osi_channel(
+                                    scenario_object.get_port_number(), batched_udp_sender))))
+        return self.__with_sender(actors, batched_udp_sender)
+
+    def get_agents(self, batched_udp_sender: BatchedUdpSenderXYH = None):
         actors = list()
-        sender = UdpSender(port=53901)
         actors.append(Agent(action_logic=FollowTrajectoryLogic(self.target.get_trajectory()),
-                            agent_connector=AgentConnector(agent_id=0,
-                                                           osi_channel=UdpSenderXYH(sender))))
+                            agent_connector=AgentConnector(agent_id=self.target.get_agent_id(),
+                                                           osi_channel=self.__get_osi_channel(
+                                                               self.target.get_port_number(), batched_udp_sender))))
         for obstacle in self.obstacles:
-            udp_sender = UdpSender(port=obstacle.get_port_number())
             actors.append(Agent(action_logic=FollowTrajectoryLogic(obstacle.get_trajectory()),
                                 agent_connector=AgentConnector(agent_id=obstacle.get_agent_id(),
-                                                               osi_channel=UdpSenderXYH(udp_sender))))
+                                                               osi_channel=self.__get_osi_channel(
+                                                                   obstacle.get_port_number(), batched_udp_sender))))
+        return self.__with_sender(actors, batched_udp_sender)
+
+    @staticmethod
+    def __get_osi_channel(port: int, batched_udp_sender: BatchedUdpSenderXYH):
+        if batched_udp_sender is None:
+            return UdpSenderXYH(UdpSender(port=port))
+        return batched_udp_sender.get_channel(port)
+
+    @staticmethod
+    def __with_sender(actors: list, batched_udp_sender: BatchedUdpSenderXYH) -> list:
+        # the sender must be an actor: it sends the states of all the agents when the frame ends (see end_frame)
+        if batched_udp_sender is not None:
+            actors.append(batched_udp_sender)
         return actors
 
     def get_time(self):
         return self.target.get_last_time()
 
 
+class ScenarioCache:
+    """
+    Content addressed cache of the open scenario files of ScenarioModelGenerator: the file of a scenario is named
+    after its key (see get_scenario_key), so it is built and written only the first time the scenario is used.
+    At most max_entries files are kept in the folder, the least recently used ones are removed.
+    """
+
+    def __init__(self, folder: str = 'cache', max_entries: int = 256) -> None:
+        """
+        :param folder: folder of the cached files, relative to the scenario folder (see get_scenario_path)
+        """
+        self.folder = folder
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get_scenario_name(self, scenario_model_generator: ScenarioModelGenerator) -> str:
+        """
+        :return: the name of the scenario file (as expected by run_scenario), written only if it is not cached
+        """
+        scenario_name = self.folder + os.sep + scenario_model_generator.get_scenario_key() + '.xosc'
+        scenario_path = get_scenario_path(scenario_name)
+        try:
+            os.utime(scenario_path)  # most recently used
+            self.hits += 1
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(scenario_path), exist_ok=True)
+            temporary_path = f"{scenario_path}.{os.getpid()}.tmp"
+            scenario_model_generator.build_scenario().write_xml(temporary_path)
+            # the file is renamed once complete, so other processes never read a partially written scenario
+            os.replace(temporary_path, scenario_path)
+            self.misses += 1
+            self.__evict(scenario_path)
+        return scenario_name
+
+    def __evict(self, scenario_path: str) -> None:
+        # the scenario just written is kept, even if other files have the same modification time
+        entries = []
+        for entry in os.scandir(os.path.dirname(scenario_path)):
+            if entry.name.endswith('.xosc') and entry.path != scenario_path:
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+                except FileNotFoundError:  # removed by another process
+                    pass
+        entries.sort()
+        for _, path in entries[:max(len(entries) + 1 - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
 class ScenarioAgent:
     def __init__(self) -> None:
         self.target = None
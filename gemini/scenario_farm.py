@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from gemini.actors import Actor, BatchedUdpSenderXYH, SimulationLink, SimulationRecorder
+from gemini.dataset import TrajectoryDatabase
+from gemini.scenario import ScenarioCache, ScenarioModelGenerator
+from gemini.simulation import SimulationTrajectory
+
+MAX_PORT = 65535
+
+
+def get_dataset_agents(scenario_model_generator: ScenarioModelGenerator) -> List[Actor]:
+    """
+    Default agents of ScenarioFarm: all the vehicles follow their trajectory of the dataset
+    """
+    return scenario_model_generator.get_agents(batched_udp_sender=BatchedUdpSenderXYH())
+
+
+def simulate_scenario(scenario_model_generator: ScenarioModelGenerator, scenario_cache: ScenarioCache,
+                      agents_factory: Callable[[ScenarioModelGenerator], List[Actor]],
+                      time_step: float) -> SimulationTrajectory:
+    """
+    Run the scenario in this process, in lockstep with the agents (see LockstepOSIReceiver)
+    """
+    from gemini.simulator.esmini import LockstepOSIReceiver, create_headless_simulator
+    simulator = create_headless_simulator(scenario_cache.get_scenario_name(scenario_model_generator))
+    try:
+        recorder = SimulationRecorder()
+        simulation = SimulationLink(actors=agents_factory(scenario_model_generator) + [recorder],
+                                    timed_osi_receiver=LockstepOSIReceiver(simulator, direct=True))
+        simulation.live(time_step=time_step, max_time=scenario_model_generator.get_time())
+    finally:
+        simulator.close()
+    return recorder.get_simulation_trajectory()
+
+
+class FarmWorker:
+    """
+    State of a process of ScenarioFarm: each worker has its own range of UDP ports, so the simulations of different
+    workers do not interfere. The scenario files are shared through a ScenarioCache (the ports are part of the key)
+    """
+
+    def __init__(self, index: int, database: TrajectoryDatabase, base_port: int, ports_per_worker: int) -> None:
+        self.index = index
+        self.database = database
+        self.base_port = base_port + index * ports_per_worker
+        self.ports_per_worker = ports_per_worker
+        self.scenario_cache = ScenarioCache()
+
+    def get_scenario_model_generator(self, trajectory_id: int) -> ScenarioModelGenerator:
+        target, obstacles = self.database.get_scenario_objects(trajectory_id, self.base_port)
+        if len(obstacles) + 1 > self.ports_per_worker:
+            raise ValueError(f"trajectory {trajectory_id} has {len(obstacles) + 1} vehicles, more than the "
+                             f"{self.ports_per_worker} ports of a worker")
+        return ScenarioModelGenerator(target, obstacles)
+
+
+# the worker of the current process (see ScenarioFarm.run)
+farm_worker = None
+
+
+def initialize_worker(worker_indexes, trajectories, base_port: int, ports_per_worker: int) -> None:
+    global farm_worker
+    database = trajectories if isinstance(trajectories, TrajectoryDatabase) else TrajectoryDatabase(trajectories)
+    farm_worker = FarmWorker(worker_indexes.get(), database, base_port, ports_per_worker)
+
+
+def run_trajectory(trajectory_id: int, agents_factory, time_step: float, simulate) -> Tuple[int, SimulationTrajectory]:
+    scenario_model_generator = farm_worker.get_scenario_model_generator(trajectory_id)
+    return trajectory_id, simulate(scenario_model_generator, farm_worker.scenario_cache, agents_factory, time_step)
+
+
+class ScenarioFarm:
+    """
+    Simulate many trajectories of the dataset in parallel, one simulator (in lockstep with its agents, see
+    simulate_scenario) for each process of a pool.
+    agents_factory and simulate are called in the worker processes, so they must be picklable (e.g. functions
+    defined at module level); a model used by agents_factory should be loaded there.
+    """
+
+    def __init__(self, trajectories, agents_factory: Callable[[ScenarioModelGenerator], List[Actor]] = None,
+                 max_workers: int = None, time_step: float = 0.05, base_port: int = 53901,
+                 ports_per_worker: int = None, simulate=simulate_scenario) -> None:
+        """
+        :param trajectories: the data frame of the dataset or a TrajectoryDatabase (e.g. loaded by from_csv)
+        :param agents_factory: creates the agents of a scenario, by default get_dataset_agents
+        :param max_workers: number of processes, by default the number of CPUs
+        :param base_port: first UDP port of the first worker, the worker i uses base_port + i * ports_per_worker and
+        the following ones
+        :param ports_per_worker: by default the ports from base_port to MAX_PORT are split among the workers
+        """
+        self.trajectories = trajectories
+        self.agents_factory = agents_factory or get_dataset_agents
+        self.max_workers = max_workers or os.cpu_count()
+        self.time_step = time_step
+        self.base_port = base_port
+        self.ports_per_worker = ports_per_worker or (MAX_PORT + 1 - base_port) // self.max_workers
+        if self.ports_per_worker < 1 or base_port + self.max_workers * self.ports_per_worker - 1 > MAX_PORT:
+            raise ValueError(f"{self.max_workers} workers with {self.ports_per_worker} ports each do not fit in the "
+                             f"ports from {base_port} to {MAX_PORT}")
+        self.simulate = simulate
+
+    def run(self, trajectory_ids: Iterable[int]) -> Dict[int, SimulationTrajectory]:
+        """
+        :return: the simulated trajectory for each trajectory id
+        """
+        worker_indexes = multiprocessing.Queue()
+        for index in range(self.max_workers):
+            worker_indexes.put(index)
+        results = dict()
+        with ProcessPoolExecutor(self.max_workers, initializer=initialize_worker,
+                                 initargs=(worker_indexes, self.trajectories, self.base_port,
+                                           self.ports_per_worker)) as executor:
+            futures = [executor.submit(run_trajectory, trajectory_id, self.agents_factory, self.time_step,
+                                       self.simulate) for trajectory_id in trajectory_ids]
+            for future in as_completed(futures):
+                trajectory_id, simulation_trajectory = future.result()
+                results[trajectory_id] = simulation_trajectory
+        return results
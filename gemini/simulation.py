@@ -2,10 +2,68 @@ import pickle
 from typing import List, Tuple
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 from gemini.common import VehicleTrajectory, VehicleState
 
 
+class VehicleStateBuffer:
+    """
+    Growable buffer which stores the states of a single vehicle as float64 columns
+    (time, x, y, vx, vy, ax, ay, heading), one row for each recorded state
+    """
+    COLUMNS = ('time', 'x', 'y', 'vx', 'vy', 'ax', 'ay', 'heading')
+
+    def __init__(self, vehicle_id: int, capacity: int = 256) -> None:
+        self.vehicle_id = vehicle_id
+        self.buffer = np.empty((capacity, len(self.COLUMNS)), dtype=np.float64)
+        self.size = 0
+
+    @classmethod
+    def from_array(cls, vehicle_id: int, states: np.ndarray):
+        """
+        :param states: a (N, 8) array (see COLUMNS)
+        """
+        vehicle_state_buffer = cls(vehicle_id, capacity=0)
+        vehicle_state_buffer.buffer = np.ascontiguousarray(states, dtype=np.float64)
+        vehicle_state_buffer.size = len(states)
+        return vehicle_state_buffer
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getstate__(self):
+        # do not store the unused capacity
+        return {'vehicle_id': self.vehicle_id, 'buffer': self.to_array().copy(), 'size': self.size}
+
+    def append(self, time: float, vehicle_state: VehicleState) -> None:
+        if self.size == len(self.buffer):
+            self.__grow()
+        self.buffer[self.size] = (time, vehicle_state.position.x, vehicle_state.position.y, vehicle_state.velocity.x,
+                                  vehicle_state.velocity.y, vehicle_state.acceleration.x, vehicle_state.acceleration.y,
+                                  vehicle_state.heading)
+        self.size += 1
+
+    def __grow(self) -> None:
+        buffer = np.empty((max(2 * len(self.buffer), 1), len(self.COLUMNS)), dtype=np.float64)
+        buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+
+    def to_array(self) -> np.ndarray:
+        """
+        :return: a (size, 8) view of the recorded states (see COLUMNS)
+        """
+        return self.buffer[:self.size]
+
+    def column(self, name: str) -> np.ndarray:
+        return self.buffer[:self.size, self.COLUMNS.index(name)]
+
+    def get_trajectory(self) -> VehicleTrajectory:
+        states = self.to_array()
+        return VehicleTrajectory.from_arrays(states[:, 0], states[:, 1:3], states[:, 3:5], states[:, 5:7],
+                                             states[:, 7], self.vehicle_id)
+
+
 class SimulationTrajectory:
 
     def __init__(self) -> None:
@@ -17,48 +75,48 @@ class SimulationTrajectory:
         self.time.append(time)
         for vehicle_state in vehicle_states:
             vehicle_state_id = vehicle_state.get_id()
-            if vehicle_state_id in self.storage:
-                self.storage[vehicle_state_id].append(vehicle_state)
-            else:
-                self.storage[vehicle_state_id] = [vehicle_state]
+            if vehicle_state_id not in self.storage:
+                self.storage[vehicle_state_id] = VehicleStateBuffer(vehicle_state_id)
+            self.storage[vehicle_state_id].append(time, vehicle_state)
 
     def store(self, file_path: str) -> None:
         with open(file_path, 'wb') as file:
             pickle.dump(self, file)
 
+    def store_archive(self, file_path: str) -> None:
+        """
+        Store the trajectory in a file which can be memory mapped (see gemini.trajectory_storage.TrajectoryArchive)
+        """
+        from gemini.trajectory_storage import store_trajectory_archive
+        store_trajectory_archive(self, file_path)
+
     def store_dict(self, file) -> None:
         storage_dict = {'time': self.time}
         for key, value in self.storage.items():
-            storage_dict[key] = [v.to_list() for v in value]
+            # columns x, y, vx, vy, ax, ay (see VehicleState.to_list)
+            storage_dict[key] = value.to_array()[:, 1:7].copy()
         pickle.dump(storage_dict, file)
 
     def get_trajectory(self, agent_id) -> VehicleTrajectory:
-        return VehicleTrajectory(self.time, self.storage[agent_id])
+        return self.storage[agent_id].get_trajectory()
 
     def plot_position(self) -> None:
         from gemini.dataset import PlotFiskhamnsmotet
         plot = PlotFiskhamnsmotet()
         for agent_id, agent_states in self.storage.items():
-            x = [agent_state.position.x for agent_state in agent_states]
-            y = [agent_state.position.y for agent_state in agent_states]
-            plot.add(f"agent id: {agent_id}", x, y)
+            plot.add(f"agent id: {agent_id}", agent_states.column('x'), agent_states.column('y'))
         plot.plot()
 
     def plot_dynamics(self) -> None:
         fig, axs = plt.subplots(6, 1, sharex='all')
         for agent_id, agent_states in self.storage.items():
-            x = [agent_state.position.x for agent_state in agent_states]
-            y = [agent_state.position.y for agent_state in agent_states]
-            dx = [agent_state.velocity.x for agent_state in agent_states]
-            dy = [agent_state.velocity.y for agent_state in agent_states]
-            ddx = [agent_state.acceleration.x for agent_state in agent_states]
-            ddy = [agent_state.acceleration.y for agent_state in agent_states]
-            self.__plot(self.time, x, agent_id, 'Position X', axs[0])
-            self.__plot(self.time, y, agent_id, 'Position Y', axs[1])
-            self.__plot(self.time, dx, agent_id, 'Velocity X', axs[2])
-            self.__plot(self.time, dy, agent_id, 'Velocity Y', axs[3])
-            self.__plot(self.time, ddx, agent_id, 'Acceleration X', axs[4])
-            self.__plot(self.time, ddy, agent_id, 'Acceleration Y', axs[5])
+            time = agent_states.column('time')
+            self.__plot(time, agent_states.column('x'), agent_id, 'Position X', axs[0])
+            self.__plot(time, agent_states.column('y'), agent_id, 'Position Y', axs[1])
+            self.__plot(time, agent_states.column('vx'), agent_id, 'Velocity X', axs[2])
+            self.__plot(time, agent_states.column('vy'), agent_id, 'Velocity Y', axs[3])
+            self.__plot(time, agent_states.column('ax'), agent_id, 'Acceleration X', axs[4])
+            self.__plot(time, agent_states.column('ay'), agent_id, 'Acceleration Y', axs[5])
         plt.legend()
         plt.show()
 
@@ -68,4 +126,4 @@ class SimulationTrajectory:
         ax.set_title(chart_title)
 
     def get_vehicle_trajectories(self) -> List[VehicleTrajectory]:
-        return [VehicleTrajectory(self.time, self.storage[agent_id]) for agent_id in self.storage.keys()]
+        return [self.get_trajectory(agent_id) for agent_id in self.storage.keys()]
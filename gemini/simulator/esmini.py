@@ -1,21 +1,39 @@
 import os
 from ctypes import *
 
+import numpy as np
 from dotenv import load_dotenv
 
+from external import decode_ground_truth
 from gemini import resources
+from gemini.connector.osi_connector import GroundTruthInfo
 
 load_dotenv()
 
 
+class SEScenarioObjectState(Structure):
+    """
+    SE_ScenarioObjectState of esminiLib.hpp (esmini v2.23)
+    """
+    _fields_ = [('id', c_int), ('model_id', c_int), ('ctrl_type', c_int), ('timestamp', c_float), ('x', c_float),
+                ('y', c_float), ('z', c_float), ('h', c_float), ('p', c_float), ('r', c_float), ('roadId', c_int),
+                ('junctionId', c_int), ('t', c_float), ('laneId', c_int), ('laneOffset', c_float), ('s', c_float),
+                ('speed', c_float), ('centerOffsetX', c_float), ('centerOffsetY', c_float),
+                ('centerOffsetZ', c_float), ('width', c_float), ('length', c_float), ('height', c_float),
+                ('objectType', c_int), ('objectCategory', c_int), ('wheel_angle', c_float),
+                ('wheel_rotation', c_float)]
+
+
 class EsminiSimulator:
 
     def __init__(self, esmini_library) -> None:
         self.scenario_engine = esmini_library
+        self.scenario_engine.SE_GetOSIGroundTruth.restype = c_void_p
+        self.scenario_engine.SE_GetSimulationTime.restype = c_float
 
-    def scenario_engine_initialization(self, scenario_path, enable_controls=False):
+    def scenario_engine_initialization(self, scenario_path, enable_controls=False, use_viewer=True):
         disable_ctrls = int(not enable_controls)
-        self.scenario_engine.SE_Init(bytes(scenario_path, 'utf-8'), disable_ctrls, 1, 0, 0)
+        self.scenario_engine.SE_Init(bytes(scenario_path, 'utf-8'), disable_ctrls, int(use_viewer), 0, 0)
 
     def step(self, dt=None):
         if not dt:
@@ -26,6 +44,36 @@ class EsminiSimulator:
     def open_osi_socket(self, ip_address):
         return self.scenario_engine.SE_OpenOSISocket(ip_address)
 
+    def get_osi_ground_truth(self) -> bytes:
+        """
+        :return: the encoded osi3.GroundTruth of the current frame
+        """
+        self.scenario_engine.SE_UpdateOSIGroundTruth()
+        size = c_int()
+        ground_truth = self.scenario_engine.SE_GetOSIGroundTruth(byref(size))
+        return string_at(ground_truth, size.value)
+
+    def get_simulation_time(self) -> float:
+        return self.scenario_engine.SE_GetSimulationTime()
+
+    def get_number_of_objects(self) -> int:
+        return self.scenario_engine.SE_GetNumberOfObjects()
+
+    def get_object_id(self, index: int) -> int:
+        return self.scenario_engine.SE_GetId(index)
+
+    def get_object_state(self, object_id: int, state: SEScenarioObjectState) -> None:
+        """
+        Fill state with the current state of object_id
+        """
+        self.scenario_engine.SE_GetObjectState(object_id, byref(state))
+
+    def is_running(self) -> bool:
+        return not self.scenario_engine.SE_GetQuitFlag()
+
+    def close(self) -> None:
+        self.scenario_engine.SE_Close()
+
 
 class EsminiSimulatorFactory:
 
@@ -44,3 +92,134 @@ def run_scenario(scenario_name):
     print("osi correct", osi_socker_correct)
     while True:
         se.step()
+
+
+def create_headless_simulator(scenario_name) -> EsminiSimulator:
+    """
+    :return: an esmini simulator, running in this process without viewer, ready to be used by LockstepOSIReceiver
+    """
+    resources.change_dir_to_scenario_folder()
+    se = EsminiSimulatorFactory.create()
+    se.scenario_engine_initialization(resources.get_scenario_path(scenario_name), enable_controls=True,
+                                      use_viewer=False)
+    return se
+
+
+class EsminiGroundTruthSource:
+    """
+    Read the ground truth of the objects directly from an in-process esmini simulator (no OSI serialization, socket
+    or fragmentation). The states are read in a preallocated array of SEScenarioObjectState and copied, column by
+    column, in the table of a GroundTruthInfo (see GroundTruthInfo.from_table).
+    esmini gives speed and heading: the velocity is speed along heading, the acceleration is the difference between
+    the velocities of the last two frames.
+    """
+
+    def __init__(self, simulator: EsminiSimulator, capacity: int = 64) -> None:
+        self.simulator = simulator
+        self.states = (SEScenarioObjectState * capacity)()
+        self.previous_time = None
+        self.previous_ids = None
+        self.previous_velocity = None
+
+    def get_ground_truth_info(self, simulation_time: float = None) -> GroundTruthInfo:
+        """
+        :param simulation_time: time of the frame, by default the time of esmini (a float: it is not precise on long
+        simulations, see LockstepOSIReceiver)
+        """
+        number_of_objects = self.simulator.get_number_of_objects()
+        if number_of_objects > len(self.states):
+            self.states = (SEScenarioObjectState * max(number_of_objects, 2 * len(self.states)))()
+        for index in range(number_of_objects):
+            self.simulator.get_object_state(self.simulator.get_object_id(index), self.states[index])
+        states = np.ctypeslib.as_array(self.states)[:number_of_objects]
+        if simulation_time is None:
+            simulation_time = float(self.simulator.get_simulation_time())
+
+        ids = states['id'].astype(np.int64)
+        table = np.empty((number_of_objects, len(GroundTruthInfo.TABLE_COLUMNS)), dtype=np.float64)
+        table[:, 0] = states['x']
+        table[:, 1] = states['y']
+        table[:, 2] = states['speed'] * np.cos(states['h'])
+        table[:, 3] = states['speed'] * np.sin(states['h'])
+        table[:, 4:6] = self.__get_acceleration(simulation_time, ids, table[:, 2:4])
+        table[:, 6] = states['h']
+
+        self.previous_time = simulation_time
+        self.previous_ids = ids
+        self.previous_velocity = table[:, 2:4].copy()
+        return GroundTruthInfo.from_table(simulation_time, ids, table)
+
+    def __get_acceleration(self, simulation_time: float, ids: np.ndarray, velocity: np.ndarray) -> np.ndarray:
+        if self.previous_time is None or simulation_time <= self.previous_time or not len(self.previous_ids):
+            return np.zeros_like(velocity)
+        if np.array_equal(ids, self.previous_ids):
+            previous_velocity = self.previous_velocity
+        else:
+            # objects which were not in the previous frame have zero acceleration
+            sorter = np.argsort(self.previous_ids)
+            rows = sorter[np.searchsorted(self.previous_ids, ids, sorter=sorter).clip(max=len(sorter) - 1)]
+            found = self.previous_ids[rows] == ids
+            previous_velocity = np.where(found[:, None], self.previous_velocity[rows], velocity)
+        return (velocity - previous_velocity) / (simulation_time - self.previous_time)
+
+
+class LockstepOSIReceiver:
+    """
+    Replacement of TimedOSIReceiver (see SimulationLink) which drives an in-process esmini simulator: receive
+    advances the simulation by time_step and returns the new frame, so the simulation advances only when all the
+    actors have acted on the previous frame. The simulation runs as fast as the actors and it is not tied to the
+    wall clock, hence it is reproducible.
+    The ground truth is read directly from esmini, the agents still send their states through the UDP controllers
+    (which receive them at the following step). If the actors act in parallel, the DeadlinePolicy must be BLOCK.
+    esmini returns its time as a float, which is not precise enough on long simulations (e.g. steps of a few
+    milliseconds after hours of simulation): when the ground truth is read directly, the time of the frames after a
+    step of time_step is evaluated here in double precision, as start time + number of steps * time_step.
+    """
+
+    def __init__(self, simulator: EsminiSimulator, decoding: str = 'moving_objects', direct: bool = False) -> None:
+        """
+        :param direct: read the states of the objects directly from esmini (see EsminiGroundTruthSource) instead of
+        decoding the OSI ground truth
+        """
+        self.simulator = simulator
+        self.decoding = decoding
+        self.ground_truth_source = EsminiGroundTruthSource(simulator) if direct else None
+        self.started = False
+        self.open = True
+        self.simulation_time = None  # time of the last frame
+        self.base_time = None  # time of the last frame before the steps of time_step
+        self.time_step = None
+        self.steps = 0
+
+    def receive(self, time_step=None) -> GroundTruthInfo:
+        """
+        :param time_step: dt of the simulation step, if None esmini uses its own time step
+        :return: the first frame at the first call, then the frame after a step of time_step
+        """
+        if self.started:
+            self.simulator.step(time_step)
+            self.__advance_time(time_step)
+        self.started = True
+        if self.ground_truth_source is not None:
+            ground_truth_info = self.ground_truth_source.get_ground_truth_info(self.simulation_time)
+        else:
+            ground_truth_info = GroundTruthInfo(decode_ground_truth(self.simulator.get_osi_ground_truth(),
+                                                                    self.decoding))
+        self.simulation_time = ground_truth_info.get_simulation_time()
+        return ground_truth_info
+
+    def __advance_time(self, time_step) -> None:
+        if not time_step:  # unknown step: the time is read from esmini
+            self.simulation_time = None
+            self.time_step = None
+            return
+        if time_step != self.time_step:
+            self.base_time, self.time_step, self.steps = self.simulation_time, time_step, 0
+        self.steps += 1
+        self.simulation_time = self.base_time + self.steps * time_step
+
+    def close(self) -> None:
+        self.open = False
+
+    def is_open(self) -> bool:
+        return self.open and self.simulator.is_running()
@@ -0,0 +1,216 @@
+import atexit
+import functools
+import json
+import struct
+import time
+import weakref
+from typing import List, Tuple
+
+import numpy as np
+
+from gemini.common import VehicleState, VehicleTrajectory
+from gemini.simulation import SimulationTrajectory, VehicleStateBuffer
+
+STREAM_MAGIC = b'GEMSTRM\0'
+STREAM_VERSION = 1
+STREAM_EMPTY_FRAME = 1  # flag of the record written for a frame without vehicles
+STREAM_HEADER = struct.Struct('<8sII')  # magic, version, record size
+ARCHIVE_MAGIC = b'GEMARCH\0'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<8sIQ')  # magic, version, index size
+ARCHIVE_ALIGNMENT = 64
+STREAM_RECORD = np.dtype([('time', '<f8'), ('flags', '<u8'), ('vehicle_id', '<i8'), ('x', '<f8'), ('y', '<f8'),
+                          ('vx', '<f8'), ('vy', '<f8'), ('ax', '<f8'), ('ay', '<f8'), ('heading', '<f8')])
+
+
+def close_at_exit(writer_reference: weakref.ref) -> None:
+    """
+    atexit callback of TrajectoryStreamWriter, which does not keep the writer alive
+    """
+    writer = writer_reference()
+    if writer is not None:
+        writer.close()
+
+
+class TrajectoryStreamWriter:
+    """
+    Append-only writer of simulation states: each vehicle state is a fixed size record (see STREAM_RECORD), a frame
+    without vehicles is a single record with the STREAM_EMPTY_FRAME flag.
+    Records are kept in a bounded buffer which is written to the file only at frame boundaries, so a file left by a
+    killed process contains complete frames only (except, at most, a truncated last record).
+    The buffer is written when it is full, at least every flush_interval seconds, when the writer is closed or
+    garbage collected, and at the exit of the interpreter: a killed process loses at most the frames of the last
+    flush_interval seconds. A smaller flush_interval loses less frames but writes more often (0 writes every frame).
+    With flush_interval None the buffer is written only when it is full, so a killed process can lose a whole buffer.
+    """
+
+    def __init__(self, file_path: str, buffer_size: int = 4096, flush_interval: float = 1.0) -> None:
+        self.file = open(file_path, 'wb')
+        self.file.write(STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, STREAM_RECORD.itemsize))
+        self.file.flush()
+        self.buffer = np.zeros(buffer_size, dtype=STREAM_RECORD)
+        self.size = 0
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.close_at_exit = functools.partial(close_at_exit, weakref.ref(self))
+        atexit.register(self.close_at_exit)
+
+    def __del__(self) -> None:
+        if hasattr(self, 'close_at_exit'):  # not set if the file could not be opened
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def add_state(self, time_and_vehicle_states: Tuple[float, List[VehicleState]]) -> None:
+        simulation_time, vehicle_states = time_and_vehicle_states
+        records = self.__to_records(simulation_time, vehicle_states)
+        if self.size + len(records) > len(self.buffer):
+            self.flush()
+        if len(records) > len(self.buffer):  # a single frame bigger than the buffer is written directly
+            self.__write(records)
+            return
+        self.buffer[self.size:self.size + len(records)] = records
+        self.size += len(records)
+        if self.flush_interval is not None and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    @staticmethod
+    def __to_records(simulation_time: float, vehicle_states: List[VehicleState]) -> np.ndarray:
+        if not vehicle_states:  # the time of the frame is kept
+            records = np.zeros(1, dtype=STREAM_RECORD)
+            records[0]['time'] = simulation_time
+            records[0]['flags'] = STREAM_EMPTY_FRAME
+            return records
+        return np.array([(simulation_time, 0, vehicle_state.get_id(), vehicle_state.position.x,
+                          vehicle_state.position.y, vehicle_state.velocity.x, vehicle_state.velocity.y,
+                          vehicle_state.acceleration.x, vehicle_state.acceleration.y, vehicle_state.heading)
+                         for vehicle_state in vehicle_states], dtype=STREAM_RECORD)
+
+    def flush(self) -> None:
+        self.__write(self.buffer[:self.size])
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def __write(self, records: np.ndarray) -> None:
+        self.file.write(records.tobytes())
+        self.file.flush()
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+        atexit.unregister(self.close_at_exit)
+
+
+def read_trajectory_stream(file_path: str) -> SimulationTrajectory:
+    """
+    Read a file written by TrajectoryStreamWriter, even if the writer has not been closed properly
+    """
+    with open(file_path, 'rb') as file:
+        magic, version, record_size = STREAM_HEADER.unpack(file.read(STREAM_HEADER.size))
+        if magic != STREAM_MAGIC or version != STREAM_VERSION or record_size != STREAM_RECORD.itemsize:
+            raise ValueError(f"{file_path} is not a trajectory stream (version {STREAM_VERSION})")
+        data = file.read()
+    number_of_records = len(data) // STREAM_RECORD.itemsize  # drop a partially written last record
+    records = np.frombuffer(data, dtype=STREAM_RECORD, count=number_of_records)
+    simulation_trajectory = SimulationTrajectory()
+    if number_of_records:
+        new_frame = np.append(True, records['time'][1:] != records['time'][:-1])
+        simulation_trajectory.time = records['time'][new_frame].tolist()
+    records = records[records['flags'] & STREAM_EMPTY_FRAME == 0]
+    # group the records by vehicle, keeping the vehicles in order of appearance
+    vehicle_ids, first_indexes = np.unique(records['vehicle_id'], return_index=True)
+    vehicle_ids = vehicle_ids[np.argsort(first_indexes)]
+    order = np.argsort(records['vehicle_id'], kind='stable')
+    sorted_vehicle_ids = records['vehicle_id'][order]
+    states = np.column_stack([records[name][order] for name in VehicleStateBuffer.COLUMNS])
+    starts = np.searchsorted(sorted_vehicle_ids, vehicle_ids, side='left')
+    ends = np.searchsorted(sorted_vehicle_ids, vehicle_ids, side='right')
+    for vehicle_id, start, end in zip(vehicle_ids.tolist(), starts, ends):
+        simulation_trajectory.storage[vehicle_id] = VehicleStateBuffer.from_array(vehicle_id, states[start:end])
+    return simulation_trajectory
+
+
+def store_trajectory_archive(simulation_trajectory: SimulationTrajectory, file_path: str) -> None:
+    """
+    Store a simulation trajectory in the archive format read by TrajectoryArchive:
+    - header (see ARCHIVE_HEADER) followed by a json index with the position of each block
+    - the frame times block
+    - one block for each vehicle, containing the columns of VehicleStateBuffer.COLUMNS one after the other
+    Blocks are little endian float64 arrays aligned to ARCHIVE_ALIGNMENT bytes.
+    """
+    blocks = [np.asarray(simulation_trajectory.time, dtype='<f8')]
+    blocks += [np.ascontiguousarray(vehicle_states.to_array().T, dtype='<f8') for vehicle_states in
+               simulation_trajectory.storage.values()]
+    offsets = []
+    offset = 0
+    for block in blocks:
+        offsets.append(offset)
+        offset = archive_aligned(offset + block.nbytes)
+    index = {
+        'columns': list(VehicleStateBuffer.COLUMNS),
+        'time': {'offset': offsets[0], 'length': len(blocks[0])},
+        'vehicles': [{'id': int(vehicle_id), 'offset': block_offset, 'length': len(vehicle_states)}
+                     for vehicle_id, vehicle_states, block_offset in
+                     zip(simulation_trajectory.storage.keys(), simulation_trajectory.storage.values(), offsets[1:])]
+    }
+    encoded_index = json.dumps(index).encode('utf-8')
+    data_offset = archive_aligned(ARCHIVE_HEADER.size + len(encoded_index))
+    with open(file_path, 'wb') as file:
+        file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(encoded_index)))
+        file.write(encoded_index)
+        for block, block_offset in zip(blocks, offsets):
+            file.seek(data_offset + block_offset)
+            file.write(block.tobytes())
+        file.truncate(data_offset + max(offset, ARCHIVE_ALIGNMENT))  # an empty file can not be memory mapped
+
+
+def archive_aligned(offset: int) -> int:
+    return -(-offset // ARCHIVE_ALIGNMENT) * ARCHIVE_ALIGNMENT
+
+
+class TrajectoryArchive:
+    """
+    Read-only access to a file written by store_trajectory_archive. The file is memory mapped: the trajectories
+    returned by get_trajectory are views on the file and only the pages which are actually used are read.
+    It can be used in place of SimulationTrajectory (e.g. by PerformanceAnalysis).
+    """
+
+    def __init__(self, file_path: str) -> None:
+        with open(file_path, 'rb') as file:
+            magic, version, index_size = ARCHIVE_HEADER.unpack(file.read(ARCHIVE_HEADER.size))
+            if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+                raise ValueError(f"{file_path} is not a trajectory archive (version {ARCHIVE_VERSION})")
+            index = json.loads(file.read(index_size).decode('utf-8'))
+        if tuple(index['columns']) != VehicleStateBuffer.COLUMNS:
+            raise ValueError(f"{file_path} has unexpected columns {index['columns']}")
+        data_offset = archive_aligned(ARCHIVE_HEADER.size + index_size)
+        self.data = np.memmap(file_path, dtype='<f8', mode='r', offset=data_offset)
+        self.time = self.__get_block(index['time'], 1)[0]
+        self.blocks = {vehicle['id']: vehicle for vehicle in index['vehicles']}
+
+    def __get_block(self, block, number_of_columns) -> np.ndarray:
+        start = block['offset'] // self.data.itemsize
+        return self.data[start:start + number_of_columns * block['length']].reshape(number_of_columns,
+                                                                                     block['length'])
+
+    def get_vehicle_ids(self) -> List[int]:
+        return list(self.blocks.keys())
+
+    def get_states(self, agent_id) -> np.ndarray:
+        """
+        :return: a (N, 8) view of the states of agent_id (see VehicleStateBuffer.COLUMNS)
+        """
+        return self.__get_block(self.blocks[agent_id], len(VehicleStateBuffer.COLUMNS)).T
+
+    def get_trajectory(self, agent_id) -> VehicleTrajectory:
+        states = self.get_states(agent_id)
+        return VehicleTrajectory.from_arrays(states[:, 0], states[:, 1:3], states[:, 3:5], states[:, 5:7],
+                                             states[:, 7], agent_id)
+
+    def get_vehicle_trajectories(self) -> List[VehicleTrajectory]:
+        return [self.get_trajectory(agent_id) for agent_id in self.blocks.keys()]
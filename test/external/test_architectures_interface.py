@@ -0,0 +1,167 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import torch
+
+from external.IRL.Auxiliary_functions.architectures_interface import EncodedModelWorker, \
+    PersistentVariationalGeneratorEncoded, VariationalGeneratorEncoded
+
+# fake encoded model: the action of each state is the sum of its values. The mode (first server argument) changes
+# its behaviour: 'hang' never answers, 'die-once:<path>' exits at the first request if <path> does not exist
+FAKE_WORKER = '''
+import os
+import struct
+import sys
+import time
+
+HEADER = struct.Struct('<II')
+mode = sys.argv[1]
+
+
+def read(size):
+    data = sys.stdin.buffer.read(size)
+    if len(data) < size:
+        sys.exit(0)
+    return data
+
+
+while True:
+    number_of_states, state_size = HEADER.unpack(read(HEADER.size))
+    states = struct.unpack(f'<{number_of_states * state_size}d', read(number_of_states * state_size * 8))
+    if mode == 'hang':
+        time.sleep(60)
+    if mode.startswith('die-once:') and not os.path.exists(mode[len('die-once:'):]):
+        open(mode[len('die-once:'):], 'w').close()
+        sys.exit(1)
+    actions = [sum(states[i * state_size:(i + 1) * state_size]) for i in range(number_of_states)]
+    response = HEADER.pack(number_of_states, 1) + struct.pack(f'<{number_of_states}d', *actions)
+    if mode == 'split':  # the response is received in many chunks
+        for byte in response:
+            sys.stdout.buffer.write(bytes([byte]))
+            sys.stdout.buffer.flush()
+            time.sleep(0.001)
+    else:
+        sys.stdout.buffer.write(response)
+        sys.stdout.buffer.flush()
+'''
+
+
+# fake executable of VariationalGeneratorEncoded: the action of the state given as argument is its sum
+FAKE_EXECUTABLE = '''
+import sys
+
+print(sum(float(value) for value in sys.argv[1].split(',')))
+'''
+
+
+class TestVariationalGeneratorEncoded(TestCase):
+
+    def test_forward_evaluates_all_the_states(self):
+        with tempfile.TemporaryDirectory() as folder:
+            executable_path = os.path.join(folder, 'fake_executable.py')
+            with open(executable_path, 'w') as file:
+                file.write(FAKE_EXECUTABLE)
+            # the command is [sys.executable, fake_executable.py, state]
+            generator = VariationalGeneratorEncoded(2, [], 1, sys.executable, executable_path)
+
+            actions, _ = generator(torch.Tensor([[1., 2.], [3., 4.]]))
+
+        self.assertEqual([[3.], [7.]], actions.tolist())
+
+
+class TestEncodedModelWorker(TestCase):
+
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.worker_path = os.path.join(self.folder.name, 'fake_worker.py')
+        with open(self.worker_path, 'w') as file:
+            file.write(FAKE_WORKER)
+        self.workers = []
+
+    def tearDown(self) -> None:
+        for worker in self.workers:
+            worker.close()
+        self.folder.cleanup()
+
+    def generate_worker(self, mode: str = 'serve', **kwargs) -> EncodedModelWorker:
+        # the command is [sys.executable, fake_worker.py, mode]
+        worker = EncodedModelWorker(sys.executable, self.worker_path, (mode,), **kwargs)
+        self.workers.append(worker)
+        return worker
+
+    def test_evaluate_batch(self):
+        worker = self.generate_worker()
+
+        actions = worker.evaluate(np.array([[1., 2.], [3., 4.], [5., 6.]]))
+
+        self.assertEqual([[3.], [7.], [11.]], actions.tolist())
+
+    def test_evaluate_batch_larger_than_the_pipe_buffer(self):
+        worker = self.generate_worker()
+        states = np.arange(40000, dtype=float).reshape(10000, 4)
+
+        actions = worker.evaluate(states)
+
+        self.assertEqual(states.sum(axis=1).reshape(-1, 1).tolist(), actions.tolist())
+
+    def test_evaluate_with_response_in_many_chunks(self):
+        worker = self.generate_worker('split')
+
+        worker.evaluate(np.array([[1., 2.], [3., 4.]]))
+        actions = worker.evaluate(np.array([[0.5, 0.25]]))
+
+        self.assertEqual([[0.75]], actions.tolist())
+
+    def test_evaluate_keeps_the_process_running(self):
+        worker = self.generate_worker()
+
+        worker.evaluate(np.array([[1., 2.]]))
+        actions = worker.evaluate(np.array([[0.5, 0.25]]))
+
+        self.assertEqual([[0.75]], actions.tolist())
+        self.assertEqual(1, worker.starts)
+
+    def test_evaluate_restarts_a_dead_process(self):
+        worker = self.generate_worker('die-once:' + os.path.join(self.folder.name, 'died'))
+
+        actions = worker.evaluate(np.array([[1., 2.]]))
+
+        self.assertEqual([[3.]], actions.tolist())
+        self.assertEqual(2, worker.starts)
+
+    def test_evaluate_with_hung_process(self):
+        worker = self.generate_worker('hang', max_restarts=1, timeout=0.2)
+
+        with self.assertRaises(RuntimeError):
+            worker.evaluate(np.array([[1., 2.]]))
+        self.assertEqual(2, worker.starts)
+        self.assertIsNone(worker.process)
+
+    def test_close(self):
+        worker = self.generate_worker()
+        worker.evaluate(np.array([[1., 2.]]))
+        process = worker.process
+
+        worker.close()
+
+        self.assertIsNotNone(process.poll())
+        self.assertFalse(worker.is_alive())
+
+
+class TestPersistentVariationalGeneratorEncoded(TestCase):
+
+    def test_forward(self):
+        with tempfile.TemporaryDirectory() as folder:
+            worker_path = os.path.join(folder, 'fake_worker.py')
+            with open(worker_path, 'w') as file:
+                file.write(FAKE_WORKER)
+            generator = PersistentVariationalGeneratorEncoded(2, [], 1, sys.executable, worker_path, ('serve',))
+            try:
+                actions, _ = generator(torch.Tensor([[1., 2.], [3., 4.]]))
+            finally:
+                generator.close()
+
+        self.assertEqual([[3.], [7.]], actions.tolist())
@@ -0,0 +1,67 @@
+import asyncio
+import socket
+import threading
+from unittest import TestCase
+
+from external.udp_driver.udp_osi_common import FragmentAssembler
+from gemini.connector.async_osi_connector import AsyncUdpSender, OSIDatagramProtocol
+
+
+def generate_message(payload: bytes) -> bytes:
+    # a message sent by esmini in a single datagram
+    return FragmentAssembler.FRAGMENT_HEADER.pack(-1, len(payload)) + payload
+
+
+class TestOSIDatagramProtocol(TestCase):
+
+    def test_datagram_received(self):
+        protocol = OSIDatagramProtocol('lazy')
+
+        protocol.datagram_received(generate_message(b'a'), None)
+        protocol.datagram_received(generate_message(b'b'), None)
+
+        self.assertEqual([b'a', b'b'], [protocol.ground_truths.get_nowait().ground_truth.message for _ in range(2)])
+        self.assertEqual(0, protocol.skipped_frames)
+
+    def test_datagram_received_drops_the_oldest_frame(self):
+        protocol = OSIDatagramProtocol('lazy', max_frames=2)
+
+        for payload in (b'a', b'b', b'c'):
+            protocol.datagram_received(generate_message(payload), None)
+        protocol.connection_lost(None)
+
+        self.assertEqual(2, protocol.ground_truths.qsize())
+        self.assertEqual(b'c', protocol.ground_truths.get_nowait().ground_truth.message)
+        self.assertIsNone(protocol.ground_truths.get_nowait())
+        self.assertEqual(2, protocol.skipped_frames)
+
+    def test_datagram_received_keeps_the_latest_frame(self):
+        async def receive():
+            protocol = OSIDatagramProtocol('lazy', max_frames=1)
+            for payload in (b'a', b'b', b'c'):
+                protocol.datagram_received(generate_message(payload), None)
+            return await protocol.ground_truths.get()
+
+        self.assertEqual(b'c', asyncio.run(receive()).ground_truth.message)
+
+
+class TestAsyncUdpSender(TestCase):
+
+    def test_send_from_event_loop_and_thread(self):
+        udp_receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_receiver.bind(('127.0.0.1', 0))
+        udp_receiver.settimeout(1)
+
+        async def send():
+            async_udp_sender = await AsyncUdpSender.create(port=udp_receiver.getsockname()[1])
+            async_udp_sender.send(b'loop')
+            thread = threading.Thread(target=async_udp_sender.send, args=(bytearray(b'thread'),))
+            thread.start()
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+            await asyncio.sleep(0)
+            async_udp_sender.close()
+
+        asyncio.run(send())
+
+        self.assertEqual({b'loop', b'thread'}, {udp_receiver.recv(1024) for _ in range(2)})
+        udp_receiver.close()
@@ -1,6 +1,8 @@
 from unittest import TestCase
-from unittest.mock import Mock, MagicMock
+from unittest.mock import Mock, MagicMock, patch
 
+from external.udp_driver import udp_osi_common
+from external.udp_driver.udp_osi_common import LazyGroundTruth, decode_timestamp, filter_fields, FragmentAssembler
 from gemini.common import VehicleState, Point2d
 from gemini.connector.osi_connector import TimedOSIReceiver, NearVehicles, GroundTruthInfo, \
     osi_time_calculator
@@ -14,6 +16,36 @@ class TestGroundTruthInfo(TestCase):
 
         self.assertEqual(osi_time_calculator(1, 1_000_000), osi_time)
 
+    def test_get_vehicle_state(self):
+        ground_truth = generate_mocked_ground_truth_with_moving_objects(
+            [generate_mocked_moving_object(4, 1, 2, 3, 4, 5, 6, 0.5),
+             generate_mocked_moving_object(7, 7, 8, 9, 10, 11, 12, 1.5)])
+        ground_truth_info = GroundTruthInfo(ground_truth)
+
+        actual_vehicle_state = ground_truth_info.get_vehicle_state(7)
+
+        self.assertEqual(VehicleState(Point2d(7, 8), Point2d(9, 10), Point2d(11, 12), 1.5), actual_vehicle_state)
+        self.assertEqual(7, actual_vehicle_state.get_id())
+
+    def test_get_vehicle_state_with_unknown_id(self):
+        ground_truth_info = GroundTruthInfo(generate_mocked_ground_truth_with_moving_objects([]))
+
+        with self.assertRaises(ValueError):
+            ground_truth_info.get_vehicle_state(7)
+
+    def test_get_vehicle_states(self):
+        ground_truth = generate_mocked_ground_truth_with_moving_objects(
+            [generate_mocked_moving_object(4, 1, 2, 3, 4, 5, 6, 0.5),
+             generate_mocked_moving_object(7, 7, 8, 9, 10, 11, 12, 1.5)])
+        ground_truth_info = GroundTruthInfo(ground_truth)
+
+        actual_vehicle_states = ground_truth_info.get_vehicle_states()
+
+        self.assertEqual([VehicleState(Point2d(1, 2), Point2d(3, 4), Point2d(5, 6), 0.5),
+                          VehicleState(Point2d(7, 8), Point2d(9, 10), Point2d(11, 12), 1.5)], actual_vehicle_states)
+        self.assertEqual([4, 7], [vehicle_state.get_id() for vehicle_state in actual_vehicle_states])
+        self.assertEqual([4, 7], ground_truth_info.get_vehicle_ids().tolist())
+
 
 class TestTimedOSIReceiver(TestCase):
     def test_receive(self):
@@ -48,6 +80,40 @@ class TestTimedOSIReceiver(TestCase):
         expected_time = osi_time_calculator(4, 6000000)
         self.assertEqual(expected_time, actual_ground_truth.get_simulation_time())
 
+    def test_receive_latest_only(self):
+        mocked_osi_receive = Mock()
+        mocked_osi_receive.receive_latest = Mock(side_effect=[
+            (generate_mocked_ground_truth_with_time(1, 0), 0),
+            (generate_mocked_ground_truth_with_time(1, 500000000), 3),
+            (generate_mocked_ground_truth_with_time(2, 5000000), 2)
+        ])
+        timed_osi_receiver = TimedOSIReceiver(mocked_osi_receive, latest_only=True)
+
+        actual_ground_truth = timed_osi_receiver.receive(1)
+
+        self.assertEqual(osi_time_calculator(2, 5000000), actual_ground_truth.get_simulation_time())
+        self.assertEqual(5, timed_osi_receiver.skipped_frames)
+        mocked_osi_receive.receive.assert_not_called()
+
+
+def generate_mocked_moving_object(vehicle_id, x, y, vx, vy, ax, ay, yaw):
+    moving_object = Mock()
+    moving_object.id.value = vehicle_id
+    moving_object.base.position.x = x
+    moving_object.base.position.y = y
+    moving_object.base.velocity.x = vx
+    moving_object.base.velocity.y = vy
+    moving_object.base.acceleration.x = ax
+    moving_object.base.acceleration.y = ay
+    moving_object.base.orientation.yaw = yaw
+    return moving_object
+
+
+def generate_mocked_ground_truth_with_moving_objects(moving_objects: list):
+    mocked_ground_truth = generate_mocked_ground_truth_with_time(1, 0)
+    mocked_ground_truth.moving_object = moving_objects
+    return mocked_ground_truth
+
 
 def generate_mocked_ground_truth_with_time(seconds, nanos):
     mocked_ground_truth = Mock()
@@ -56,6 +122,106 @@ def generate_mocked_ground_truth_with_time(seconds, nanos):
     return mocked_ground_truth
 
 
+# encoded osi3.GroundTruth: version, timestamp (12 s, 5000 ns), stationary object, moving object, lane
+ENCODED_VERSION = b'\x0a\x02\x08\x03'
+ENCODED_TIMESTAMP = b'\x12\x05\x08\x0c\x10\x88\x27'
+ENCODED_MOVING_OBJECT = b'\x2a\x02\x08\x01'
+ENCODED_GROUND_TRUTH = ENCODED_VERSION + ENCODED_TIMESTAMP + b'\x22\x00' + ENCODED_MOVING_OBJECT + b'\x52\x00'
+
+
+class TestLazyGroundTruth(TestCase):
+
+    def test_decode_timestamp(self):
+        timestamp = decode_timestamp(ENCODED_GROUND_TRUTH)
+
+        self.assertEqual((12, 5000), (timestamp.seconds, timestamp.nanos))
+
+    def test_simulation_time_does_not_parse_the_message(self):
+        lazy_ground_truth = LazyGroundTruth(ENCODED_GROUND_TRUTH)
+
+        simulation_time = GroundTruthInfo(lazy_ground_truth).get_simulation_time()
+
+        self.assertEqual(osi_time_calculator(12, 5000), simulation_time)
+        self.assertIsNone(lazy_ground_truth.ground_truth)
+
+    def test_parse_assigns_the_ground_truth_once_parsed(self):
+        lazy_ground_truth = LazyGroundTruth(ENCODED_GROUND_TRUTH)
+        visible_during_parse = []
+
+        class RecordingGroundTruth:
+            def ParseFromString(self, message):
+                visible_during_parse.append(lazy_ground_truth.ground_truth)
+
+        with patch.object(udp_osi_common.osi3.osi_groundtruth_pb2, 'GroundTruth', RecordingGroundTruth):
+            ground_truth = lazy_ground_truth.parse()
+
+        self.assertEqual([None], visible_during_parse)
+        self.assertIs(ground_truth, lazy_ground_truth.ground_truth)
+
+    def test_filter_fields(self):
+        filtered_message = filter_fields(ENCODED_GROUND_TRUTH, {2, 5})
+
+        self.assertEqual(ENCODED_TIMESTAMP + ENCODED_MOVING_OBJECT, filtered_message)
+
+
+def generate_fragment(counter, payload):
+    return FragmentAssembler.FRAGMENT_HEADER.pack(counter, len(payload)) + payload
+
+
+class TestFragmentAssembler(TestCase):
+
+    def test_add_fragments(self):
+        fragment_assembler = FragmentAssembler(capacity=4)
+
+        messages = [fragment_assembler.add(generate_fragment(1, b'abc')),
+                    fragment_assembler.add(generate_fragment(2, b'def')),
+                    fragment_assembler.add(generate_fragment(-3, b'g'))]
+
+        self.assertEqual([None, None, b'abcdefg'], [message and bytes(message) for message in messages])
+        self.assertEqual(b'xy', bytes(fragment_assembler.add(generate_fragment(-1, b'xy'))))
+        self.assertEqual((0, 0), (fragment_assembler.out_of_sync_resets, fragment_assembler.dropped_fragments))
+
+    def test_add_out_of_sync_fragments(self):
+        fragment_assembler = FragmentAssembler()
+
+        fragment_assembler.add(generate_fragment(1, b'abc'))
+        fragment_assembler.add(generate_fragment(3, b'ghi'))
+        fragment_assembler.add(generate_fragment(-4, b'jkl'))
+        message = fragment_assembler.add(generate_fragment(-1, b'xy'))
+
+        self.assertEqual(b'xy', bytes(message))
+        self.assertEqual((2, 3), (fragment_assembler.out_of_sync_resets, fragment_assembler.dropped_fragments))
+
+    def test_add_new_message_before_end_of_previous(self):
+        fragment_assembler = FragmentAssembler()
+
+        fragment_assembler.add(generate_fragment(1, b'abc'))
+        fragment_assembler.add(generate_fragment(1, b'def'))
+        message = fragment_assembler.add(generate_fragment(-2, b'g'))
+
+        self.assertEqual(b'defg', bytes(message))
+        self.assertEqual((1, 1), (fragment_assembler.out_of_sync_resets, fragment_assembler.dropped_fragments))
+
+
+class TestUdpReceiver(TestCase):
+
+    def test_receive_into_without_blocking(self):
+        for timeout in (-1, 5):
+            receiver = udp_osi_common.UdpReceiver(port=0, timeout=timeout)
+            sender = udp_osi_common.UdpSender(port=receiver.sock.getsockname()[1])
+            buffer = bytearray(receiver.buffersize)
+            try:
+                self.assertIsNone(receiver.receive_into(buffer, block=False))
+                self.assertEqual(None if timeout < 0 else timeout, receiver.sock.gettimeout())
+
+                sender.send(b'datagram')
+                self.assertEqual(8, receiver.receive_into(buffer))
+                self.assertEqual(b'datagram', buffer[:8])
+            finally:
+                sender.close()
+                receiver.close()
+
+
 class TestNearVehicle(TestCase):
 
     def test_get_vehicle_near_to_without_vehicles(self):
@@ -103,9 +269,41 @@ class TestNearVehicle(TestCase):
 
         self.assertEqual(expected_near_vehicles, actual_near_vehicles)
 
+    def test_get_vehicle_near_to_excludes_target_vehicle(self):
+        target_vehicle = VehicleState(position=Point2d(0.5, 0.5), vehicle_id=7)
+        vehicles = [VehicleState(position=Point2d(2, 1), vehicle_id=3), target_vehicle,
+                    VehicleState(position=Point2d(10, 10), vehicle_id=5)]
+        near_vehicle = NearVehicles(generate_mocked_ground_truth_with_vehicle(vehicles))
+
+        actual_near_vehicles = near_vehicle.get_vehicles_near_to(target_vehicle, 2)
+
+        self.assertEqual([3, 5], [vehicle.get_id() for vehicle in actual_near_vehicles])
+
+    def test_get_vehicle_near_to_within_max_distance(self):
+        target_vehicle = VehicleState(position=Point2d(0, 0), vehicle_id=7)
+        vehicles = [target_vehicle, VehicleState(position=Point2d(3, 4), vehicle_id=3),
+                    VehicleState(position=Point2d(10, 10), vehicle_id=5)]
+        near_vehicle = NearVehicles(generate_mocked_ground_truth_with_vehicle(vehicles))
+
+        actual_near_vehicles = near_vehicle.get_vehicles_near_to(target_vehicle, 2, max_distance=5.5)
+
+        self.assertEqual([3], [vehicle.get_id() for vehicle in actual_near_vehicles])
+
+    def test_get_vehicles_within(self):
+        target_vehicle = VehicleState(position=Point2d(0, 0), vehicle_id=7)
+        vehicles = [VehicleState(position=Point2d(4, 4), vehicle_id=2), target_vehicle,
+                    VehicleState(position=Point2d(1, 1), vehicle_id=3),
+                    VehicleState(position=Point2d(10, 10), vehicle_id=5)]
+        near_vehicle = NearVehicles(generate_mocked_ground_truth_with_vehicle(vehicles))
+
+        actual_near_vehicles = near_vehicle.get_vehicles_within(target_vehicle, 6)
+
+        self.assertEqual([3, 2], [vehicle.get_id() for vehicle in actual_near_vehicles])
+
 
 def generate_mocked_ground_truth_with_vehicle(vehicles: list):
-    mocked_ground_truth = Mock()
-    mocked_ground_truth.get_vehicle_states = MagicMock(
-        return_value=vehicles)
-    return mocked_ground_truth
+    moving_objects = [generate_mocked_moving_object(
+        vehicle_id if vehicle.get_id() == -1 else vehicle.get_id(), vehicle.position.x, vehicle.position.y,
+        vehicle.velocity.x, vehicle.velocity.y, vehicle.acceleration.x, vehicle.acceleration.y, vehicle.heading)
+        for vehicle_id, vehicle in enumerate(vehicles)]
+    return GroundTruthInfo(generate_mocked_ground_truth_with_moving_objects(moving_objects))
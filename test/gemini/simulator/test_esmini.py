@@ -0,0 +1,130 @@
+import math
+from ctypes import create_string_buffer, addressof
+from unittest import TestCase
+from unittest.mock import Mock, MagicMock
+
+import numpy as np
+
+from gemini.actors import SimulationLink, Actor
+from gemini.common import VehicleState, Point2d
+from gemini.connector.osi_connector import osi_time_calculator
+from gemini.simulator.esmini import EsminiSimulator, LockstepOSIReceiver, EsminiGroundTruthSource
+
+# encoded osi3.GroundTruth with the timestamp only
+ENCODED_GROUND_TRUTHS = [b'\x12\x02\x08\x00', b'\x12\x02\x08\x01', b'\x12\x02\x08\x02']
+
+
+class LoggingActor(Actor):
+
+    def __init__(self, log: list) -> None:
+        self.log = log
+
+    def act(self, ground_truth_info) -> None:
+        self.log.append(('act', ground_truth_info.get_simulation_time()))
+
+
+def generate_mocked_simulator(log: list):
+    simulator = Mock()
+    encoded_ground_truths = list(ENCODED_GROUND_TRUTHS)
+    simulator.get_osi_ground_truth = MagicMock(side_effect=lambda: encoded_ground_truths.pop(0))
+    simulator.step = MagicMock(side_effect=lambda dt: log.append(('step', dt)))
+    simulator.is_running = MagicMock(return_value=True)
+    return simulator
+
+
+class TestEsminiSimulator(TestCase):
+
+    def test_get_osi_ground_truth(self):
+        encoded_ground_truth = create_string_buffer(b'\x12\x02\x08\x01')
+        esmini_library = Mock()
+
+        def get_osi_ground_truth(size):
+            size._obj.value = 4
+            return addressof(encoded_ground_truth)
+
+        esmini_library.SE_GetOSIGroundTruth = MagicMock(side_effect=get_osi_ground_truth)
+        simulator = EsminiSimulator(esmini_library)
+
+        self.assertEqual(b'\x12\x02\x08\x01', simulator.get_osi_ground_truth())
+        esmini_library.SE_UpdateOSIGroundTruth.assert_called_once()
+
+
+class TestLockstepOSIReceiver(TestCase):
+
+    def test_live_in_lockstep(self):
+        log = []
+        simulator = generate_mocked_simulator(log)
+        simulation_link = SimulationLink((LoggingActor(log),),
+                                         timed_osi_receiver=LockstepOSIReceiver(simulator, decoding='lazy'))
+
+        simulation_link.live(time_step=0.5, max_time=osi_time_calculator(2, 0))
+
+        self.assertEqual([('act', 0.0), ('step', 0.5), ('act', 1.0), ('step', 0.5), ('act', 2.0)], log)
+
+
+def generate_mocked_simulator_with_objects(frames: list):
+    """
+    :param frames: (time, [(id, x, y, h, speed), ...]) for each frame
+    """
+    simulator = Mock()
+    current_frame = []
+
+    def get_number_of_objects():
+        time, objects = frames.pop(0)
+        current_frame[:] = [time, {index: state for index, state in enumerate(objects)}]
+        return len(objects)
+
+    def get_object_state(object_id, state):
+        state.id, state.x, state.y, state.h, state.speed = next(
+            object_state for object_state in current_frame[1].values() if object_state[0] == object_id)
+
+    simulator.get_number_of_objects = MagicMock(side_effect=get_number_of_objects)
+    simulator.get_object_id = MagicMock(side_effect=lambda index: current_frame[1][index][0])
+    simulator.get_object_state = MagicMock(side_effect=get_object_state)
+    simulator.get_simulation_time = MagicMock(side_effect=lambda: current_frame[0])
+    return simulator
+
+
+class TestEsminiGroundTruthSource(TestCase):
+
+    def test_get_ground_truth_info(self):
+        simulator = generate_mocked_simulator_with_objects([
+            (0.0, [(3, 1.0, 2.0, 0.0, 2.0), (5, 4.0, 4.0, math.pi / 2, 1.0)]),
+            (0.5, [(5, 4.0, 4.5, math.pi / 2, 2.0), (3, 2.0, 2.0, 0.0, 2.0), (7, 0.0, 0.0, 0.0, 1.0)])])
+        ground_truth_source = EsminiGroundTruthSource(simulator, capacity=1)
+
+        first_ground_truth_info = ground_truth_source.get_ground_truth_info()
+        second_ground_truth_info = ground_truth_source.get_ground_truth_info()
+
+        self.assertEqual(0.0, first_ground_truth_info.get_simulation_time())
+        self.assertEqual(VehicleState(Point2d(1, 2), Point2d(2, 0), Point2d(0, 0), 0.0),
+                         first_ground_truth_info.get_vehicle_state(3))
+        self.assertEqual(0.5, second_ground_truth_info.get_simulation_time())
+        self.assertEqual([5, 3, 7], second_ground_truth_info.get_vehicle_ids().tolist())
+        vehicle_state = second_ground_truth_info.get_vehicle_state(5)
+        self.assertAlmostEqual(2.0, vehicle_state.velocity.y, places=6)
+        self.assertAlmostEqual(2.0, vehicle_state.acceleration.y, places=6)
+        self.assertEqual(Point2d(0, 0), second_ground_truth_info.get_vehicle_state(7).acceleration)
+
+
+class TestLockstepOSIReceiverTime(TestCase):
+
+    def test_receive_evaluates_time_in_double_precision(self):
+        # esmini returns its time as a float: around 40000 s its resolution is about 4 ms
+        times = [float(np.float32(40000.0 + 0.003 * step)) for step in range(4)]
+        simulator = generate_mocked_simulator_with_objects([(time, [(3, 1.0, 2.0, 0.0, 2.0)]) for time in times])
+        simulator.is_running = MagicMock(return_value=True)
+        lockstep_osi_receiver = LockstepOSIReceiver(simulator, direct=True)
+
+        actual_times = [lockstep_osi_receiver.receive(0.003).get_simulation_time() for _ in range(4)]
+
+        self.assertEqual([40000.0 + 0.003 * step for step in range(4)], actual_times)
+
+    def test_receive_with_esmini_time_step(self):
+        simulator = generate_mocked_simulator_with_objects([(0.0, []), (0.25, []), (0.35, [])])
+        lockstep_osi_receiver = LockstepOSIReceiver(simulator, direct=True)
+
+        actual_times = [lockstep_osi_receiver.receive(time_step).get_simulation_time() for time_step in
+                        (0.1, None, 0.1)]
+
+        self.assertEqual([0.0, 0.25, 0.25 + 0.1], actual_times)
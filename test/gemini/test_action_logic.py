@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+import torch
+
+from gemini.action_logic import VariationalGeneratorCoordinator, VariationalGeneratorLogic
+from gemini.common import VehicleState, Point2d
+from gemini.connector.osi_connector import GroundTruthInfo
+from test.gemini.connector.test_osi_connector import generate_mocked_moving_object, \
+    generate_mocked_ground_truth_with_moving_objects
+
+
+class DeltaNetwork(torch.nn.Module):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = 0
+
+    def forward(self, x):
+        self.calls += 1
+        # the agent moves toward its nearest vehicle
+        return x[:, :2] - x[:, 12:14], None
+
+
+class FirstRowDeltaNetwork(DeltaNetwork):
+
+    def forward(self, x):
+        return super().forward(x[:1])
+
+
+class SlowDeltaNetwork(DeltaNetwork):
+
+    def forward(self, x):
+        time.sleep(0.01)  # the other agents act while the actions are evaluated
+        return super().forward(x)
+
+
+def generate_mocked_ground_truth_info(vehicles: list, seconds: int = 1):
+    moving_objects = [generate_mocked_moving_object(vehicle.get_id(), vehicle.position.x, vehicle.position.y,
+                                                    vehicle.velocity.x, vehicle.velocity.y, vehicle.acceleration.x,
+                                                    vehicle.acceleration.y, vehicle.heading) for vehicle in vehicles]
+    ground_truth = generate_mocked_ground_truth_with_moving_objects(moving_objects)
+    ground_truth.timestamp.seconds = seconds
+    return GroundTruthInfo(ground_truth)
+
+
+class TestVariationalGeneratorCoordinator(TestCase):
+
+    def test_get_action_evaluates_all_agents_once(self):
+        vehicles = [VehicleState(position=Point2d(0, 0), vehicle_id=0),
+                    VehicleState(position=Point2d(10, 0), vehicle_id=1),
+                    VehicleState(position=Point2d(0, 10), vehicle_id=2)]
+        ground_truth_info = generate_mocked_ground_truth_info(vehicles)
+        network = DeltaNetwork()
+        coordinator = VariationalGeneratorCoordinator(network, 0.5)
+        first_logic = coordinator.get_logic(0)
+        second_logic = coordinator.get_logic(2)
+
+        first_action = first_logic.act(ground_truth_info, 0)
+        second_action = second_logic.act(ground_truth_info, 2)
+
+        self.assertEqual(1, network.calls)
+        self.assertEqual(Point2d(20, 0), first_action.velocity)
+        self.assertEqual(Point2d(0, -20), second_action.velocity)
+
+    def test_get_action_is_equal_to_variational_generator_logic(self):
+        vehicles = [VehicleState(position=Point2d(0, 0), velocity=Point2d(1, 2), vehicle_id=0),
+                    VehicleState(position=Point2d(10, 0), vehicle_id=1)]
+        ground_truth_info = generate_mocked_ground_truth_info(vehicles)
+        coordinator = VariationalGeneratorCoordinator(DeltaNetwork(), 0.5)
+        logic = VariationalGeneratorLogic(DeltaNetwork(), 0.5, dict())
+
+        actual_action = coordinator.get_logic(0).act(ground_truth_info, 0)
+
+        expected_action = logic.act(ground_truth_info, 0)
+        self.assertEqual(expected_action, actual_action)
+
+    def test_get_action_from_many_threads_evaluates_once_for_each_frame(self):
+        vehicles = [VehicleState(position=Point2d(10 * i, 0), vehicle_id=i) for i in range(8)]
+        network = SlowDeltaNetwork()
+        coordinator = VariationalGeneratorCoordinator(network, 0.5)
+        logics = [coordinator.get_logic(vehicle.get_id()) for vehicle in vehicles]
+        barrier = threading.Barrier(len(logics))
+
+        def act(agent_id, ground_truth_info):
+            barrier.wait()
+            return logics[agent_id].act(ground_truth_info, agent_id)
+
+        with ThreadPoolExecutor(len(logics)) as executor:
+            for seconds in range(1, 6):
+                ground_truth_info = generate_mocked_ground_truth_info(vehicles, seconds)
+                actions = list(executor.map(act, range(len(logics)), [ground_truth_info] * len(logics)))
+                self.assertTrue(all(action is not None for action in actions))
+
+        self.assertEqual(5, network.calls)
+
+    def test_get_action_on_older_frame_keeps_current_frame(self):
+        vehicles = [VehicleState(position=Point2d(0, 0), vehicle_id=0),
+                    VehicleState(position=Point2d(10, 0), vehicle_id=1)]
+        old_ground_truth_info = generate_mocked_ground_truth_info(vehicles, 1)
+        ground_truth_info = generate_mocked_ground_truth_info(vehicles, 2)
+        network = DeltaNetwork()
+        coordinator = VariationalGeneratorCoordinator(network, 0.5)
+        logic = coordinator.get_logic(0)
+
+        logic.act(ground_truth_info, 0)
+        logic.act(old_ground_truth_info, 0)
+        logic.act(ground_truth_info, 0)
+
+        self.assertEqual(2, network.calls)
+
+    def test_get_action_with_generator_evaluating_first_row(self):
+        vehicles = [VehicleState(position=Point2d(0, 0), vehicle_id=0),
+                    VehicleState(position=Point2d(10, 0), vehicle_id=1)]
+        coordinator = VariationalGeneratorCoordinator(FirstRowDeltaNetwork(), 0.5)
+        logic = coordinator.get_logic(0)
+        coordinator.get_logic(1)
+
+        with self.assertRaises(ValueError):
+            logic.act(generate_mocked_ground_truth_info(vehicles), 0)
+
+    def test_get_action_visitor(self):
+        vehicles = [VehicleState(position=Point2d(0, 0), vehicle_id=0),
+                    VehicleState(position=Point2d(10, 0), vehicle_id=1)]
+        visitor = dict()
+        coordinator = VariationalGeneratorCoordinator(DeltaNetwork(), 0.5, visitor)
+        logic = coordinator.get_logic(0)
+        coordinator.get_logic(1)
+
+        logic.act(generate_mocked_ground_truth_info(vehicles), 0)
+
+        self.assertEqual({'state', 'time', 'torch_state', 'action', 'id'}, set(visitor.keys()))
+        self.assertEqual([[[1, -1], [0, -1]]], visitor['id'])
+        self.assertEqual(2, len(visitor['state'][0]))
+        self.assertEqual([10, 0], visitor['state'][0][0][:2])
@@ -1,9 +1,16 @@
+import asyncio
+import socket
 import struct
+import threading
+import time
 from unittest import TestCase
-from unittest.mock import Mock
+from unittest.mock import Mock, MagicMock, patch
 
 from external import input_modes
-from gemini.actors import UdpSenderXYH
+from gemini.actors import UdpSenderXYH, Actor, AsyncSimulationLink, DeadlinePolicy, ExecutorActor, SimulationLink, \
+    BatchedUdpSenderXYH, XYH_MESSAGE, Agent, AgentConnector
+from gemini.connector.async_osi_connector import AsyncUdpSender
+from gemini.connector.udp_sender import MultiUdpSender
 from gemini.common import VehicleState, Point2d
 
 
@@ -30,3 +37,322 @@ class TestUdpSenderChannel(TestCase):
         udp_sender_channel.send_position_state(0, vehicle_state)
 
         udp_sender.send.assert_called_once_with(expected_message)
+
+
+def generate_udp_receiver() -> socket.socket:
+    udp_receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_receiver.bind(('127.0.0.1', 0))
+    udp_receiver.settimeout(1)
+    return udp_receiver
+
+
+class TestBatchedUdpSenderXYH(TestCase):
+
+    def test_end_frame(self):
+        udp_receivers = [generate_udp_receiver(), generate_udp_receiver()]
+        ports = [udp_receiver.getsockname()[1] for udp_receiver in udp_receivers]
+        batched_udp_sender = BatchedUdpSenderXYH(capacity=1)
+        vehicle_states = [VehicleState(Point2d(1, 2), Point2d(3, 4), Point2d(5, 6), 3.1),
+                          VehicleState(Point2d(7, 8), Point2d(0, 1), Point2d(0, 0), 0.5)]
+        batched_udp_sender.get_channel(ports[0]).send_position_state(3, vehicle_states[0])
+        batched_udp_sender.get_channel(ports[1]).send_position_state(4, vehicle_states[1])
+
+        batched_udp_sender.end_frame()
+
+        self.assertEqual(XYH_MESSAGE.pack(1, input_modes['stateXYH'], 3, 0, 1, 2, 3.1, 5, 0.0, 1),
+                         udp_receivers[0].recv(1024))
+        self.assertEqual(XYH_MESSAGE.pack(1, input_modes['stateXYH'], 4, 0, 7, 8, 0.5, 1, 0.0, 1),
+                         udp_receivers[1].recv(1024))
+        batched_udp_sender.close()
+        for udp_receiver in udp_receivers:
+            udp_receiver.close()
+
+    def test_send_without_sendmmsg(self):
+        udp_receiver = generate_udp_receiver()
+        port = udp_receiver.getsockname()[1]
+        multi_udp_sender = MultiUdpSender(struct.Struct('id'), capacity=1, use_sendmmsg=False)
+        multi_udp_sender.add(port, 1, 2.0)
+        multi_udp_sender.add(port, 3, 4.0)
+
+        multi_udp_sender.send()
+
+        self.assertEqual([(1, 2.0), (3, 4.0)], [struct.unpack('id', udp_receiver.recv(1024)) for _ in range(2)])
+        self.assertEqual(0, len(multi_udp_sender))
+        multi_udp_sender.close()
+        udp_receiver.close()
+
+
+class FakeAsyncOSIReceiver:
+
+    def __init__(self, times: list) -> None:
+        self.ground_truth_infos = [Mock(get_simulation_time=MagicMock(return_value=time)) for time in times]
+        self.open = True
+
+    async def receive(self, time_step=None):
+        await asyncio.sleep(0)
+        return self.ground_truth_infos.pop(0) if self.ground_truth_infos else None
+
+    def is_open(self) -> bool:
+        return self.open
+
+    def close(self) -> None:
+        self.open = False
+
+
+class RecordingActor(Actor):
+
+    def __init__(self) -> None:
+        self.times = []
+        self.reused_times = []
+        self.ended_frames = 0
+        self.threads = set()
+
+    def act(self, ground_truth_info) -> None:
+        self.threads.add(threading.get_ident())
+        self.times.append(ground_truth_info.get_simulation_time())
+
+    def reuse_last_action(self, ground_truth_info) -> None:
+        self.reused_times.append(ground_truth_info.get_simulation_time())
+
+    def end_frame(self) -> None:
+        self.ended_frames += 1
+
+
+class SlowActor(RecordingActor):
+
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+
+    async def act(self, ground_truth_info) -> None:
+        await asyncio.sleep(self.delay)
+        super().act(ground_truth_info)
+
+
+class BlockingSlowActor(RecordingActor):
+
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+
+    def act(self, ground_truth_info) -> None:
+        time.sleep(self.delay)
+        super().act(ground_truth_info)
+
+
+class BarrierActor(RecordingActor):
+
+    def __init__(self, barrier: threading.Barrier) -> None:
+        super().__init__()
+        self.barrier = barrier
+        self.shutdowns = 0
+
+    def act(self, ground_truth_info) -> None:
+        self.barrier.wait()  # broken if the other actors do not act at the same time
+        super().act(ground_truth_info)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.shutdowns += 1
+
+
+class FakeTimedOSIReceiver:
+
+    def __init__(self, times: list) -> None:
+        self.ground_truth_infos = [Mock(get_simulation_time=MagicMock(return_value=time)) for time in times]
+
+    def receive(self, time_step=None):
+        return self.ground_truth_infos.pop(0)
+
+    def is_open(self) -> bool:
+        return bool(self.ground_truth_infos)
+
+
+def generate_simulation_link(actors, times: list, **kwargs) -> SimulationLink:
+    with patch('gemini.actors.OSIReceiver'):
+        simulation_link = SimulationLink(actors, **kwargs)
+    simulation_link.timed_osi_receiver = FakeTimedOSIReceiver(times)
+    return simulation_link
+
+
+class TestSimulationLink(TestCase):
+
+    def test_live(self):
+        actor = RecordingActor()
+        simulation_link = generate_simulation_link((actor,), [0.0, 0.1])
+
+        simulation_link.live()
+
+        self.assertEqual([0.0, 0.1], actor.times)
+        self.assertEqual(2, actor.ended_frames)
+        self.assertEqual(2, simulation_link.timings[0].calls)
+
+    def test_live_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+        actors = (BarrierActor(barrier), BarrierActor(barrier), RecordingActor())
+        simulation_link = generate_simulation_link(actors, [0.0, 0.1], max_workers=3)
+
+        simulation_link.live()
+
+        self.assertEqual([[0.0, 0.1]] * 3, [actor.times for actor in actors])
+        self.assertEqual([2, 2, 2], [actor.ended_frames for actor in actors])
+        self.assertEqual([1, 1], [actor.shutdowns for actor in actors[:2]])
+
+    def test_live_in_parallel_counts_missed_deadlines(self):
+        actors = (BlockingSlowActor(0.05), RecordingActor())
+        simulation_link = generate_simulation_link(actors, [0.0, 0.1], max_workers=2)
+
+        simulation_link.live(time_step=0.01)
+
+        self.assertEqual([[0.0, 0.1]] * 2, [actor.times for actor in actors])
+        self.assertEqual([2, 0], [timing.missed_deadlines for timing in simulation_link.timings])
+
+    def test_live_in_parallel_finishes_late_actors(self):
+        actor, slow_actor = RecordingActor(), BlockingSlowActor(0.2)
+        simulation_link = generate_simulation_link((slow_actor, actor), [0.0, 0.1], max_workers=2,
+                                                   deadline_policy=DeadlinePolicy.DROP)
+
+        simulation_link.live(time_step=0.01)
+
+        self.assertEqual([0.0], slow_actor.times)
+        self.assertEqual(1, slow_actor.ended_frames)
+        self.assertEqual(1, simulation_link.timings[0].calls)
+        self.assertEqual(dict(), simulation_link.acting)
+
+    def test_live_in_parallel_ends_the_frame_of_late_actors(self):
+        actor, slow_actor = RecordingActor(), BlockingSlowActor(0.1)
+        simulation_link = generate_simulation_link((slow_actor, actor), [0.0, 0.1, 0.2, 0.3, 0.4], max_workers=2,
+                                                   deadline_policy=DeadlinePolicy.DROP)
+        receive = simulation_link.timed_osi_receiver.receive
+        # the slow actor finishes its frames while the next frames are received
+        simulation_link.timed_osi_receiver.receive = lambda time_step=None: time.sleep(0.06) or receive(time_step)
+
+        simulation_link.live(time_step=0.01)
+
+        self.assertEqual(0.0, slow_actor.times[0])
+        self.assertLess(1, len(slow_actor.times))
+        self.assertEqual(len(slow_actor.times), slow_actor.ended_frames)
+        self.assertEqual(5, actor.ended_frames)
+
+    def test_live_in_parallel_reuse(self):
+        actor, slow_actor = RecordingActor(), BlockingSlowActor(0.2)
+        simulation_link = generate_simulation_link((slow_actor, actor), [0.0, 0.1, 0.2], max_workers=2,
+                                                   deadline_policy=DeadlinePolicy.REUSE)
+
+        simulation_link.live(time_step=0.01)
+
+        self.assertEqual([0.0], slow_actor.times)
+        self.assertEqual([0.0, 0.1, 0.2], slow_actor.reused_times)
+        self.assertEqual([0.0, 0.1, 0.2], actor.times)
+        slow_actor_timing = simulation_link.timings[0]
+        self.assertEqual((1, 2), (slow_actor_timing.missed_deadlines, slow_actor_timing.skipped_frames))
+
+
+class TestAsyncSimulationLink(TestCase):
+
+    def test_live_blocking(self):
+        actor, slow_actor = RecordingActor(), SlowActor(0.01)
+        link = AsyncSimulationLink((slow_actor, actor), osi_receiver=FakeAsyncOSIReceiver([0.0, 0.1, 0.2]))
+
+        asyncio.run(link.live())
+
+        self.assertEqual([0.0, 0.1, 0.2], slow_actor.times)
+        self.assertEqual([0.0, 0.1, 0.2], actor.times)
+        self.assertEqual((3, 3), (slow_actor.ended_frames, actor.ended_frames))
+
+    def test_live_drop(self):
+        actor, slow_actor = RecordingActor(), SlowActor(0.2)
+        link = AsyncSimulationLink((slow_actor, actor), deadline=0.01, deadline_policy=DeadlinePolicy.DROP,
+                                   osi_receiver=FakeAsyncOSIReceiver([0.0, 0.1, 0.2, 0.3]))
+
+        asyncio.run(link.live())
+
+        self.assertEqual([0.0], slow_actor.times)
+        self.assertEqual([], slow_actor.reused_times)
+        self.assertEqual([0.0, 0.1, 0.2, 0.3], actor.times)
+
+    def test_live_ends_the_frame_of_late_actors(self):
+        actor, slow_actor = RecordingActor(), SlowActor(0.05)
+        link = AsyncSimulationLink((slow_actor, actor), deadline=0.01, deadline_policy=DeadlinePolicy.DROP,
+                                   osi_receiver=FakeAsyncOSIReceiver([0.0, 0.1, 0.2, 0.3, 0.4]))
+        receive = link.osi_receiver.receive
+
+        async def slow_receive(time_step=None):
+            await asyncio.sleep(0.03)
+            return await receive(time_step)
+        link.osi_receiver.receive = slow_receive
+
+        asyncio.run(link.live())
+
+        self.assertEqual(0.0, slow_actor.times[0])
+        self.assertLess(1, len(slow_actor.times))
+        self.assertEqual(len(slow_actor.times), slow_actor.ended_frames)
+        self.assertEqual(5, actor.ended_frames)
+
+    def test_live_finishes_late_actors(self):
+        actor, slow_actor = RecordingActor(), SlowActor(0.2)
+        link = AsyncSimulationLink((slow_actor, actor), deadline=0.01, deadline_policy=DeadlinePolicy.DROP,
+                                   osi_receiver=FakeAsyncOSIReceiver([0.0, 0.1]))
+
+        asyncio.run(link.live())
+
+        self.assertEqual([0.0], slow_actor.times)
+        self.assertEqual((1, 2), (slow_actor.ended_frames, actor.ended_frames))
+        self.assertEqual(dict(), link.acting)
+
+    def test_live_shuts_down_the_actors(self):
+        actors = (BarrierActor(threading.Barrier(1)), BarrierActor(threading.Barrier(1)))
+        link = AsyncSimulationLink(actors, osi_receiver=FakeAsyncOSIReceiver([0.0]))
+
+        asyncio.run(link.live())
+
+        self.assertEqual([1, 1], [actor.shutdowns for actor in actors])
+
+    def test_live_reuse(self):
+        actor, slow_actor = RecordingActor(), SlowActor(0.2)
+        link = AsyncSimulationLink((slow_actor, actor), deadline=0.01, deadline_policy=DeadlinePolicy.REUSE,
+                                   osi_receiver=FakeAsyncOSIReceiver([0.0, 0.1, 0.2]))
+
+        asyncio.run(link.live())
+
+        self.assertEqual([0.0], slow_actor.times)
+        self.assertEqual([0.0, 0.1, 0.2], slow_actor.reused_times)
+        self.assertEqual([0.0, 0.1, 0.2], actor.times)
+
+    def test_live_executor_actor(self):
+        actor = RecordingActor()
+        link = AsyncSimulationLink((ExecutorActor(actor),), osi_receiver=FakeAsyncOSIReceiver([0.0, 0.1]))
+
+        asyncio.run(link.live())
+
+        self.assertEqual([0.0, 0.1], actor.times)
+        self.assertEqual(2, actor.ended_frames)
+        self.assertNotIn(threading.get_ident(), actor.threads)
+
+    def test_live_executor_agent_with_async_udp_sender(self):
+        udp_receiver = generate_udp_receiver()
+        vehicle_state = VehicleState(Point2d(1, 2), Point2d(3, 4), Point2d(5, 6), 3.1)
+        action_logic = Mock(act=MagicMock(return_value=vehicle_state))
+
+        async def live():
+            async_udp_sender = await AsyncUdpSender.create(port=udp_receiver.getsockname()[1])
+            agent = Agent(action_logic, AgentConnector(3, UdpSenderXYH(async_udp_sender)))
+            link = AsyncSimulationLink((ExecutorActor(agent),), osi_receiver=FakeAsyncOSIReceiver([0.0]))
+            try:
+                await link.live()
+            finally:
+                async_udp_sender.close()
+
+        asyncio.run(live())
+
+        self.assertEqual(XYH_MESSAGE.pack(1, input_modes['stateXYH'], 3, 0, 1, 2, 3.1, 5, 0.0, 1),
+                         udp_receiver.recv(1024))
+        udp_receiver.close()
+
+    def test_executor_actor_shutdown(self):
+        executor = Mock()
+        actor = BarrierActor(threading.Barrier(1))
+
+        ExecutorActor(actor, executor).shutdown()
+
+        executor.shutdown.assert_called_once_with(wait=True)
+        self.assertEqual(1, actor.shutdowns)
@@ -250,3 +250,35 @@ class TestVehicleTrajectory(TestCase):
 
         self.assertEqual(VehicleState(position=Point2d(1, 1), velocity=Point2d(0, 0), heading=0.0),
                          actual_state)
+
+    def test_trajectory_with_increasing_and_decreasing_times(self):
+        times = [0.0, 1.0, 2.0, 3.0]
+        vehicle_states = [VehicleState(position=Point2d(0, 0), velocity=Point2d(1, 0)),
+                          VehicleState(position=Point2d(1, 0), velocity=Point2d(0, 1)),
+                          VehicleState(position=Point2d(1, 1), velocity=Point2d(-1, 0)),
+                          VehicleState(position=Point2d(0, 1), velocity=Point2d(0, 0))]
+        vehicle_trajectory = VehicleTrajectory(times, vehicle_states)
+
+        actual_positions = [vehicle_trajectory(t).position for t in [0.5, 1.0, 1.5, 2.5, 0.25, 2.0]]
+
+        self.assertEqual([Point2d(0.5, 0), Point2d(1.0, 0), Point2d(1, 0.5), Point2d(0.5, 1), Point2d(0.25, 0),
+                          Point2d(1, 1)], actual_positions)
+
+    def test_sample_is_equal_to_call(self):
+        times = [1.0, 2.0, 3.0]
+        vehicle_states = [VehicleState(position=Point2d(0, 0), velocity=Point2d(1, 0), acceleration=Point2d(1, 2),
+                                       heading=0.5, vehicle_id=3),
+                          VehicleState(position=Point2d(1, 0), velocity=Point2d(0, 1), heading=1.0, vehicle_id=3),
+                          VehicleState(position=Point2d(1, 1), velocity=Point2d(-1, 0), heading=1.5, vehicle_id=3)]
+        vehicle_trajectory = VehicleTrajectory(times, vehicle_states)
+        sample_times = [0.0, 1.0, 1.5, 2.0, 2.75, 3.0, 4.0]
+
+        actual_sample = vehicle_trajectory.sample(sample_times)
+
+        for i, t in enumerate(sample_times):
+            expected_state = vehicle_trajectory(t)
+            self.assertEqual([expected_state.position.x, expected_state.position.y], list(actual_sample.position[i]))
+            self.assertEqual([expected_state.velocity.x, expected_state.velocity.y], list(actual_sample.velocity[i]))
+            self.assertEqual([expected_state.acceleration.x, expected_state.acceleration.y],
+                             list(actual_sample.acceleration[i]))
+            self.assertEqual(expected_state.heading, actual_sample.heading[i])
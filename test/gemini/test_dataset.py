@@ -0,0 +1,242 @@
+import math
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+import torch
+
+from gemini.dataset import TrajectoryDatabase, to_sampling_time_state, roll_out, roll_out_batch, evaluate_actions
+
+
+def generate_tracks():
+    rows = []
+    for member, first_time, number_of_rows in [(7, 0.0, 10), (3, 0.2, 4), (5, 2.0, 5), (9, 0.1, 3)]:
+        for i in range(number_of_rows):
+            time = round(100 + first_time + 0.1 * i, 2)
+            rows.append((member, time, float(member + i), float(2 * i)))
+    tracks = pd.DataFrame(rows, columns=['member', 'Timestamps_UNIX', 'X', 'Y'])
+    return tracks.sort_values('Timestamps_UNIX', kind='stable').reset_index(drop=True)
+
+
+class TestTrajectoryDatabase(TestCase):
+
+    def test_get_trajectories_returns_only_overlapping_members(self):
+        database = TrajectoryDatabase(generate_tracks())
+
+        target, interactions = database.get_trajectories(7)
+
+        self.assertEqual([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7], list(target['Timestamps_UNIX']))
+        self.assertEqual([[9], [3]], [list(interaction['member'].unique()) for interaction in interactions])
+        self.assertEqual([0.2, 0.3], list(interactions[1]['Timestamps_UNIX']))
+
+    def test_get_trajectories_with_unknown_member(self):
+        database = TrajectoryDatabase(generate_tracks())
+
+        with self.assertRaises(ValueError):
+            database.get_trajectories(4)
+
+    def test_get_trajectories_add_dynamics(self):
+        database = TrajectoryDatabase(generate_tracks())
+
+        target, _ = database.get_trajectories(3)
+
+        self.assertEqual([10.0, 10.0], [round(dx, 9) for dx in target['dX']])
+        self.assertEqual([20.0, 20.0], [round(dy, 9) for dy in target['dY']])
+        self.assertEqual([0.0, 0.0], [round(ddx, 9) for ddx in target['ddX']])
+
+    def test_get_vehicle_trajectory(self):
+        database = TrajectoryDatabase(generate_tracks())
+
+        target, interactions = database.get_vehicle_trajectory(3)
+
+        self.assertEqual([0.0, 0.1], list(target.times))
+        self.assertEqual(1, len(interactions))
+        initial_state = target.vehicle_states[0]
+        self.assertEqual([3.0, 0.0], [initial_state.position.x, initial_state.position.y])
+        self.assertAlmostEqual(math.atan2(20, 10), initial_state.heading)
+
+    def test_get_state_matrix(self):
+        database = TrajectoryDatabase(generate_tracks())
+
+        states = database.get_state_matrix(7, 1)
+
+        self.assertEqual((8, 12), states.shape)
+        # at time 0.0 only vehicle 7 is moving: the nearest vehicle has zero state
+        self.assertEqual([0.0] * 6, states[0, :6].tolist())
+        self.assertEqual([7.0, 0.0], states[0, 6:8].tolist())
+        # at time 0.2 vehicle 3 is the nearest one
+        self.assertEqual([3.0, 0.0], states[2, :2].tolist())
+
+    def test_get_generator(self):
+        database = TrajectoryDatabase(generate_tracks())
+
+        states = list(database.get_generator(7, 1))
+
+        # rows of the former implementation, which evaluated the states one timestamp at a time
+        expected_states = [[0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 7.0, 0.0, 10.0, 20.0, 0.0, 0.0],
+                           [9.0, 0.0, 10.0, 20.0, 0.0, 0.0, 8.0, 2.0, 10.0, 20.0, 0.0, 0.0],
+                           [3.0, 0.0, 10.0, 20.0, 0.0, 0.0, 9.0, 4.0, 10.0, 20.0, 0.0, 0.0],
+                           [4.0, 2.0, 10.0, 20.0, 0.0, 0.0, 10.0, 6.0, 10.0, 20.0, 0.0, 0.0],
+                           [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 11.0, 8.0, 10.0, 20.0, 0.0, 0.0],
+                           [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 12.0, 10.0, 10.0, 20.0, 0.0, 0.0],
+                           [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 13.0, 12.0, 10.0, 20.0, 0.0, 0.0],
+                           [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 14.0, 14.0, 10.0, 20.0, 0.0, 0.0]]
+        self.assertEqual(expected_states, [[round(value, 9) for value in state] for state in states])
+
+
+class TestTrajectoryDatabaseCache(TestCase):
+
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.folder.name, 'tracks.csv')
+        self.tracks = generate_tracks()
+        self.tracks['label'] = ['car' if member % 2 else 'truck' for member in self.tracks['member']]
+        self.tracks.to_csv(self.csv_path, index=False)
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def test_from_csv_stores_cache(self):
+        database = TrajectoryDatabase.from_csv(self.csv_path)
+
+        self.assertTrue(os.path.exists(os.path.join(self.folder.name, 'tracks.npz')))
+        with patch('pandas.read_csv') as read_csv:
+            cached_database = TrajectoryDatabase.from_csv(self.csv_path)
+            read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(database.trajectories, cached_database.trajectories)
+        self.assertEqual(database.get_state_matrix(7, 2).tolist(), cached_database.get_state_matrix(7, 2).tolist())
+        self.assertEqual([[9], [3]], [list(interaction['member'].unique()) for interaction in
+                                      cached_database.get_trajectories(7)[1]])
+
+    def test_from_csv_invalidates_cache(self):
+        TrajectoryDatabase.from_csv(self.csv_path)
+        self.tracks.loc[0, 'X'] = 100.0
+        self.tracks.to_csv(self.csv_path, index=False)
+
+        database = TrajectoryDatabase.from_csv(self.csv_path)
+
+        self.assertIn(100.0, database.trajectories['X'].tolist())
+
+    def test_from_csv_checks_content_of_touched_file(self):
+        TrajectoryDatabase.from_csv(self.csv_path)
+        os.utime(self.csv_path, (0, 0))
+
+        with patch('pandas.read_csv') as read_csv:
+            TrajectoryDatabase.from_csv(self.csv_path)
+            read_csv.assert_not_called()
+
+    def test_from_csv_with_corrupt_cache(self):
+        database = TrajectoryDatabase.from_csv(self.csv_path)
+        cache_path = os.path.join(self.folder.name, 'tracks.npz')
+        with open(cache_path, 'r+b') as file:
+            file.truncate(100)
+
+        corrupt_cache_database = TrajectoryDatabase.from_csv(self.csv_path)
+
+        pd.testing.assert_frame_equal(database.trajectories, corrupt_cache_database.trajectories)
+        with patch('pandas.read_csv') as read_csv:
+            TrajectoryDatabase.from_csv(self.csv_path)  # the cache has been written again
+            read_csv.assert_not_called()
+
+    def test_from_csv_without_writable_cache(self):
+        with patch('numpy.savez', side_effect=OSError('No space left on device')):
+            database = TrajectoryDatabase.from_csv(self.csv_path)
+
+        self.assertEqual([3, 5, 7, 9], database.get_trajectory_ids())
+        self.assertEqual(['tracks.csv'], os.listdir(self.folder.name))
+
+    def test_get_source_tracks(self):
+        TrajectoryDatabase.from_csv(self.csv_path)
+
+        source_tracks = TrajectoryDatabase.from_csv(self.csv_path).get_source_tracks()
+
+        pd.testing.assert_frame_equal(pd.read_csv(self.csv_path), source_tracks)
+
+    def test_get_trajectory_ids(self):
+        self.assertEqual([3, 5, 7, 9], TrajectoryDatabase.from_csv(self.csv_path).get_trajectory_ids())
+
+
+class LinearNetwork(torch.nn.Module):
+
+    def forward(self, x):
+        return x[:, :2] + 1, None
+
+
+class FirstRowNetwork(torch.nn.Module):
+    """
+    Network which evaluates only the first state of a batch (as the executable of VariationalGeneratorEncoded)
+    """
+
+    def forward(self, x):
+        return (x[:1, :2] * 2 + x[:1, 6:8]).reshape(1, 2), None
+
+
+def baseline_roll_out(network, trajectories):
+    # one forward pass for each state, as roll_out before the batched version
+    current_state = trajectories[0][-6:-4]
+    rollout = [current_state]
+    for state in trajectories:
+        with torch.no_grad():
+            action, _ = network(torch.Tensor(state).reshape(1, -1))
+            delta_position = action.tolist()[0]
+            current_state = rollout[-1]
+            rollout.append([current_state[0] + delta_position[0], current_state[1] + delta_position[1]])
+    return rollout
+
+
+class TestRollOut(TestCase):
+
+    def test_to_sampling_time_state(self):
+        state = [1, 2, 3, 4, 5, 6, 1, 2, 3, 4, 5, 6]
+
+        actual_state = to_sampling_time_state(state, 0.5)
+
+        self.assertEqual([1, 2, 1.5, 2, 2.5, 3, 1, 2, 1.5, 2, 2.5, 3], actual_state.tolist())
+
+    def test_roll_out(self):
+        states = [[0, 0, 0, 0, 0, 0, 10, 20, 0, 0, 0, 0], [1, 2, 0, 0, 0, 0, 10, 20, 0, 0, 0, 0]]
+
+        actual_rollout = roll_out(LinearNetwork(), states)
+
+        self.assertEqual([[10, 20], [11, 21], [13, 24]], actual_rollout)
+
+    def test_roll_out_batch(self):
+        first_states = [[0, 0, 0, 0, 0, 0, 10, 20, 0, 0, 0, 0]]
+        second_states = [[1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0], [2, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]
+
+        actual_rollouts = roll_out_batch(LinearNetwork(), [first_states, second_states])
+
+        self.assertEqual([[10, 20], [11, 21]], actual_rollouts[0].tolist())
+        self.assertEqual([[0, 0], [2, 2], [5, 5]], actual_rollouts[1].tolist())
+
+    def test_roll_out_is_equal_to_baseline(self):
+        states = [[0.5, 0.25, 0, 0, 0, 0, 10, 20, 0, 0, 0, 0], [1, 2, 0, 0, 0, 0, 11, 21, 0, 0, 0, 0],
+                  [-1, 3, 0, 0, 0, 0, 12, 23, 0, 0, 0, 0]]
+
+        for network in (LinearNetwork(), FirstRowNetwork()):
+            actual_rollout = roll_out(network, states)
+
+            expected_rollout = baseline_roll_out(network, states)
+            self.assertEqual(len(expected_rollout), len(actual_rollout))
+            for expected_position, actual_position in zip(expected_rollout, actual_rollout):
+                self.assertAlmostEqual(expected_position[0], actual_position[0], places=5)
+                self.assertAlmostEqual(expected_position[1], actual_position[1], places=5)
+
+    def test_roll_out_batch_with_network_evaluating_first_row(self):
+        first_states = [[0, 0, 0, 0, 0, 0, 10, 20, 0, 0, 0, 0]]
+        second_states = [[1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0], [2, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]]
+
+        actual_rollouts = roll_out_batch(FirstRowNetwork(), [first_states, second_states])
+
+        self.assertEqual([[10, 20], [20, 40]], actual_rollouts[0].tolist())
+        self.assertEqual([[0, 0], [2, 2], [6, 6]], actual_rollouts[1].tolist())
+
+    def test_evaluate_actions_with_wrong_number_of_actions(self):
+        class TwoRowsNetwork(torch.nn.Module):
+            def forward(self, x):
+                return x[:2, :2], None
+
+        with self.assertRaises(ValueError):
+            evaluate_actions(TwoRowsNetwork(), torch.zeros((3, 12)))
@@ -0,0 +1,66 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from gemini.common import VehicleTrajectory
+from gemini.scenario import ScenarioCache, ScenarioModelGenerator, ScenarioModelObject
+
+
+def generate_scenario_model_object(agent_id: int, x: float, port_number: int) -> ScenarioModelObject:
+    trajectory = VehicleTrajectory.from_arrays(np.array([0., 0.1]), np.array([[x, 1.], [x + 1, 1.]]),
+                                               np.zeros((2, 2)), np.zeros((2, 2)), np.zeros(2), agent_id)
+    return ScenarioModelObject(agent_id, f"vehicle{agent_id}", trajectory, port_number)
+
+
+def generate_scenario_model_generator(x: float = 0., port_number: int = 53901) -> ScenarioModelGenerator:
+    return ScenarioModelGenerator(generate_scenario_model_object(1, x, port_number),
+                                  [generate_scenario_model_object(2, 5., port_number + 1)])
+
+
+class TestScenarioCache(TestCase):
+
+    def setUp(self) -> None:
+        self.resources = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.resources.name, 'xosc'))
+        self.environment = patch.dict(os.environ, {'ESMINI_RESOURCES_FOLDER': self.resources.name})
+        self.environment.start()
+
+    def tearDown(self) -> None:
+        self.environment.stop()
+        self.resources.cleanup()
+
+    def test_get_scenario_key(self):
+        key = generate_scenario_model_generator().get_scenario_key()
+
+        self.assertEqual(key, generate_scenario_model_generator().get_scenario_key())
+        self.assertNotEqual(key, generate_scenario_model_generator(x=0.5).get_scenario_key())
+        self.assertNotEqual(key, generate_scenario_model_generator(port_number=54000).get_scenario_key())
+
+    def test_get_scenario_name(self):
+        scenario_cache = ScenarioCache()
+        scenario_model_generator = generate_scenario_model_generator()
+
+        scenario_name = scenario_cache.get_scenario_name(scenario_model_generator)
+        with patch.object(ScenarioModelGenerator, 'build_scenario') as build_scenario:
+            self.assertEqual(scenario_name, scenario_cache.get_scenario_name(scenario_model_generator))
+            build_scenario.assert_not_called()
+
+        with open(os.path.join(self.resources.name, 'xosc', scenario_name)) as file:
+            self.assertIn('vehicle2', file.read())
+        self.assertEqual((1, 1), (scenario_cache.hits, scenario_cache.misses))
+
+    def test_eviction(self):
+        scenario_cache = ScenarioCache(max_entries=2)
+
+        def get_path(scenario_name):
+            return os.path.join(self.resources.name, 'xosc', scenario_name)
+
+        scenario_names = [scenario_cache.get_scenario_name(generate_scenario_model_generator(x=x)) for x in range(2)]
+        os.utime(get_path(scenario_names[1]), (0, 0))  # least recently used
+        scenario_names.append(scenario_cache.get_scenario_name(generate_scenario_model_generator(x=2)))
+
+        self.assertEqual([True, False, True],
+                         [os.path.exists(get_path(scenario_name)) for scenario_name in scenario_names])
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from gemini.scenario_farm import ScenarioFarm
+from gemini.simulation import SimulationTrajectory
+from test.gemini.test_dataset import generate_tracks
+
+
+def fake_simulate(scenario_model_generator, scenario_cache, agents_factory, time_step):
+    simulation_trajectory = SimulationTrajectory()
+    simulation_trajectory.ports = [scenario_object.get_port_number() for scenario_object in
+                                   [scenario_model_generator.target] + scenario_model_generator.obstacles]
+    return simulation_trajectory
+
+
+class TestScenarioFarm(TestCase):
+
+    def test_run(self):
+        scenario_farm = ScenarioFarm(generate_tracks(), max_workers=2, base_port=60000, ports_per_worker=10,
+                                     simulate=fake_simulate)
+
+        results = scenario_farm.run([7, 3, 5])
+
+        self.assertEqual({3, 5, 7}, set(results.keys()))
+        for simulation_trajectory in results.values():
+            base_port = simulation_trajectory.ports[0]
+            self.assertIn(base_port, (60000, 60010))
+            self.assertEqual(list(range(base_port, base_port + len(simulation_trajectory.ports))),
+                             simulation_trajectory.ports)
+        self.assertEqual(3, len(results[7].ports))
+
+    def test_ports_per_worker_by_default(self):
+        scenario_farm = ScenarioFarm(generate_tracks(), max_workers=32, base_port=53901)
+
+        self.assertEqual(363, scenario_farm.ports_per_worker)
+        self.assertLessEqual(53901 + 32 * scenario_farm.ports_per_worker - 1, 65535)
+
+    def test_ports_out_of_range(self):
+        with self.assertRaises(ValueError):
+            ScenarioFarm(generate_tracks(), max_workers=13, base_port=53901, ports_per_worker=1000)
+        with self.assertRaises(ValueError):
+            ScenarioFarm(generate_tracks(), max_workers=20000, base_port=53901)
@@ -1,8 +1,9 @@
+import pickle
 import tempfile
 from os import path
 from unittest import TestCase
 
-from gemini.common import VehicleState
+from gemini.common import VehicleState, Point2d
 from gemini.simulation import SimulationTrajectory
 
 
@@ -24,7 +25,7 @@ class TestSimulationTrajectory(TestCase):
         trajectory.add_state((0.23, [vehicle_state]))
 
         self.assertEqual([0.23], trajectory.time)
-        self.assertEqual([vehicle_state], trajectory.storage[1])
+        self.assertEqual([vehicle_state], list(trajectory.get_trajectory(1).vehicle_states))
 
     def test_add_many_state(self):
         trajectory = SimulationTrajectory()
@@ -37,8 +38,10 @@ class TestSimulationTrajectory(TestCase):
         trajectory.add_state((0.29, [third_vehicle]))
 
         self.assertEqual([0.23, 0.24, 0.29], trajectory.time)
-        self.assertEqual([first_vehicle, third_vehicle], trajectory.storage[1])
-        self.assertEqual([second_vehicle], trajectory.storage[4])
+        self.assertEqual([first_vehicle, third_vehicle], list(trajectory.get_trajectory(1).vehicle_states))
+        self.assertEqual([second_vehicle], list(trajectory.get_trajectory(4).vehicle_states))
+        self.assertEqual([0.23, 0.29], list(trajectory.get_trajectory(1).times))
+        self.assertEqual([0.24], list(trajectory.get_trajectory(4).times))
 
     def test_get_vehicle_trajectories_with_empty_storage(self):
         trajectory = SimulationTrajectory()
@@ -58,8 +61,8 @@ class TestSimulationTrajectory(TestCase):
 
         actual_trajectories = trajectory.get_vehicle_trajectories()
 
-        self.assertEqual([0.23, 0.24, 0.29], actual_trajectories[0].times)
-        self.assertEqual([first_vehicle, second_vehicle, third_vehicle], actual_trajectories[0].vehicle_states)
+        self.assertEqual([0.23, 0.24, 0.29], list(actual_trajectories[0].times))
+        self.assertEqual([first_vehicle, second_vehicle, third_vehicle], list(actual_trajectories[0].vehicle_states))
         self.assertEqual(1, len(actual_trajectories))
 
     def test_get_vehicle_trajectories_with_many_storage_trajectory(self):
@@ -73,8 +76,31 @@ class TestSimulationTrajectory(TestCase):
 
         actual_trajectories = trajectory.get_vehicle_trajectories()
 
-        self.assertEqual([0.23, 0.24, ], actual_trajectories[0].times)
-        self.assertEqual([first_vehicle, second_vehicle], actual_trajectories[0].vehicle_states)
-        self.assertEqual([0.23, 0.24], actual_trajectories[1].times)
-        self.assertEqual([third_vehicle, fourth_vehicle], actual_trajectories[1].vehicle_states)
+        self.assertEqual([0.23, 0.24, ], list(actual_trajectories[0].times))
+        self.assertEqual([first_vehicle, third_vehicle], list(actual_trajectories[0].vehicle_states))
+        self.assertEqual([0.23, 0.24], list(actual_trajectories[1].times))
+        self.assertEqual([second_vehicle, fourth_vehicle], list(actual_trajectories[1].vehicle_states))
         self.assertEqual(2, len(actual_trajectories))
+
+    def test_add_many_state_grows_storage(self):
+        trajectory = SimulationTrajectory()
+
+        for i in range(1000):
+            trajectory.add_state((0.1 * i, [VehicleState(position=Point2d(i, 2 * i), vehicle_id=1)]))
+
+        actual_trajectory = trajectory.get_trajectory(1)
+        self.assertEqual(1000, len(actual_trajectory.vehicle_states))
+        self.assertEqual(Point2d(999, 1998), actual_trajectory.vehicle_states[-1].position)
+        self.assertEqual(1, actual_trajectory.vehicle_states[-1].get_id())
+
+    def test_store_dict(self):
+        trajectory = SimulationTrajectory()
+        trajectory.add_state((0.23, [VehicleState(Point2d(1, 2), Point2d(3, 4), Point2d(5, 6), 7, vehicle_id=1)]))
+
+        with tempfile.TemporaryFile() as file:
+            trajectory.store_dict(file)
+            file.seek(0)
+            actual_dict = pickle.load(file)
+
+        self.assertEqual([0.23], actual_dict['time'])
+        self.assertEqual([[1, 2, 3, 4, 5, 6]], actual_dict[1].tolist())
@@ -0,0 +1,144 @@
+import gc
+import tempfile
+import weakref
+from os import path
+from unittest import TestCase
+
+import numpy as np
+
+from gemini.common import VehicleState, Point2d
+from gemini.simulation import SimulationTrajectory
+from gemini.trajectory_storage import TrajectoryStreamWriter, read_trajectory_stream, STREAM_RECORD, \
+    TrajectoryArchive
+
+
+class TestTrajectoryStream(TestCase):
+
+    def test_write_and_read(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            first_vehicle = VehicleState(Point2d(1, 2), Point2d(3, 4), Point2d(5, 6), 0.5, vehicle_id=1)
+            second_vehicle = VehicleState(Point2d(7, 8), vehicle_id=4)
+            third_vehicle = VehicleState(Point2d(2, 2), Point2d(1, 1), vehicle_id=1)
+
+            with TrajectoryStreamWriter(file_path, buffer_size=2) as writer:
+                writer.add_state((0.23, [first_vehicle, second_vehicle]))
+                writer.add_state((0.24, [third_vehicle]))
+            actual_trajectory = read_trajectory_stream(file_path)
+
+            self.assertEqual([0.23, 0.24], actual_trajectory.time)
+            self.assertEqual([1, 4], list(actual_trajectory.storage.keys()))
+            self.assertEqual([first_vehicle, third_vehicle],
+                             list(actual_trajectory.get_trajectory(1).vehicle_states))
+            self.assertEqual([second_vehicle], list(actual_trajectory.get_trajectory(4).vehicle_states))
+
+    def test_read_without_close(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            writer = TrajectoryStreamWriter(file_path, buffer_size=1, flush_interval=None)
+            writer.add_state((0.23, [VehicleState(vehicle_id=1)]))
+            writer.add_state((0.24, [VehicleState(vehicle_id=1)]))  # flush the first frame only
+
+            actual_trajectory = read_trajectory_stream(file_path)
+
+            self.assertEqual([0.23], actual_trajectory.time)
+            writer.close()
+
+    def test_write_and_read_empty_frame(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            with TrajectoryStreamWriter(file_path) as writer:
+                writer.add_state((0.23, [VehicleState(vehicle_id=1)]))
+                writer.add_state((0.24, []))
+                writer.add_state((0.25, [VehicleState(vehicle_id=1)]))
+                writer.add_state((0.26, []))
+
+            actual_trajectory = read_trajectory_stream(file_path)
+
+            self.assertEqual([0.23, 0.24, 0.25, 0.26], actual_trajectory.time)
+            self.assertEqual([1], list(actual_trajectory.storage.keys()))
+            self.assertEqual([0.23, 0.25], list(actual_trajectory.get_trajectory(1).times))
+
+    def test_write_and_read_vehicle_with_default_id(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            vehicle = VehicleState(Point2d(1, 2))  # vehicle_id -1
+            with TrajectoryStreamWriter(file_path) as writer:
+                writer.add_state((0.23, [vehicle]))
+                writer.add_state((0.24, []))
+
+            actual_trajectory = read_trajectory_stream(file_path)
+
+            self.assertEqual([0.23, 0.24], actual_trajectory.time)
+            self.assertEqual([vehicle], list(actual_trajectory.get_trajectory(-1).vehicle_states))
+
+    def test_writer_is_not_kept_alive(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            writer = TrajectoryStreamWriter(file_path, flush_interval=None)
+            writer.add_state((0.23, [VehicleState(vehicle_id=1)]))
+            writer_reference = weakref.ref(writer)
+
+            del writer
+            gc.collect()
+
+            self.assertIsNone(writer_reference())
+            self.assertEqual([0.23], read_trajectory_stream(file_path).time)
+
+    def test_flush_interval(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            writer = TrajectoryStreamWriter(file_path, flush_interval=0)
+            writer.add_state((0.23, [VehicleState(vehicle_id=1)]))
+            writer.add_state((0.24, [VehicleState(vehicle_id=1)]))
+
+            actual_trajectory = read_trajectory_stream(file_path)
+
+            self.assertEqual([0.23, 0.24], actual_trajectory.time)
+            writer.close()
+
+    def test_read_drops_truncated_record(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.stream')
+            with TrajectoryStreamWriter(file_path) as writer:
+                writer.add_state((0.23, [VehicleState(vehicle_id=1)]))
+                writer.add_state((0.24, [VehicleState(vehicle_id=1)]))
+            with open(file_path, 'r+b') as file:
+                file.truncate(path.getsize(file_path) - STREAM_RECORD.itemsize // 2)
+
+            actual_trajectory = read_trajectory_stream(file_path)
+
+            self.assertEqual([0.23], list(actual_trajectory.get_trajectory(1).times))
+
+
+class TestTrajectoryArchive(TestCase):
+
+    def test_store_and_open(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.archive')
+            first_vehicle = VehicleState(Point2d(1, 2), Point2d(3, 4), Point2d(5, 6), 0.5, vehicle_id=1)
+            second_vehicle = VehicleState(Point2d(7, 8), vehicle_id=4)
+            third_vehicle = VehicleState(Point2d(2, 2), Point2d(1, 1), vehicle_id=1)
+            trajectory = SimulationTrajectory()
+            trajectory.add_state((0.23, [first_vehicle, second_vehicle]))
+            trajectory.add_state((0.24, [third_vehicle]))
+
+            trajectory.store_archive(file_path)
+            archive = TrajectoryArchive(file_path)
+
+            self.assertEqual([0.23, 0.24], list(archive.time))
+            self.assertEqual([1, 4], archive.get_vehicle_ids())
+            self.assertEqual([0.23, 0.24], list(archive.get_trajectory(1).times))
+            self.assertEqual([first_vehicle, third_vehicle], list(archive.get_trajectory(1).vehicle_states))
+            self.assertEqual([second_vehicle], list(archive.get_trajectory(4).vehicle_states))
+            self.assertIsInstance(archive.get_states(1).base, np.memmap)
+
+    def test_store_and_open_empty_trajectory(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = path.join(temp_dir, 'record.archive')
+
+            SimulationTrajectory().store_archive(file_path)
+            archive = TrajectoryArchive(file_path)
+
+            self.assertEqual([], list(archive.time))
+            self.assertEqual([], archive.get_vehicle_trajectories())